@@ -0,0 +1,59 @@
+"""Weekly and monthly trends from a user's daily tally history.
+
+Reads the user's days with history.day_history (Parquet rollups plus the
+recent days still in the store) and aggregates them per week or month:
+average energy- and nutrient-dense servings on logged days, and the share
+of logged days that reached `servings_goal`.
+
+Results are cached per (user, range, period, goal) and the user's store
+version. Every write for the user, to any day (today's tally, an import
+of old logs), changes the version, so a cached table is never stale.
+Compaction moves days without changing them or the version.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+import history
+
+PERIODS = {"week": "W", "month": "M"}
+SUMMARY_COLUMNS = [
+    "period", "days_logged", "avg_energy", "avg_nutrient", "energy_goal_rate", "nutrient_goal_rate",
+]
+
+
+def summarize(days, goal, period="week"):
+    """Aggregate daily rows (day, energy_servings, nutrient_servings) per week or month."""
+    if days.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    dates = pd.to_datetime(days["day"]).to_numpy()
+    energy = days["energy_servings"].to_numpy(dtype=float)
+    nutrient = days["nutrient_servings"].to_numpy(dtype=float)
+
+    starts = pd.DatetimeIndex(dates).to_period(PERIODS[period]).start_time
+    keys, group = np.unique(starts.to_numpy(), return_inverse=True)
+    counts = np.bincount(group)
+
+    def mean(values):
+        return np.bincount(group, weights=values) / counts
+
+    return pd.DataFrame({
+        "period": keys,
+        "days_logged": counts,
+        "avg_energy": mean(energy),
+        "avg_nutrient": mean(nutrient),
+        "energy_goal_rate": mean((energy >= goal).astype(float)),
+        "nutrient_goal_rate": mean((nutrient >= goal).astype(float)),
+    })
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_summary(store, user_id, start, end, goal, period, history_dir, version):
+    days = history.day_history(store, user_id, start, end, history_dir)
+    return summarize(days, goal, period)
+
+
+def history_summary(store, user_id, start, end, goal, period="week", history_dir=history.HISTORY_DIR):
+    """Per-period trend table for one user between two ISO dates (inclusive). Don't mutate it."""
+    return _cached_summary(store, user_id, start, end, goal, period, history_dir, store.version(user_id))
@@ -1,200 +1,75 @@
 import streamlit as st
-import pandas as pd
 import datetime
-import re
+import uuid
 
-# ------------------- Load Food Data -------------------
-@st.cache_data
-def load_data():
-    foods_df = pd.read_csv("2017-2018 FNDDS At A Glance - Foods and Beverages.csv", skiprows=1)
-    nutrients_df = pd.read_csv("2017-2018 FNDDS At A Glance - FNDDS Nutrient Values.csv", skiprows=1)
-    portions_df = pd.read_csv("2017-2018 FNDDS At A Glance - Portions and Weights.csv", skiprows=1)
-
-    # Normalize column names
-    for df in [foods_df, nutrients_df, portions_df]:
-        df.columns = (
-            df.columns.str.strip()
-            .str.lower()
-            .str.replace(" ", "_")
-            .str.replace(r"[()]", "", regex=True)
-        )
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import analytics
+import engine
+import foodpicker
+import fped
+import mealplan
+import meals
+import nutrients
+import servingcards
+import servingtable
+import storage
+import tallyactions
+import tallyservice
+
+# ------------------- Tally Service -------------------
+@st.cache_resource
+def get_tally():
+    # one tally service (and store writer thread) per server process
+    return tallyservice.TallyService(storage.open_store())
+
+
+tally = get_tally()
 
-    return foods_df, nutrients_df, portions_df
+# the user id lives in the URL so a reconnect (or another server) finds the same log
+if "user" not in st.query_params:
+    st.query_params["user"] = uuid.uuid4().hex
+user_id = st.query_params["user"]
 
+ctx = get_script_run_ctx()
+session_id = ctx.session_id if ctx else None
+# seconds between checks for a change made on another device or server
+LIVE_SECONDS = 2
 
-# Unpack correctly
-foods_df, nutrients_df, portions_df = load_data()
+# every tally change goes through these widget callbacks (see tallyactions.py)
+actions = tallyactions.TallyActions(tally, user_id, session_id, st.session_state)
+
+
+def count_run(part):
+    # runs of the script body and of each panel in this session, by fragment key;
+    # tests/test_app_executions.py checks that an action costs one run
+    runs = st.session_state.setdefault("runs", {})
+    runs[part] = runs.get(part, 0) + 1
+
+
+count_run("script")
 
 # ------------------- Initialize State -------------------
-if "energy_servings" not in st.session_state:
-    st.session_state.energy_servings = 0.0
-if "nutrient_servings" not in st.session_state:
-    st.session_state.nutrient_servings = 0.0
-if "date" not in st.session_state:
-    st.session_state.date = datetime.date.today()
-if "selected_foods" not in st.session_state:
-    st.session_state.selected_foods = []
+actions.sync()
+
+
+@st.fragment(key="live", run_every=LIVE_SECONDS)
+def live_updates():
+    count_run("live")
+    # another device or server changed this user's tally since the last sync: show it
+    if tally.version(user_id) != st.session_state.tally_version:
+        st.rerun()
+
+
+live_updates()
 if "clear_search" not in st.session_state:
     st.session_state.clear_search = False
 if "food_search" not in st.session_state:
     st.session_state.food_search = ""
-if "food_choice" not in st.session_state:
-    st.session_state.food_choice = "-- choose a food --"
 if "amt_choice" not in st.session_state:
     st.session_state.amt_choice = 1
-
-# reset daily
-if st.session_state.date != datetime.date.today():
-    st.session_state.energy_servings = 0.0
-    st.session_state.nutrient_servings = 0.0
-    st.session_state.date = datetime.date.today()
-    st.session_state.selected_foods = []
-
-# ------------------- Serving Picker -------------------
-COMMON_UNITS = [
-    "cup", "cups", "tbsp", "tablespoon", "tablespoons",
-    "tsp", "teaspoon", "teaspoons", "slice", "slices",
-    "piece", "pieces", "can", "bottle", "link",
-    "patty", "bar", "cookie", "egg", "loaf",
-    "bun", "muffin", "cake", "donut", "taco", "sandwich",
-    "small", "medium", "large"
-]
-
-BAD_PHRASES = [
-    "guideline amount",
-    "as consumed",
-    "recipe",
-    "per 100",
-    "added",
-    "on cereal",
-    "with milk",
-    "per cup of hot cereal",
-    "100 calorie",
-    "package",
-    "serving", 
-    "container"
-]
-
-def _fmt_decimal(x):
-    # format numbers like 1.0 -> "1", 0.25 -> "0.25", 1.25 -> "1.25"
-    if float(x).is_integer():
-        return str(int(x))
-    return f"{x:.2f}".rstrip("0").rstrip(".")
-
-def pick_fractional_serving(food_row, target_cal):
-    kcal_row = nutrients_df[nutrients_df["food_code"] == food_row["food_code"]]
-    if kcal_row.empty:
-        # no kcal info — fallback
-        return 1, "g", 0, 0
-    kcal_per_100g = kcal_row.iloc[0]["energy_kcal"]
-    if pd.isna(kcal_per_100g) or kcal_per_100g == 0:
-        return 1, "g", 0, 0
-    kcal_per_g = kcal_per_100g / 100.0
-
-    # gather usable portions (common named units, excluding bad phrases)
-    portion_rows = portions_df[portions_df["food_code"] == food_row["food_code"]]
-    usable_portions = []
-    for _, row in portion_rows.iterrows():
-        desc = str(row.get("portion_description", "")).lower()
-        if any(u in desc for u in COMMON_UNITS) and not any(bad in desc for bad in BAD_PHRASES):
-            usable_portions.append(row)
-
-    # if no named unit portions, fallback to grams sized to hit target_cal
-    if not usable_portions:
-        grams_for_target = max(1, round(target_cal / kcal_per_g))
-        kcal_for_target = round(grams_for_target * kcal_per_g)
-        return grams_for_target, "g", grams_for_target, kcal_for_target
-
-    # test 0.25-step fractions from 0.25 to 4.0 for all usable portions, pick the best match
-    best = None
-    for _, row in pd.DataFrame(usable_portions).iterrows():
-        part_grams = row["portion_weight_g"]
-        kcal_per_portion = part_grams * kcal_per_g
-        # check 0.25..4.0
-        for f in [i * 0.25 for i in range(1, 17)]:
-            kcal_est = f * kcal_per_portion
-            diff = abs(kcal_est - target_cal)
-            if best is None or diff < best[0]:
-                best = (diff, row, f, kcal_per_portion, part_grams, kcal_est)
-
-    # Defensive fallback if nothing found
-    if best is None:
-        grams_for_target = max(1, round(target_cal / kcal_per_g))
-        kcal_for_target = round(grams_for_target * kcal_per_g)
-        return grams_for_target, "g", grams_for_target, kcal_for_target
-
-    _, chosen_row, fraction, kcal_per_portion, part_grams, kcal_est = best
-
-    # compute exact fraction that would match the target for this portion
-    exact_fraction = target_cal / kcal_per_portion if kcal_per_portion > 0 else float("inf")
-
-    # If exact_fraction is < 0.25 (i.e., we'd need less than 0.25 of this unit),
-    # or the resulting kcal for the chosen rounded fraction is outside the acceptable window (±20%),
-    # then FALL BACK to grams so one serving ~ target_cal.
-    approx_cal = round(kcal_est)
-    if exact_fraction < 0.25 or (approx_cal < 0.8 * target_cal or approx_cal > 1.2 * target_cal):
-        grams_for_target = max(1, round(target_cal / kcal_per_g))
-        kcal_for_target = round(grams_for_target * kcal_per_g)
-        return grams_for_target, "g", grams_for_target, kcal_for_target
-
-    # Otherwise format the chosen unit cleanly:
-    raw_desc = str(chosen_row.get("portion_description", "")).lower().strip()
-    # strip any leading numeric tokens like "1 ", "0.25 ", "one " etc.
-    unit = re.sub(r"^[\d\s\/\.]+", "", raw_desc).strip()
-    if unit == "":
-        unit = "unit"
-
-    grams_per_serving = max(1, round(fraction * part_grams))
-    kcal_per_serving = max(0, round(kcal_est))
-
-    # return: fraction (numeric amount of unit per one serving), unit (e.g. 'cup' or 'g'),
-    # grams for that one serving, kcal for that one serving
-    return fraction, unit, grams_per_serving, kcal_per_serving
-
-# --- category overrides ---
-# keys are substrings to look for in the food description (lowercased)
-# values are the forced density category
-CATEGORY_OVERRIDES = {
-    "juice": "Energy-dense",
-    "potato": "Energy-dense",
-    "potatoes": "Energy-dense",
-    "edamame": "Nutrient-dense",
-}
-
-def serving_for_food(food_row):
-    desc = str(food_row["main_food_description"]).lower()
-
-    # --- check overrides first ---
-    for keyword, forced_density in CATEGORY_OVERRIDES.items():
-        if keyword in desc:
-            if forced_density == "Energy-dense":
-                fraction, unit, grams, kcal = pick_fractional_serving(food_row, 100)
-            else:  # Nutrient-dense
-                fraction, unit, grams, kcal = pick_fractional_serving(food_row, 50)
-            return forced_density, fraction, unit, grams, kcal
-
-    # --- fallback: prefix-based classification ---
-    code = str(food_row["food_code"])
-    if code.startswith(("61", "63", "67", "72", "73", "74", "75", "76", "78")):
-        density = "Nutrient-dense"
-        fraction, unit, grams, kcal = pick_fractional_serving(food_row, 50)
-    else:
-        density = "Energy-dense"
-        fraction, unit, grams, kcal = pick_fractional_serving(food_row, 100)
-
-    return density, fraction, unit, grams, kcal
-
-
-# ------------------- Add Servings -------------------
-def add_serving(density_type, amount=1.0):
-    if density_type == "Energy-dense":
-        st.session_state.energy_servings += amount
-        if st.session_state.energy_servings < 0:
-            st.session_state.energy_servings = 0
-    else:
-        st.session_state.nutrient_servings += amount
-        if st.session_state.nutrient_servings < 0:
-            st.session_state.nutrient_servings = 0
+if "show_calories" not in st.session_state:
+    st.session_state.show_calories = False
 
 # --- CSS ---
 # ------------------- Styles -------------------
@@ -241,32 +116,144 @@ daily_cals = st.number_input(
     key="daily_calories"
 )
 
-servings_goal = round(daily_cals / 300 * 2)
+scale_servings = st.checkbox(
+    "Scale serving sizes to my calorie target",
+    key="scale_servings",
+    help="Keeps the number of servings the same for every calorie target and sizes each serving instead.",
+)
+serving_kcal = (
+    servingtable.personal_serving_kcal(daily_cals) if scale_servings else servingtable.SERVING_KCAL
+)
+# whole-catalog serving table for one pair of serving sizes, solved once per pair
+serving_table = engine.serving_table(serving_kcal)
 
-# ------------------- Show tally -------------------
-st.subheader("Tally")
-col1, col2 = st.columns(2)
+# one energy-dense plus one nutrient-dense serving per "pair"; 100 + 50 kcal by default
+servings_goal = round(daily_cals / (serving_kcal["Energy-dense"] + serving_kcal["Nutrient-dense"]))
 
-st.markdown(
-    f"🎯 Suggested daily target: <b>{servings_goal}</b> Energy-dense servings "
-    f"and <b>{servings_goal}</b> Nutrient-dense servings.",
-    unsafe_allow_html=True,
-)
-st.caption("👉 You can always eat more Nutrient-dense servings if you are hungry.")
+# ------------------- Show tally -------------------
+# Each panel below is a fragment: using a widget inside it reruns only that
+# panel, not the whole script. Changes to the tally rerun the tally panels.
+@st.fragment(key="tally")
+def tally_panel():
+    count_run("tally")
+    st.subheader("Tally")
+    col1, col2 = st.columns(2)
 
-with col1:
     st.markdown(
-        f"<div style='background-color:#FF6666; color:black; padding:10px; border-radius:8px;'>"
-        f"⚡ Energy-dense servings: <b>{st.session_state.energy_servings:.2f}</b></div>",
+        f"🎯 Suggested daily target: <b>{servings_goal}</b> Energy-dense servings "
+        f"and <b>{servings_goal}</b> Nutrient-dense servings.",
         unsafe_allow_html=True,
     )
-with col2:
-    st.markdown(
-        f"<div style='background-color:#66FF66; color:black; padding:10px; border-radius:8px;'>"
-        f"🌱 Nutrient-dense servings: <b>{st.session_state.nutrient_servings:.2f}</b></div>",
-        unsafe_allow_html=True,
+    st.caption(
+        f"👉 You can always eat more Nutrient-dense servings if you are hungry. "
+        f"One serving is {serving_kcal['Energy-dense']} kcal (⚡) or {serving_kcal['Nutrient-dense']} kcal (🌱)."
     )
 
+    with col1:
+        st.markdown(
+            f"<div style='background-color:#FF6666; color:black; padding:10px; border-radius:8px;'>"
+            f"⚡ Energy-dense servings: <b>{st.session_state.energy_servings:.2f}</b></div>",
+            unsafe_allow_html=True,
+        )
+    with col2:
+        st.markdown(
+            f"<div style='background-color:#66FF66; color:black; padding:10px; border-radius:8px;'>"
+            f"🌱 Nutrient-dense servings: <b>{st.session_state.nutrient_servings:.2f}</b></div>",
+            unsafe_allow_html=True,
+        )
+
+
+tally_panel()
+
+# ------------------- Food groups (FPED) and nutrients today -------------------
+@st.cache_resource
+def get_fped_matrix():
+    return fped.default_matrix()
+
+
+@st.cache_resource
+def get_nutrient_matrix():
+    return nutrients.default_matrix()
+
+
+@st.fragment(key="totals")
+def day_totals_panel():
+    count_run("totals")
+    if st.checkbox("Track food-group equivalents (FPED)", key="fped_mode"):
+        if "daily_fped" not in st.session_state:
+            st.session_state.daily_fped = nutrients.DailyTotals(get_fped_matrix())
+        st.session_state.daily_fped.sync(st.session_state.date, st.session_state.selected_foods)
+        group_cols = st.columns(3)
+        for i, (label, amount, unit) in enumerate(fped.group_totals(st.session_state.daily_fped)):
+            group_cols[i % 3].metric(label, f"{amount:.2f}", help=unit)
+
+    if "daily_nutrients" not in st.session_state:
+        st.session_state.daily_nutrients = nutrients.DailyTotals(get_nutrient_matrix())
+    # only foods logged since the last run are added to the running totals
+    st.session_state.daily_nutrients.sync(st.session_state.date, st.session_state.selected_foods)
+
+    with st.expander("🧪 Nutrients today"):
+        progress = st.session_state.daily_nutrients.progress(nutrients.targets_for(daily_cals))
+        for row in progress.itertuples():
+            label = f"{row.nutrient}: {row.amount:.1f} / {row.target:g} {row.unit}"
+            if row.limit:
+                label += " (limit)"
+            st.progress(min(1.0, row.percent), text=label)
+
+
+day_totals_panel()
+
+# ------------------- Serving cards -------------------
+def get_card_prefetcher():
+    # one card cache per session and serving table; the worker pool behind it is shared
+    prefetcher = st.session_state.get("card_prefetcher")
+    if prefetcher is None or prefetcher.serving_table is not serving_table:
+        prefetcher = st.session_state.card_prefetcher = servingcards.CardPrefetcher(serving_table)
+    return prefetcher
+
+
+# ------------------- Usual foods -------------------
+USUAL_FOODS = 6
+
+
+@st.fragment(key="favorites")
+def favorites_panel():
+    count_run("favorites")
+    # one tap logs a usual food again, at the amount last logged
+    usual = tally.frequent_foods(user_id, st.session_state.date.isoformat(), USUAL_FOODS)
+    if not usual:
+        return
+    st.subheader("Your usual foods")
+    cards = get_card_prefetcher()
+    cols = st.columns(2)
+    for i, food in enumerate(usual):
+        card = cards.card(food["code"])
+        amt = food["amt"]
+        grams = round(card.grams * amt)
+        total_units = card.units * amt
+        if card.unit == "g" or not float(total_units * 4).is_integer():
+            # "200 g" reads better than "7.99 slices"
+            portion = f"{grams} g"
+        else:
+            portion = f"{engine.fmt_decimal(total_units)} {card.unit if total_units == 1 else card.unit_plural}"
+        cols[i % 2].button(
+            f"➕ {food['name']}: {portion}",
+            key=f"usual_{food['code']}",
+            help=f"{engine.fmt_decimal(amt)} {card.density} servings, ≈{grams} g",
+            on_click=actions.add,
+            args=(card.density, amt, {
+                "code": food["code"],
+                "name": food["name"],
+                "density": card.density,
+                "amt": amt,
+                "grams": grams,
+            }),
+        )
+
+
+favorites_panel()
+
+# ------------------- Food search -------------------
 # --- Search bar with inline button (mobile/desktop safe, single version) ---
 
 
@@ -298,155 +285,385 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-st.subheader("Food Search")
-with st.container():
-    st.markdown('<div class="search-wrapper">', unsafe_allow_html=True)
-    col1, col2 = st.columns([1, 0.15], gap="small")
+
+@st.fragment(key="search")
+def search_panel():
+    count_run("search")
+    st.subheader("Food Search")
+    with st.container():
+        st.markdown('<div class="search-wrapper">', unsafe_allow_html=True)
+        col1, col2 = st.columns([1, 0.15], gap="small")
+        with col1:
+            query = st.text_input(
+                "Search for a food",
+                value="",
+                key="food_search",
+                label_visibility="collapsed",
+            )
+        with col2:
+            search_clicked = st.button("🔍")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    if (query and query.strip()) or search_clicked:
+        q = query.strip().lower()
+        # --- Word-based search ---
+        catalog = engine.catalog()
+        rows = catalog.search(q)
+
+        if not len(rows):
+            st.warning("⚠️ No foods found. Try a different search term.")
+        else:
+            # the next pick is nearly always one of the first results: build their cards now
+            cards = get_card_prefetcher()
+            cards.prefetch(q, catalog.codes[rows])
+            row = foodpicker.food_picker(catalog, rows, q, key="food_choice")
+
+            if row is not None:
+                code, name = int(catalog.codes[row]), catalog.descriptions[row]
+
+                card = cards.card(code)
+                density, serving_units, unit = card.density, card.units, card.unit
+                base_grams, base_kcal = int(card.grams), int(card.kcal)
+                color = "#330000" if density == "Energy-dense" else "#003300"
+
+                amt = st.selectbox(
+                    "Add servings",
+                    [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
+                    index=3,
+                    key="amt_choice"
+                )
+
+                # total grams and kcal scale linearly from the chosen "one serving"
+                total_grams = round(base_grams * amt)
+                total_kcal = round(base_kcal * amt)
+
+                # display total units in natural decimal form: total_units = serving_units * amt
+                if unit == "g":
+                    # fallback grams display
+                    if st.session_state.show_calories:
+                        display_serving = f"{total_grams} g (~{total_kcal} kcal)"
+                    else:
+                        display_serving = f"{total_grams} g"
+                else:
+                    total_units = serving_units * amt
+                    total_units_str = engine.fmt_decimal(total_units)
+                    # plural label precomputed with the serving table
+                    unit_adj = unit if (float(total_units) == 1) else card.unit_plural
+                    if st.session_state.show_calories:
+                        display_serving = f"{total_units_str} {unit_adj} (≈{total_grams} g, ~{total_kcal} kcal)"
+                    else:
+                        display_serving = f"{total_units_str} {unit_adj} (≈{total_grams} g)"
+
+                st.markdown(
+                    f"<div style='background-color:{color}; padding:8px; border-radius:8px;'>"
+                    f"<b>{name}</b><br>{density}: {display_serving}</div>",
+                    unsafe_allow_html=True,
+                )
+
+                with st.expander("⚖️ Log a different amount"):
+                    qty_col, unit_col = st.columns(2)
+                    other_qty = qty_col.number_input("Amount", min_value=0.0, value=1.0, step=0.25, key="other_qty")
+                    other_unit = unit_col.selectbox("Unit", list(card.unit_grams), key="other_unit")
+                    other_grams = round(other_qty * card.unit_grams[other_unit])
+                    # servings scale with grams, like the serving amounts above
+                    other_amt = round(other_grams / base_grams, 2) if base_grams else 0.0
+                    st.caption(f"≈ {other_grams} g, {engine.fmt_decimal(other_amt)} {density} servings")
+                    st.button(
+                        "Add this amount",
+                        disabled=other_amt <= 0,
+                        on_click=actions.add,
+                        args=(density, other_amt, {
+                            "code": code,
+                            "name": name,
+                            "density": density,
+                            "amt": other_amt,
+                            "grams": other_grams,
+                        }),
+                        kwargs={"panel": "search", "clear": tallyactions.SEARCH_KEYS},
+                    )
+
+                if density == "Energy-dense":
+                    with st.expander("💡 Similar foods with fewer calories"):
+                        same_category = st.toggle("Same food category only", value=True, key="sub_same_category")
+                        suggestions = card.substitutes[same_category]
+                        if not suggestions:
+                            st.caption("No similar lower-calorie foods found.")
+                        for sub in suggestions:
+                            st.markdown(
+                                f"- {sub.description} (#{sub.food_code}): "
+                                f"{sub.kcal_per_100g:.0f} vs {card.kcal_per_100g:.0f} kcal per 100 g"
+                            )
+
+                st.button(
+                    "Add to tally",
+                    on_click=actions.add,
+                    args=(density, amt, {
+                        "code": code,
+                        "name": name,
+                        "density": density,
+                        "amt": amt,
+                        "grams": total_grams,
+                    }),
+                    kwargs={"panel": "search", "clear": tallyactions.SEARCH_KEYS},
+                )
+
+
+search_panel()
+
+# ------------------- Describe a meal -------------------
+@st.fragment(key="meal_text")
+def meal_text_panel():
+    count_run("meal_text")
+    with st.expander("📝 Describe a meal"):
+        meal_text = st.text_input("What did you eat?", key="meal_text", placeholder="2 cups rice and an apple")
+        meal_items = engine.parse_meal(meal_text, serving_kcal) if meal_text.strip() else []
+        if meal_text.strip() and not meal_items:
+            st.warning("⚠️ No foods recognised. Try naming the food more plainly.")
+        for item in meal_items:
+            st.markdown(
+                f"- {item.text} → **{item.description}**: ≈{item.grams:.0f} g, "
+                f"{engine.fmt_decimal(item.servings)} {item.density} servings"
+            )
+        if meal_items:
+            st.button(
+                "Add meal to tally",
+                on_click=actions.add_all,
+                args=([
+                    (item.density, item.servings, {
+                        "code": item.food_code,
+                        "name": item.description,
+                        "density": item.density,
+                        "amt": item.servings,
+                        "grams": round(item.grams),
+                    })
+                    for item in meal_items
+                ],),
+                kwargs={"panel": "meal_text", "clear": ["meal_text"]},
+            )
+
+
+meal_text_panel()
+
+# ------------------- Saved meals and recipes -------------------
+RECIPE_KEYS = ("recipe_items", "recipe_name", "recipe_portions", "recipe_search", "recipe_choice", "recipe_choice_limit")
+
+
+@st.cache_data
+def get_meal_servings(meal, serving_kcal):
+    # one portion of a saved meal in servings, worked out once per meal and serving sizes
+    return meals.portion_servings(meal, engine.serving_table(serving_kcal))
+
+
+def _add_ingredient(code, name):
+    grams = st.session_state.recipe_grams
+    if grams > 0:
+        st.session_state.recipe_items = st.session_state.get("recipe_items", []) + [(code, name, grams)]
+    for k in ("recipe_search", "recipe_choice", "recipe_choice_limit"):
+        if k in st.session_state:
+            del st.session_state[k]
+
+
+def _clear_recipe():
+    for k in RECIPE_KEYS:
+        if k in st.session_state:
+            del st.session_state[k]
+
+
+def _save_recipe(serving_kcal):
+    meal = meals.Meal(
+        st.session_state.recipe_name.strip(),
+        tuple(st.session_state.recipe_items),
+        float(st.session_state.recipe_portions),
+    )
+    tally.save_meal(user_id, meal)
+    # worked out now, so logging the meal later is a cache hit
+    get_meal_servings(meal, serving_kcal)
+    _clear_recipe()
+
+
+@st.fragment(key="meals")
+def saved_meals_panel():
+    count_run("meals")
+    with st.expander("🥪 Saved meals and recipes"):
+        saved = tally.saved_meals(user_id)
+        if not saved:
+            st.caption("No saved meals yet. Build one below.")
+        for name, meal in sorted(saved.items()):
+            portion = get_meal_servings(meal, serving_kcal)
+            log_col, delete_col = st.columns([0.85, 0.15])
+            # the whole meal is one change to the tally
+            log_col.button(
+                f"➕ {name}: ⚡ {engine.fmt_decimal(portion.energy_servings)} 🌱 {engine.fmt_decimal(portion.nutrient_servings)}",
+                key=f"meal_log_{name}",
+                help=f"One portion: {len(portion.entries)} foods, ≈{portion.grams:.0f} g, ~{portion.kcal:.0f} kcal",
+                on_click=actions.add_all,
+                args=(portion.entries,),
+                kwargs={"panel": "meals"},
+            )
+            delete_col.button("🗑️", key=f"meal_delete_{name}", on_click=tally.delete_meal, args=(user_id, name))
+
+        st.markdown("**Build a meal or recipe**")
+        ingredient = st.text_input("Add an ingredient", key="recipe_search", placeholder="e.g. whole wheat bread")
+        q = ingredient.strip().lower()
+        if q:
+            catalog = engine.catalog()
+            rows = catalog.search(q)
+            row = foodpicker.food_picker(catalog, rows, q, key="recipe_choice", label="Food") if len(rows) else None
+            if not len(rows):
+                st.warning("⚠️ No foods found. Try a different search term.")
+            if row is not None:
+                code = int(catalog.codes[row])
+                st.number_input(
+                    "Grams", min_value=0.0, value=float(serving_table.at[code, "grams"]), step=5.0, key="recipe_grams"
+                )
+                st.button("Add ingredient", on_click=_add_ingredient, args=(code, catalog.descriptions[row]))
+
+        items = st.session_state.get("recipe_items", [])
+        if items:
+            portions = st.number_input("Portions it makes", min_value=1, value=1, step=1, key="recipe_portions")
+            portion = meals.portion_servings(meals.Meal("", tuple(items), float(portions)), serving_table)
+            for density, amt, food in portion.entries:
+                st.markdown(f"- {food['name']}: {food['grams']} g, {engine.fmt_decimal(amt)} {density} servings")
+            st.caption(
+                f"Per portion: ⚡ {engine.fmt_decimal(portion.energy_servings)} and 🌱 {engine.fmt_decimal(portion.nutrient_servings)} "
+                f"servings, ~{portion.kcal:.0f} kcal."
+            )
+            name = st.text_input("Name", key="recipe_name", placeholder="e.g. Turkey sandwich")
+            save_col, clear_col = st.columns(2)
+            save_col.button("Save meal", disabled=not name.strip(), on_click=_save_recipe, args=(serving_kcal,))
+            clear_col.button("Start over", on_click=_clear_recipe)
+
+
+saved_meals_panel()
+
+# ------------------- Quick add / subtract -------------------
+@st.fragment(key="quick_adjust")
+def quick_adjust_panel():
+    count_run("quick_adjust")
+    st.subheader("Quick Add")
+    col1, col2 = st.columns(2)
+    with col1:
+        amt = st.selectbox(
+            "Serving amount",
+            [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
+            index=3,
+            key="energy_inc",
+        )
+        st.button("⚡ Add Energy", on_click=actions.add, args=("Energy-dense", amt))
+    with col2:
+        amt = st.selectbox(
+            "Serving amount ",
+            [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
+            index=3,
+            key="nutrient_inc",
+        )
+        st.button("🌱 Add Nutrient", on_click=actions.add, args=("Nutrient-dense", amt))
+
+    st.subheader("Quick Subtract")
+    col1, col2 = st.columns(2)
     with col1:
-        query = st.text_input(
-            "Search for a food",
-            value="",
-            key="food_search",
-            label_visibility="collapsed",
+        amt = st.selectbox(
+            "Serving amount",
+            [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
+            index=3,
+            key="energy_dec",
         )
+        st.button("⚡ Remove Energy", on_click=actions.add, args=("Energy-dense", -amt))
     with col2:
-        search_clicked = st.button("🔍")
-    st.markdown('</div>', unsafe_allow_html=True)
-
-if (query and query.strip()) or search_clicked:
-    q = query.strip().lower()
-    # --- Word-based search ---
-    words = q.split()
-    matches = foods_df.copy()
-    for w in words:
-        matches = matches[matches["main_food_description"].str.contains(w, case=False, na=False)]
-
-    if matches.empty:
-        st.warning("⚠️ No foods found. Try a different search term.")
-    else:
-        options = ["-- choose a food --"] + [
-            f'{row["main_food_description"]} (#{row["food_code"]})'
-            for _, row in matches.iterrows()
-        ]
-        choice = st.selectbox("Select a food", options, key="food_choice")
-
-        if choice != "-- choose a food --":
-            code = int(choice.split("#")[-1].strip(")"))
-            food_row = foods_df[foods_df["food_code"] == code].iloc[0]
-
-            density, fraction, unit, base_grams, base_kcal = serving_for_food(food_row)
-            color = "#330000" if density == "Energy-dense" else "#003300"
-
-            amt = st.selectbox(
-                "Add servings",
-                [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
-                index=3,
-                key="amt_choice"
+        amt = st.selectbox(
+            "Serving amount ",
+            [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
+            index=3,
+            key="nutrient_dec",
+        )
+        st.button("🌱 Remove Nutrient", on_click=actions.add, args=("Nutrient-dense", -amt))
+
+
+quick_adjust_panel()
+
+# ------------------- History -------------------
+@st.fragment(key="history")
+def history_panel():
+    count_run("history")
+    with st.expander("📈 History"):
+        period = st.radio("Group by", list(analytics.PERIODS), horizontal=True, key="history_period")
+        # finished days only; today is still moving and is shown in the tally above
+        yesterday = st.session_state.date - datetime.timedelta(days=1)
+        trends = analytics.history_summary(
+            tally.store,
+            user_id,
+            (yesterday - datetime.timedelta(days=364)).isoformat(),
+            yesterday.isoformat(),
+            servings_goal,
+            period,
+        )
+        if trends.empty:
+            st.info("No history yet. Trends show up here from tomorrow.")
+        else:
+            trends = trends.set_index("period")
+            st.line_chart(trends[["avg_energy", "avg_nutrient"]])
+            st.dataframe(
+                trends.rename(columns={
+                    "days_logged": "Days logged",
+                    "avg_energy": "⚡ Avg energy-dense",
+                    "avg_nutrient": "🌱 Avg nutrient-dense",
+                    "energy_goal_rate": "⚡ Goal reached",
+                    "nutrient_goal_rate": "🌱 Goal reached",
+                }),
+                column_config={
+                    "⚡ Goal reached": st.column_config.NumberColumn(format="percent"),
+                    "🌱 Goal reached": st.column_config.NumberColumn(format="percent"),
+                },
             )
 
-            # total grams and kcal scale linearly from the chosen "one serving"
-            total_grams = round(base_grams * amt)
-            total_kcal = round(base_kcal * amt)
 
-            # display total units in natural decimal form: total_units = fraction * amt
-            if unit == "g":
-                # fallback grams display
-                if st.session_state.show_calories:
-                    display_serving = f"{total_grams} g (~{total_kcal} kcal)"
-                else:
-                    display_serving = f"{total_grams} g"
-            else:
-                total_units = fraction * amt
-                total_units_str = _fmt_decimal(total_units)
-                # pluralize unit when >1
-                unit_adj = unit if (float(total_units) == 1) else (unit + "s" if not unit.endswith("s") else unit)
-                if st.session_state.show_calories:
-                    display_serving = f"{total_units_str} {unit_adj} (≈{total_grams} g, ~{total_kcal} kcal)"
-                else:
-                    display_serving = f"{total_units_str} {unit_adj} (≈{total_grams} g)"
+history_panel()
 
-            st.markdown(
-                f"<div style='background-color:{color}; padding:8px; border-radius:8px;'>"
-                f"<b>{food_row['main_food_description']}</b><br>{density}: {display_serving}</div>",
-                unsafe_allow_html=True,
+# ------------------- Meal plan -------------------
+@st.fragment(key="meal_plan")
+def meal_plan_panel():
+    count_run("meal_plan")
+    with st.expander("🍽️ Plan my day"):
+        exclude = st.text_input(
+            "Leave out foods containing (comma-separated)", key="plan_exclude", placeholder="e.g. pork, shrimp"
+        )
+        if st.button("Suggest a day" if "meal_plan" not in st.session_state else "Suggest another day"):
+            st.session_state.plan_seed = st.session_state.get("plan_seed", 0) + 1
+            st.session_state.meal_plan = mealplan.plan_day(
+                servings_goal,
+                servings_goal,
+                daily_cals,
+                serving_table,
+                exclude=[w for w in exclude.split(",") if w.strip()],
+                seed=st.session_state.plan_seed,
+            )
+        if "meal_plan" in st.session_state:
+            plan, shortfall = st.session_state.meal_plan
+            st.dataframe(
+                plan.assign(portion=[
+                    f"{total_grams} g" if unit == "g" else f"{engine.fmt_decimal(n)} {unit}"
+                    for n, unit, total_grams in zip(plan["units"], plan["unit"], plan["grams"])
+                ])[["description", "density", "amt", "portion", "kcal"]],
+                hide_index=True,
             )
+            st.caption(f"About {plan['kcal'].sum()} kcal in {plan['amt'].sum():g} servings.")
+            short = [f"{n:g} {density}" for density, n in shortfall.items() if n > 0]
+            if short:
+                st.warning(
+                    f"⚠️ Not enough foods left to fill {' and '.join(short)} servings of the goal. "
+                    "Try leaving out fewer foods."
+                )
 
-            if st.button("Add to tally"):
-                add_serving(density, amt)
-                st.session_state.selected_foods.append({
-                    "code": code,
-                    "name": food_row["main_food_description"],
-                    "density": density,
-                    "amt": amt,
-                })
-
-                for k in ["food_search", "food_choice", "amt_choice"]:
-                    if k in st.session_state:
-                        del st.session_state[k]
-
-                st.rerun()
-
-# ------------------- Manual tally section -------------------
-st.subheader("Quick Add")
-col1, col2 = st.columns(2)
-with col1:
-    amt = st.selectbox(
-        "Serving amount",
-        [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
-        index=3,
-        key="energy_inc",
-    )
-    if st.button("⚡ Add Energy"):
-        add_serving("Energy-dense", amt)
-        st.rerun()
-with col2:
-    amt = st.selectbox(
-        "Serving amount ",
-        [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
-        index=3,
-        key="nutrient_inc",
-    )
-    if st.button("🌱 Add Nutrient"):
-        add_serving("Nutrient-dense", amt)
-        st.rerun()
 
-# ------------------- Manual subtract section -------------------
-st.subheader("Quick Subtract")
-col1, col2 = st.columns(2)
-with col1:
-    amt = st.selectbox(
-        "Serving amount",
-        [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
-        index=3,
-        key="energy_dec",
-    )
-    if st.button("⚡ Remove Energy"):
-        add_serving("Energy-dense", -amt)
-        st.rerun()
-with col2:
-    amt = st.selectbox(
-        "Serving amount ",
-        [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2],
-        index=3,
-        key="nutrient_dec",
-    )
-    if st.button("🌱 Remove Nutrient"):
-        add_serving("Nutrient-dense", -amt)
-        st.rerun()
+meal_plan_panel()
 
 # ------------------- Calorie Toggle -------------------
 st.markdown("---")  # horizontal bar separator
 
-def _toggle_calories():
-    st.session_state.show_calories = not st.session_state.get("show_calories", False)
-    st.rerun()
-
-if "show_calories" not in st.session_state:
-    st.session_state.show_calories = False
-
+# only the search panel shows calories
 st.checkbox(
     "Show calories of foods while searching",
-    value=st.session_state.show_calories,
-    key="show_calories_checkbox",
-    on_change=_toggle_calories,
+    key="show_calories",
+    on_change=tallyactions.rerun_only,
+    args=("search",),
 )
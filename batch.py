@@ -0,0 +1,184 @@
+"""Food logs and recipe files to energy and nutrient servings, in bulk, on every core.
+
+    python batch.py log.csv > servings.csv
+    python batch.py log.jsonl --calories 2500 --workers 8 -o servings.csv
+    cat log.csv | python batch.py - > servings.csv
+
+Each input row has a `food` (an FNDDS food code or a description) and an
+optional `amount`: a number of servings ("1.5") or a quantity with a
+unit ("2 cups", "150 g", "3 slices"). Other columns are passed through.
+The output adds food_code, description, density, grams,
+energy_servings, nutrient_servings and status ("ok", "no match", "bad
+amount" when the amount isn't positive, or "no unit" when the food can't
+be measured in the unit given).
+
+The input is read in chunks of CHUNK_SIZE rows, and each chunk is
+converted in a worker process. A worker handles each distinct food text
+and amount once and keeps the last CACHE_SIZE of each, because a log
+repeats the same foods. The serving arithmetic is array math over the
+whole chunk. At most two chunks per worker are in flight, and results
+are written in input order as they finish. Memory stays flat however
+long the file is. Rows per second are reported on stderr.
+"""
+import argparse
+import collections
+import concurrent.futures
+import functools
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import engine
+import mealparser
+import servingtable
+from searchindex import singular
+
+CHUNK_SIZE = 50_000
+# distinct food texts, amounts and (food, unit) pairs each worker remembers
+CACHE_SIZE = 65536
+OUTPUT_COLUMNS = ["food_code", "description", "density", "grams", "energy_servings", "nutrient_servings", "status"]
+
+# per worker process
+_serving_kcal = None
+
+
+def _init_worker(serving_kcal):
+    global _serving_kcal
+    _serving_kcal = serving_kcal
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def resolve(food):
+    """FNDDS food code for a code or description, or -1."""
+    food = food.strip()
+    if food.isdigit():
+        return int(food) if int(food) in engine.serving_table().index else -1
+    parser = engine.meal_parser()
+    hit = parser.find(food.split())
+    return -1 if hit is None else int(parser.index.codes[hit[0]])
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def read_amount(amount):
+    """(quantity, unit) for "1.5", "2 cups", "half a cup"; unit is "" for servings."""
+    words = amount.split()
+    if not words:
+        return 1.0, ""
+    quantity, words = mealparser.read_quantity(words)
+    if not words:
+        return quantity, ""
+    unit, _ = mealparser.read_unit(words + ["x"])  # read_unit wants a food word after the unit
+    return quantity, unit or singular(words[0].lower())
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def grams_per_unit(code, unit):
+    grams = engine.meal_parser().unit_table.grams_per_unit(code, unit)
+    return np.nan if grams is None else grams
+
+
+def convert(chunk, serving_kcal=None):
+    """The chunk with the OUTPUT_COLUMNS added."""
+    codes = chunk["food"].astype(str).map(resolve).to_numpy(dtype=np.int64)
+    return convert_codes(chunk, codes, serving_kcal)
+
+
+def convert_codes(chunk, codes, serving_kcal=None):
+    """The chunk with the OUTPUT_COLUMNS added, for foods already resolved to `codes` (-1 for none)."""
+    table = engine.serving_table(serving_kcal)
+    amounts = chunk["amount"].fillna("1").astype(str) if "amount" in chunk else pd.Series("1", index=chunk.index)
+    quantity, unit = zip(*amounts.map(read_amount)) if len(chunk) else ((), ())
+    quantity, unit = np.array(quantity, dtype=float), np.array(unit, dtype=object)
+    # "0", "0 cups" or "-2 cups" (read_amount takes "-2" for a unit); as service._amount rejects them
+    bad = amounts.str.lstrip().str.startswith("-").to_numpy(dtype=bool) | ~(quantity > 0)
+
+    serving = table.reindex(codes)
+    serving_grams = serving["grams"].to_numpy(dtype=float)
+    by_unit = unit != ""
+    per_unit = np.array([grams_per_unit(c, u) for c, u in zip(codes[by_unit], unit[by_unit])], dtype=float)
+    grams = quantity * serving_grams
+    grams[by_unit] = quantity[by_unit] * per_unit
+    servings = np.where(by_unit, grams / np.where(serving_grams > 0, serving_grams, np.nan), quantity)
+    matched = codes >= 0
+    servings[~matched | bad] = np.nan
+    grams[bad] = np.nan
+    energy = (serving["density"] == "Energy-dense").to_numpy()
+
+    out = chunk.copy()
+    out["food_code"] = np.where(matched, codes, pd.NA)
+    out["description"] = engine.descriptions(codes)
+    out["density"] = serving["density"].to_numpy()
+    out["grams"] = np.round(grams, 1)
+    out["energy_servings"] = np.round(np.where(energy, servings, 0.0), 2)
+    out["nutrient_servings"] = np.round(np.where(energy, 0.0, servings), 2)
+    out.loc[np.isnan(servings), ["energy_servings", "nutrient_servings"]] = np.nan
+    out["status"] = np.select([~matched, bad, np.isnan(servings)], ["no match", "bad amount", "no unit"], "ok")
+    return out
+
+
+def _convert_csv(chunk):
+    out = convert(chunk, _serving_kcal)
+    return out.to_csv(index=False, header=False), len(out), int((out["status"] != "ok").sum())
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    source = sys.stdin if path == "-" else path
+    if path.endswith((".jsonl", ".ndjson")):
+        reader = pd.read_json(source, lines=True, chunksize=chunk_size, dtype=False)
+    else:
+        reader = pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    with reader:
+        yield from reader
+
+
+def run(path, out, serving_kcal=None, workers=None, chunk_size=CHUNK_SIZE):
+    """Convert `path` into CSV on `out`; returns (rows, rows not converted)."""
+    workers = workers or os.cpu_count()
+    rows = problems = 0
+    header = True
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(serving_kcal,)) as pool:
+        in_flight = collections.deque()
+
+        def write(future):
+            nonlocal rows, problems, header
+            text, n, bad = future.result()
+            rows, problems = rows + n, problems + bad
+            out.write(text)
+
+        for chunk in read_chunks(path, chunk_size):
+            if header:
+                out.write(",".join(map(str, list(chunk.columns) + OUTPUT_COLUMNS)) + "\n")
+                header = False
+            in_flight.append(pool.submit(_convert_csv, chunk))
+            while len(in_flight) >= 2 * workers:
+                write(in_flight.popleft())
+        while in_flight:
+            write(in_flight.popleft())
+    return rows, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a food log (CSV or JSONL) to servings.")
+    parser.add_argument("path", help='CSV or .jsonl file with "food" and "amount" columns; "-" for stdin (CSV)')
+    parser.add_argument("-o", "--output", help="CSV file to write (default stdout)")
+    parser.add_argument("--calories", type=int, help="size servings for this daily calorie target")
+    parser.add_argument("--workers", type=int, help="processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    serving_kcal = servingtable.personal_serving_kcal(args.calories) if args.calories else None
+    start = time.perf_counter()
+    with open(args.output, "w", newline="") if args.output else sys.stdout as out:
+        rows, problems = run(args.path, out, serving_kcal, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{rows} rows in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s), {problems} not converted",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""History analytics on synthetic data: 10k users x 365 days of rollups.
+
+    python benchmarks/analytics_history.py [--users 10000] [--days 365] [--queries 200]
+
+Writes month-partitioned rollups in the same layout history.compact
+produces (to a temp dir), then times one-year weekly and monthly
+summaries for random users, uncached and cached.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+import history  # noqa: E402
+import storage  # noqa: E402
+
+
+def write_synthetic(history_dir, users, days, start):
+    rng = np.random.default_rng(0)
+    user_ids = np.array([f"user{i:06d}" for i in range(users)])
+    dates = np.array([(start + datetime.timedelta(d)).isoformat() for d in range(days)])
+    rollups = pd.DataFrame({
+        "user_id": np.repeat(user_ids, days),
+        "day": np.tile(dates, users),
+        "energy_servings": rng.gamma(6, 1.2, users * days).round(2),
+        "nutrient_servings": rng.gamma(5, 1.2, users * days).round(2),
+    })
+    for month, part in rollups.groupby(rollups["day"].str[:7]):
+        history.write_rollups(part, month, history_dir)
+    return user_ids
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return f"p50 {np.percentile(ms, 50):6.1f} ms   p95 {np.percentile(ms, 95):6.1f} ms   max {ms.max():6.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    start = datetime.date(2025, 1, 1)
+    end = (start + datetime.timedelta(args.days - 1)).isoformat()
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+        user_ids = write_synthetic(tmp, args.users, args.days, start)
+        print(f"wrote {args.users * args.days:,} rollup rows in {time.perf_counter() - t:.1f}s")
+
+        store = storage.MemoryStore()  # everything is compacted; nothing recent
+        rng = np.random.default_rng(1)
+        for period in analytics.PERIODS:
+            picks = rng.choice(user_ids, args.queries)
+            cold, warm = [], []
+            for user in picks:
+                t = time.perf_counter()
+                analytics.history_summary(store, user, start.isoformat(), end, 10, period, history_dir=tmp)
+                cold.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                analytics.history_summary(store, user, start.isoformat(), end, 10, period, history_dir=tmp)
+                warm.append(time.perf_counter() - t)
+            print(f"{period:>5} uncached: {percentiles(cold)}")
+            print(f"{period:>5} cached:   {percentiles(warm)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Server time per interaction in app.py, as a fragment rerun and as a full rerun, measured with AppTest.
+
+    python benchmarks/app_reruns.py [--repeat 20]
+    git show <rev>:app.py > /tmp/app_before.py
+    python benchmarks/app_reruns.py --app /tmp/app_before.py    # the same, for another revision
+
+Drives the app with streamlit's AppTest (in-memory tally store). Each
+interaction changes one widget and times the run that follows, twice:
+
+  fragment  the run a browser asks for: only the st.fragment that owns the
+            widget (its key in app.py) reruns
+  full      the whole script reruns, as it did before the panels were fragments
+
+AppTest reruns the whole script after a widget change. It has no way to
+send a fragment run, but it does honour a keyed st.rerun([...]) from a
+widget callback. So the benchmark appends one button per panel to the
+script, with a callback that reruns just that panel. A fragment sample
+changes the widget, then clicks the panel's button. Both numbers are the
+median CPU and wall time over --repeat runs. A panel that isn't a fragment
+in the script under test (an older app.py) shows n/a for the fragment
+column. To compare two revisions, run the benchmark once against each
+app.py.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SERVINGTRACKER_STORE", "memory")
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+# (name, fragment key of the panel the widget is in, function that changes the widget given the run number)
+INTERACTIONS = [
+    ("type in search", "search", lambda at, i: at.text_input(key="food_search").set_value(["apple", "apples"][i % 2])),
+    ("pick a food", "search", lambda at, i: at.selectbox(key="food_choice").select_index(1 + i % 2)),
+    ("change servings", "search", lambda at, i: at.selectbox(key="amt_choice").set_value([1, 2][i % 2])),
+    ("quick add amount", "quick_adjust", lambda at, i: at.selectbox(key="energy_inc").set_value([1, 2][i % 2])),
+    ("FPED toggle", "totals", lambda at, i: at.checkbox(key="fped_mode").set_value(i % 2 == 0)),
+]
+
+# appended to the app: a button per panel whose callback reruns only that panel
+RERUN_BUTTONS = """
+
+for _panel in {panels!r}:
+    st.button(f"benchmark: rerun {{_panel}}", key=f"benchmark_rerun_{{_panel}}", on_click=st.rerun, args=([_panel],))
+"""
+
+
+def timed_run(at, trigger=None):
+    cpu, wall = time.process_time(), time.perf_counter()
+    (trigger or at).run()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return cpu, wall
+
+
+def median_ms(samples):
+    return np.median(np.array(samples), axis=0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"), help="app script to time")
+    args = parser.parse_args()
+
+    with open(args.app) as f:
+        script = f.read() + RERUN_BUTTONS.format(panels=tuple(dict.fromkeys(p for _, p, _ in INTERACTIONS)))
+    at = AppTest.from_string(script, default_timeout=120)
+    at.query_params["user"] = "benchmark"
+    at.run()
+    # bring the search panel to a selected food so every widget exists
+    at.text_input(key="food_search").input("apple").run()
+    at.selectbox(key="food_choice").select_index(1).run()
+    for _ in range(3):  # warm caches
+        at.run()
+
+    # fixed cost of one AppTest run (thread start, mock runtime, parsing the tree)
+    empty = AppTest.from_string("import streamlit as st\nst.write('')")
+    overhead = np.median([timed_run(empty)[0] for _ in range(args.repeat)]) * 1000
+    print(f"{args.app}\nAppTest harness overhead per run: {overhead:.1f} ms cpu (included below)\n")
+
+    print(f"{'interaction':18} {'fragment cpu':>13} {'wall':>10} {'full cpu':>10} {'wall':>10}")
+    for name, panel, change in INTERACTIONS:
+        full, fragment = [], []
+        at.run()  # full render, so every panel's widgets are in the tree
+        for i in range(args.repeat):
+            change(at, 2 * i)
+            full.append(timed_run(at))
+            if fragment is None:
+                continue
+            # after a fragment run the tree holds only that fragment, so the two kinds alternate
+            change(at, 2 * i + 1)
+            try:
+                fragment.append(timed_run(at, at.button(key=f"benchmark_rerun_{panel}").click()))
+            except RuntimeError:  # no fragment with that key in this app.py
+                fragment = None
+        full_cpu, full_wall = median_ms(full)
+        fragment_cpu, fragment_wall = (f"{ms:7.1f} ms" for ms in median_ms(fragment)) if fragment else ("n/a", "n/a")
+        print(f"{name:18} {fragment_cpu:>13} {fragment_wall:>10} {full_cpu:7.1f} ms {full_wall:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
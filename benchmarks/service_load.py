@@ -0,0 +1,144 @@
+"""Open-loop load test of service.py: p50/p99 latency at a fixed request rate.
+
+    python benchmarks/service_load.py --rps 200 --seconds 20
+    python benchmarks/service_load.py --url http://127.0.0.1:8000 --rps 500
+
+Starts the service on a free port (unless --url is given), waits for it to
+warm up, then sends requests on a fixed schedule: request i leaves at
+start + i / rps whether or not earlier ones have answered. Latency is
+measured from the scheduled time, so a backed-up server shows up as
+latency rather than as a lower request rate. The request mix is mostly
+searches and food lookups with some batch POSTs. Distinct queries are
+drawn from a list, so after the first pass the GET caches are warm, as in
+production. Each request opens its own connection.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = [
+    "apple", "banana", "milk", "chicken breast", "rice", "bread", "egg", "cheese", "coffee", "yogurt",
+    "orange juice", "peanut butter", "pizza", "broccoli", "salmon", "oatmeal", "beef", "pasta", "potato", "cookie",
+]
+CODES = [63101000, 63107010, 11111000, 24120110, 56205000, 51000100, 31101010, 14104100, 92101000, 11410000]
+AMOUNTS = ["1", "2 cups", "150 g", "1 medium", "half a cup", "3 slices"]
+
+
+def request_mix(rng):
+    """(method, path, body) of one request."""
+    roll = rng.random()
+    if roll < 0.4:
+        return "GET", "/search?" + urllib.parse.urlencode({"q": rng.choice(QUERIES)}), None
+    if roll < 0.55:
+        return "GET", "/match?" + urllib.parse.urlencode({"q": rng.choice(QUERIES)}), None
+    if roll < 0.75:
+        return "GET", f"/foods/{rng.choice(CODES)}?calories={rng.choice([1800, 2000, 2500])}", None
+    if roll < 0.9:
+        query = urllib.parse.urlencode({"amount": rng.choice(AMOUNTS)})
+        return "GET", f"/foods/{rng.choice(CODES)}/servings?{query}", None
+    if roll < 0.95:
+        rows = [{"food": rng.choice(QUERIES), "amount": rng.choice(AMOUNTS)} for _ in range(50)]
+        return "POST", "/servings", {"rows": rows}
+    return "POST", "/classify", {"codes": [rng.choice(CODES) for _ in range(100)]}
+
+
+async def send(host, port, method, path, body):
+    """Status code of one HTTP/1.1 request."""
+    reader, writer = await asyncio.open_connection(host, port)
+    data = b"" if body is None else json.dumps(body).encode()
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\nContent-Length: {len(data)}\r\n"
+    if body is not None:
+        head += "Content-Type: application/json\r\n"
+    writer.write(head.encode() + b"\r\n" + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def load(host, port, rps, seconds, seed=0):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    loop = asyncio.get_running_loop()
+
+    async def one(scheduled, method, path, body):
+        nonlocal errors
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        try:
+            status = await send(host, port, method, path, body)
+        except OSError:
+            status = None
+        if status != 200:
+            errors += 1
+        latencies.append(loop.time() - scheduled)
+
+    start = loop.time() + 0.1
+    n = int(rps * seconds)
+    tasks = [asyncio.create_task(one(start + i / rps, *request_mix(rng))) for i in range(n)]
+    await asyncio.gather(*tasks)
+    return latencies, errors, loop.time() - start
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(host, port, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if asyncio.run(send(host, port, "GET", "/search?q=apple", None)) == 200:
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise SystemExit("service did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="running service to test (default: start one)")
+    parser.add_argument("--rps", type=float, default=200)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="service processes when starting one")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        server = subprocess.Popen(
+            [sys.executable, "service.py", "--port", str(port), "--workers", str(args.workers)], cwd=ROOT
+        )
+    try:
+        wait_ready(host, port)
+        latencies, errors, elapsed = asyncio.run(load(host, port, args.rps, args.seconds))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    ms = [x * 1000 for x in latencies]
+    print(f"{len(ms)} requests in {elapsed:.1f} s ({len(ms) / elapsed:.0f}/s, target {args.rps:.0f}/s), {errors} errors")
+    print(f"p50 {percentile(ms, 50):.1f} ms   p90 {percentile(ms, 90):.1f} ms   "
+          f"p99 {percentile(ms, 99):.1f} ms   max {max(ms):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
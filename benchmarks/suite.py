@@ -0,0 +1,287 @@
+"""Benchmark suite for the hot paths, with a baseline check for regressions.
+
+    python benchmarks/suite.py -o results.json                      # run, save results
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --threshold 0.25 \\
+        --threshold-for "app.rerun[x1]=0.5"                           # exits 1 on a regression
+
+benchmarks/baseline.json is the committed baseline; its "meta" says
+where it was measured. Compare against it only on a similar machine, or
+save a new one first. On a busy machine the short benchmarks (app.rerun,
+search.*) can drift by more than 25% between two runs of the same code;
+give them a wider --threshold-for rather than raising --threshold for all.
+
+Datasets are the bundled FNDDS CSVs (x1) and synthetic catalogs of 10x
+and 100x as many foods. The synthetic ones copy every food, nutrient and
+portion row with new food codes that keep the original code's leading
+digits, so classification and portions behave as in the real data. They
+are written once to --data-dir and reused.
+
+Per dataset:
+  load_data.cold   servingtable.load_data() in a fresh process (CSV parse and portion parsing)
+  load_data.warm   the same, again, in a process that has already run it once
+  serving.solve    ServingSolver built and solved for the whole catalog (serving_for_food for every food)
+  serving.personal one more solve for a personal calorie target, solver already built
+  search.substring per-query latency of the app's substring search over QUERIES
+  search.ranked    per-query latency of the ranked search index over QUERIES
+and on the bundled data only:
+  app.rerun        a full-script rerun of app.py (AppTest, in-memory store)
+
+Each result keeps median_ms and p99_ms over its runs. Against a baseline,
+a result regresses when its median_ms is slower by more than its
+threshold (a fraction; --threshold, overridden per name by
+--threshold-for) and by at least MIN_DELTA_MS, so sub-millisecond noise
+doesn't fail a run. p99_ms is printed but not gated: with REPEATS runs
+it is close to the slowest single run. A benchmark in only one of the
+results and the baseline is listed as missing, and fails the check when
+it is the results that lack it.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SERVINGTRACKER_STORE", "memory")
+
+import searchindex  # noqa: E402
+import servingtable  # noqa: E402
+from engine import FoodCatalog  # noqa: E402
+
+SCALES = (1, 10, 100)
+# runs per benchmark at each scale; fewer for the big catalogs, but at least 3 so the median
+# gated on is never a single run
+REPEATS = {1: 9, 10: 5, 100: 3}
+MIN_DELTA_MS = 1.0
+DEFAULT_THRESHOLD = 0.25
+# (query, times it appears in the mix): a few common foods typed often, a long tail once
+QUERIES = [
+    ("apple", 8), ("banana", 6), ("milk", 6), ("egg", 5), ("chicken breast", 5), ("rice", 5), ("bread", 5),
+    ("coffee", 4), ("cheese", 4), ("yogurt", 4), ("orange juice", 3), ("peanut butter", 3), ("pizza", 3),
+    ("oatmeal", 2), ("salmon", 2), ("broccoli", 2), ("pasta", 2), ("potato", 2), ("cookie", 2), ("beef", 2),
+    ("greek yogurt", 1), ("whole wheat bread", 1), ("2% milk", 1), ("scrambled eggs", 1), ("brown rice", 1),
+    ("almond", 1), ("avocado", 1), ("tortilla", 1), ("granola", 1), ("hummus", 1), ("tuna salad", 1),
+    ("sweet potato", 1), ("spinach", 1), ("ice cream", 1), ("cola", 1), ("beer", 1), ("chips", 1), ("soup", 1),
+]
+SOURCES = [servingtable.FOODS_FILE, servingtable.NUTRIENTS_FILE, servingtable.PORTIONS_FILE]
+ENRICHED = servingtable.ENRICHED_PORTIONS_FILE
+
+
+# ------------------- Datasets -------------------
+def scaled_files(scale, data_dir):
+    """Paths of the (foods, nutrients, portions) CSVs for a scale, written on first use."""
+    if scale == 1:
+        return SOURCES
+    paths = [os.path.join(data_dir, f"x{scale}", os.path.basename(p)) for p in SOURCES]
+    if all(os.path.exists(p) for p in paths):
+        return paths
+    os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+    for source, path in zip(SOURCES, paths):
+        df = pd.read_csv(source, skiprows=1)
+        copies = []
+        for k in range(scale):
+            copy = df.copy()
+            # keep the leading digits (density prefixes), make the code unique per copy
+            copy["Food code"] = copy["Food code"] * 1000 + k
+            copies.append(copy)
+        with open(path, "w", newline="") as f:
+            f.write(f'"x{scale} synthetic catalog"\n')  # the title row load_data skips
+            pd.concat(copies, ignore_index=True).to_csv(f, index=False)
+    return paths
+
+
+def use_files(paths):
+    """Point servingtable.load_data at a dataset's files and drop cached tables."""
+    servingtable.FOODS_FILE, servingtable.NUTRIENTS_FILE, servingtable.PORTIONS_FILE = paths
+    # the synthetic catalogs have no enriched portions
+    servingtable.ENRICHED_PORTIONS_FILE = ENRICHED if paths == SOURCES else ""
+    servingtable.load_data.cache_clear()
+    servingtable.solver.cache_clear()
+    servingtable.serving_table.cache_clear()
+
+
+_COLD = """
+import sys, time
+sys.path.insert(0, {root!r})
+import servingtable
+servingtable.FOODS_FILE, servingtable.NUTRIENTS_FILE, servingtable.PORTIONS_FILE = {paths!r}
+servingtable.ENRICHED_PORTIONS_FILE = {enriched!r}
+start = time.perf_counter()
+servingtable.load_data()
+print(time.perf_counter() - start)
+"""
+
+
+# ------------------- Timing -------------------
+def summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {"median_ms": round(float(np.median(ms)), 3), "p99_ms": round(float(np.percentile(ms, 99)), 3), "runs": len(ms)}
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def query_mix():
+    return [q for q, n in QUERIES for _ in range(n)]
+
+
+def bench_dataset(scale, data_dir, results):
+    repeat = REPEATS.get(scale, 1)
+    paths = scaled_files(scale, data_dir)
+
+    def name(bench):
+        return f"{bench}[x{scale}]"
+
+    script = _COLD.format(root=ROOT, paths=tuple(paths), enriched=ENRICHED if scale == 1 else "")
+    cold = [float(subprocess.check_output([sys.executable, "-c", script], text=True)) for _ in range(repeat)]
+    results[name("load_data.cold")] = summary(cold)
+
+    use_files(paths)
+    servingtable.load_data()
+
+    def reload():
+        servingtable.load_data.cache_clear()
+        servingtable.load_data()
+    results[name("load_data.warm")] = summary(timed(reload, repeat))
+
+    foods_df, nutrients_df, portions_df = servingtable.load_data()
+    results[name("serving.solve")] = summary(
+        timed(lambda: servingtable.ServingSolver(foods_df, nutrients_df, portions_df).solve(), repeat)
+    )
+    solver = servingtable.ServingSolver(foods_df, nutrients_df, portions_df)
+    personal = servingtable.personal_serving_kcal(2500)
+    results[name("serving.personal")] = summary(timed(lambda: solver.solve(personal), repeat))
+
+    catalog = FoodCatalog(foods_df)
+    index = searchindex.FoodIndex(foods_df)
+    queries = query_mix()
+    for query in queries[:5]:  # first-call costs aren't per-query latency
+        catalog.search(query)
+        index.search(query)
+    results[name("search.substring")] = summary([t for q in queries for t in timed(lambda: catalog.search(q), 1)])
+    results[name("search.ranked")] = summary([t for q in queries for t in timed(lambda: index.search(q), 1)])
+    use_files(SOURCES)
+
+
+def bench_app(results, repeat=5):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.query_params["user"] = "benchmark"
+    at.run()  # first run loads the data and builds the caches
+    if at.exception:
+        raise SystemExit(f"app.py failed: {at.exception[0].message}")
+    results["app.rerun[x1]"] = summary(timed(at.run, repeat))
+
+
+# ------------------- Baseline -------------------
+def regressions(results, baseline, threshold, overrides):
+    """(name, baseline ms, now ms, allowed fraction) for each result whose median is slower than allowed."""
+    found = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        allowed = overrides.get(name, threshold)
+        now_ms, before_ms = now["median_ms"], before["median_ms"]
+        if now_ms > before_ms * (1 + allowed) and now_ms - before_ms >= MIN_DELTA_MS:
+            found.append((name, before_ms, now_ms, allowed))
+    return found
+
+
+def missing(results, baseline):
+    """(names in the baseline but not the results, names in the results but not the baseline)."""
+    return sorted(baseline.keys() - results.keys()), sorted(results.keys() - baseline.keys())
+
+
+def parse_overrides(items):
+    overrides = {}
+    for item in items:
+        name, _, value = item.rpartition("=")
+        if not name:
+            raise SystemExit(f"--threshold-for wants NAME=FRACTION, got {item!r}")
+        overrides[name] = float(value)
+    return overrides
+
+
+def meta():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)), help="catalog sizes, e.g. 1,10")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "servingtracker-bench"),
+                        help="where the synthetic catalogs are kept")
+    parser.add_argument("--no-app", action="store_true", help="skip the app.py rerun")
+    parser.add_argument("-o", "--output", help="write results JSON here")
+    parser.add_argument("--save-baseline", help="write results JSON here as the new baseline")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown as a fraction (default %(default)s)")
+    parser.add_argument("--threshold-for", action="append", default=[], metavar="NAME=FRACTION",
+                        help="allowed slowdown for one benchmark; repeatable")
+    args = parser.parse_args()
+    overrides = parse_overrides(args.threshold_for)
+
+    results = {}
+    for scale in (int(s) for s in args.scales.split(",")):
+        bench_dataset(scale, args.data_dir, results)
+    if not args.no_app:
+        bench_app(results)
+
+    width = max(map(len, results))
+    for name, r in results.items():
+        print(f"{name:<{width}}  median {r['median_ms']:10.3f} ms   p99 {r['p99_ms']:10.3f} ms   ({r['runs']} runs)")
+
+    report = {"meta": meta(), "results": results}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline["results"], args.threshold, overrides)
+        not_run, new = missing(results, baseline["results"])
+        print(f"\nagainst {args.baseline} ({baseline['meta'].get('commit')}, {baseline['meta'].get('date')}):")
+        for name, before, now, allowed in found:
+            print(f"  REGRESSION {name} median: {before:.3f} -> {now:.3f} ms (+{now / before - 1:.0%}, allowed +{allowed:.0%})")
+        for name in not_run:
+            print(f"  MISSING {name}: in the baseline, not run")
+        for name in new:
+            print(f"  NEW {name}: not in the baseline, not compared")
+        if found or not_run:
+            sys.exit(1)
+        print("  no regressions")
+
+
+if __name__ == "__main__":
+    main()
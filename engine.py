@@ -0,0 +1,151 @@
+"""Headless servings engine: search, classification and servings, without Streamlit.
+
+One import for batch jobs, services and scripts that need what the app
+computes. Importing it loads no data. The FNDDS tables, serving tables,
+unit table and indexes are each built by the first call that needs them
+and then kept for the process. They are the same lru_cached objects the
+app uses, so a job that imports this pays the startup cost once and then
+runs on table lookups.
+
+    import engine
+    engine.search("apple")               # [(food_code, description)], substring match
+    engine.match("granny smith apple")   # [(food_code, description, score)], ranked
+    engine.density(63101000)             # "Nutrient-dense"
+    engine.serving(63101000)             # Serving(..., units=3.75, unit="slice", grams=94.0, ...)
+    engine.servings([63101000, 11111000], serving_kcal={"Energy-dense": 120, "Nutrient-dense": 60})
+    engine.card(63101000)                # servingcards.ServingCard: units, substitutes
+    engine.parse_meal("2 cups rice and an apple")
+"""
+import functools
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import matcher
+import mealparser
+import servingcards
+import servingtable
+
+SERVING_COLUMNS = ["density", "units", "unit", "unit_plural", "grams", "kcal"]
+
+
+class Serving(NamedTuple):
+    food_code: int
+    description: str
+    density: str
+    units: float
+    unit: str
+    unit_plural: str
+    grams: float
+    kcal: float
+
+
+def fmt_decimal(x):
+    # format numbers like 1.0 -> "1", 0.25 -> "0.25", 1.25 -> "1.25"
+    if float(x).is_integer():
+        return str(int(x))
+    return f"{x:.2f}".rstrip("0").rstrip(".")
+
+
+# ------------------- Search -------------------
+class FoodCatalog:
+    """Codes, descriptions and option labels of every food, in foods_df order."""
+
+    def __init__(self, foods_df):
+        foods = foods_df.drop_duplicates("food_code")
+        self.codes = foods["food_code"].to_numpy()
+        descriptions = foods["main_food_description"].astype(str)
+        self.descriptions = descriptions.to_numpy()
+        self.labels = (descriptions + " (#" + foods["food_code"].astype(str) + ")").to_numpy()
+        self._lower = descriptions.str.lower().reset_index(drop=True)
+
+    def search(self, query):
+        """Row positions of foods whose description contains every word of the query."""
+        hit = np.ones(len(self.codes), dtype=bool)
+        for word in query.lower().split():
+            hit &= self._lower.str.contains(word, regex=False).to_numpy()
+        return np.flatnonzero(hit)
+
+
+@functools.lru_cache(maxsize=1)
+def catalog():
+    foods_df, _, _ = servingtable.load_data()
+    return FoodCatalog(foods_df)
+
+
+def search(query, limit=50):
+    """(food_code, description) of up to `limit` foods containing every word of the query."""
+    found = catalog()
+    rows = found.search(query)[:limit]
+    return [(int(found.codes[r]), found.descriptions[r]) for r in rows]
+
+
+def match(text, k=10):
+    """(food_code, description, score) of the k best ranked matches for free text."""
+    index = matcher.default_matcher().index
+    return [(int(index.codes[r]), index.descriptions[r], score) for r, score in index.search(text, k=k)]
+
+
+# ------------------- Servings -------------------
+def _targets(serving_kcal):
+    # the serving table cache key; the default sizes share the app's entry
+    return tuple(sorted((serving_kcal or servingtable.SERVING_KCAL).items()))
+
+
+def serving_table(serving_kcal=None):
+    """Serving table for one pair of serving sizes ({density: kcal}; default SERVING_KCAL)."""
+    return servingtable.serving_table(_targets(serving_kcal))
+
+
+def density(code):
+    """"Energy-dense" or "Nutrient-dense" for a food code."""
+    return serving_table().at[int(code), "density"]
+
+
+def serving(code, serving_kcal=None):
+    """One serving of a food as a Serving."""
+    code = int(code)
+    row = serving_table(serving_kcal).loc[code]
+    return Serving(
+        code, _descriptions().get(code, ""), row["density"], float(row["units"]), row["unit"],
+        row["unit_plural"], float(row["grams"]), float(row["kcal"]),
+    )
+
+
+def servings(codes, serving_kcal=None):
+    """Serving columns for many food codes at once (NaN rows for unknown codes)."""
+    return serving_table(serving_kcal).reindex(np.asarray(codes, dtype=np.int64))[SERVING_COLUMNS]
+
+
+def descriptions(codes):
+    """Descriptions for many food codes at once ("" for unknown codes)."""
+    return _descriptions().reindex(np.asarray(codes, dtype=np.int64)).fillna("").to_numpy()
+
+
+@functools.lru_cache(maxsize=1)
+def _descriptions():
+    found = catalog()
+    return pd.Series(found.descriptions, index=found.codes)
+
+
+def card(code, serving_kcal=None):
+    """Everything the app shows for a food: serving, units it can be logged in, substitutes."""
+    return servingcards.serving_card(int(code), serving_table(serving_kcal))
+
+
+# ------------------- Free text -------------------
+@functools.lru_cache(maxsize=8)
+def _meal_parser(targets):
+    default = mealparser.default_parser()
+    return mealparser.MealParser(default.index, default.unit_table, servingtable.serving_table(targets))
+
+
+def meal_parser(serving_kcal=None):
+    """Meal parser whose servings are sized by `serving_kcal`."""
+    return _meal_parser(_targets(serving_kcal))
+
+
+def parse_meal(text, serving_kcal=None):
+    """mealparser.ParsedItem for each food named in a meal description."""
+    return meal_parser(serving_kcal).parse(text)
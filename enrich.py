@@ -0,0 +1,208 @@
+"""Batch enrichment of grams-fallback FNDDS foods with Nutritionix household measures.
+
+Every food whose serving in the serving table is plain grams is sent to
+Nutritionix's natural-language endpoint; its `alt_measures` become extra
+portions in enriched_portions.csv, which servingtable.load_data merges into
+the FNDDS portions table.
+
+    python enrich.py                          # live API, resumes from the checkpoint
+    python enrich.py --record recorded.jsonl  # also save raw responses
+    python enrich.py --replay recorded.jsonl  # offline, from saved responses
+
+Each finished food is appended to the checkpoint file straight away, so a
+crashed or interrupted run picks up where it stopped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+import requests
+
+import servingtable
+from sometimesworking import NUTRITIONIX_APP_ID, NUTRITIONIX_APP_KEY, NUTRITIONIX_URL, clean_unit_name
+
+CHECKPOINT_FILE = os.path.join(servingtable.DATA_DIR, "enrich_checkpoint.jsonl")
+DEFAULT_CONCURRENCY = 8
+# FNDDS seq nums are small; enriched rows start here so they're easy to tell apart
+ENRICHED_SEQ_START = 1000
+
+
+# ---------------- Fetchers ---------------- #
+
+def fetch_nutritionix(query, timeout=30):
+    headers = {
+        "x-app-id": NUTRITIONIX_APP_ID,
+        "x-app-key": NUTRITIONIX_APP_KEY,
+        "Content-Type": "application/json"
+    }
+    r = requests.post(NUTRITIONIX_URL, headers=headers, json={"query": query}, timeout=timeout)
+    if r.status_code == 404:  # "We couldn't match any of your foods"
+        return {"foods": []}
+    r.raise_for_status()
+    return r.json()
+
+
+class ReplayFetcher:
+    """Stand-in for Nutritionix that answers from a file written with --record."""
+
+    def __init__(self, path):
+        self.responses = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.responses[entry["query"]] = entry["response"]
+
+    def __call__(self, query):
+        return self.responses.get(query, {"foods": []})
+
+
+# ---------------- Measures ---------------- #
+
+def measures_from_response(data):
+    """Turn a Nutritionix response into per-unit portions: [{"unit": "cup", "grams": 158.0}, ...]."""
+    foods = data.get("foods") or []
+    if not foods:
+        return []
+
+    measures = []
+    seen = set()
+    for m in foods[0].get("alt_measures") or []:
+        unit = clean_unit_name(m.get("measure", "") or "")
+        qty = m.get("qty")
+        grams = m.get("serving_weight")
+        if not unit or unit == "g" or unit in seen or not qty or not grams:
+            continue
+        seen.add(unit)
+        measures.append({"unit": unit, "grams": round(grams / qty, 2)})
+    return measures
+
+
+def load_checkpoint(path):
+    """food_code -> measures for every food already finished."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial last line from a crash
+            done[entry["food_code"]] = entry["measures"]
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def to_portions(done, foods_df):
+    """Checkpoint entries as rows shaped like the FNDDS portions table."""
+    names = foods_df.set_index("food_code")["main_food_description"]
+    rows = []
+    for code, measures in done.items():
+        for seq, m in enumerate(measures, start=ENRICHED_SEQ_START):
+            rows.append({
+                "food_code": code,
+                "main_food_description": names.get(code),
+                "seq_num": seq,
+                "portion_description": f"1 {m['unit']}",
+                "portion_weight_g": m["grams"],
+                "source": "nutritionix",
+            })
+    return pd.DataFrame(rows, columns=[
+        "food_code", "main_food_description", "seq_num",
+        "portion_description", "portion_weight_g", "source",
+    ])
+
+
+# ---------------- Pipeline ---------------- #
+
+async def enrich(foods, fetch, checkpoint_path=CHECKPOINT_FILE, concurrency=DEFAULT_CONCURRENCY,
+                 record_path=None):
+    """Fetch measures for (food_code, description) pairs not yet in the checkpoint.
+
+    At most `concurrency` requests are in flight. Returns (number fetched, [(code, error)]).
+    """
+    finished = load_checkpoint(checkpoint_path)
+    todo = [(code, desc) for code, desc in foods if code not in finished]
+    sem = asyncio.Semaphore(concurrency)
+    failed = []
+
+    checkpoint = open(checkpoint_path, "a")
+    if checkpoint.tell() and not _ends_with_newline(checkpoint_path):
+        checkpoint.write("\n")  # don't glue onto a line cut short by a crash
+    record = open(record_path, "a") if record_path else None
+
+    async def one(code, desc):
+        async with sem:
+            try:
+                data = await asyncio.to_thread(fetch, desc)
+            except (requests.RequestException, ValueError) as e:
+                failed.append((code, str(e)))
+                return
+        # writes happen on the event loop thread, one whole line at a time
+        if record:
+            record.write(json.dumps({"query": desc, "response": data}) + "\n")
+        checkpoint.write(json.dumps({
+            "food_code": code, "query": desc, "measures": measures_from_response(data),
+        }) + "\n")
+        checkpoint.flush()
+
+    try:
+        await asyncio.gather(*(one(code, desc) for code, desc in todo))
+    finally:
+        checkpoint.close()
+        if record:
+            record.close()
+
+    return len(todo) - len(failed), failed
+
+
+def fallback_foods():
+    """(food_code, description) for every food currently served in grams."""
+    foods_df, nutrients_df, portions_df = servingtable.load_data()
+    codes = servingtable.grams_fallback_codes(servingtable.serving_table())
+    names = foods_df.set_index("food_code")["main_food_description"]
+    return [(int(code), names[code]) for code in codes]
+
+
+# ---------------- Main Program ---------------- #
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replay", help="answer from recorded responses instead of the live API")
+    parser.add_argument("--record", help="append raw API responses to this file")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--output", default=servingtable.ENRICHED_PORTIONS_FILE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--limit", type=int, help="only the first N foods (for trying it out)")
+    args = parser.parse_args()
+
+    foods = fallback_foods()
+    if args.limit:
+        foods = foods[:args.limit]
+    fetch = ReplayFetcher(args.replay) if args.replay else fetch_nutritionix
+
+    start = time.perf_counter()
+    fetched, failed = asyncio.run(
+        enrich(foods, fetch, args.checkpoint, args.concurrency, args.record)
+    )
+    print(f"{len(foods)} grams-fallback foods, {fetched} fetched in {time.perf_counter() - start:.1f}s")
+    for code, err in failed:
+        print(f"⚠️ {code}: {err}")
+
+    foods_df = servingtable.load_data()[0]
+    portions = to_portions(load_checkpoint(args.checkpoint), foods_df)
+    portions.to_csv(args.output, index=False)
+    print(f"Wrote {len(portions)} portions for {portions['food_code'].nunique()} foods to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Per-user decayed food counts: the foods someone logs often and lately.
+
+Each logged food adds a weight of 2 ** (days since the landmark / HALF_LIFE_DAYS).
+Growing the new weights, rather than shrinking every old count each day,
+ranks foods exactly as if every count halved each HALF_LIFE_DAYS. This is
+forward decay: an add is one dict update and nothing is touched as days
+pass. Once new weights would pass 2 ** RESCALE_EXPONENT, every count is
+scaled down and the landmark moves to the latest day. The rescale touches every food but
+happens once every 64 half-lives.
+
+A count also remembers the food's last logged entry (amount, grams), so
+the user's usual amount can be logged again with one tap.
+"""
+import datetime
+import heapq
+
+HALF_LIFE_DAYS = 7
+# days of logs read to seed a user's counts the first time they're needed
+SEED_DAYS = 28
+RESCALE_EXPONENT = 64
+
+
+def _ordinal(day):
+    return datetime.date.fromisoformat(day).toordinal()
+
+
+class FoodCounters:
+    """One user's decayed count per food code."""
+
+    __slots__ = ("landmark", "counts")
+
+    def __init__(self):
+        self.landmark = None  # day ordinal with weight 1
+        self.counts = {}  # code -> [weight, last day ordinal, last food entry]
+
+    def add(self, day, food):
+        t = _ordinal(day)
+        if self.landmark is None:
+            self.landmark = t
+        exponent = (t - self.landmark) / HALF_LIFE_DAYS
+        if exponent > RESCALE_EXPONENT:
+            shrink = 2.0 ** -exponent
+            for count in self.counts.values():
+                count[0] *= shrink
+            self.landmark, exponent = t, 0.0
+        weight = 2.0 ** exponent
+        count = self.counts.get(food["code"])
+        if count is None:
+            self.counts[food["code"]] = [weight, t, food]
+        else:
+            count[0] += weight
+            if t >= count[1]:
+                count[1], count[2] = t, food
+
+    def top(self, k):
+        """The last logged entry of the k foods with the highest decayed counts."""
+        return [count[2] for count in heapq.nlargest(k, self.counts.values(), key=lambda c: c[0])]
@@ -0,0 +1,41 @@
+"""Food search results as a windowed picker.
+
+Labels ("Apple, raw (#63101000)") are built once for the whole catalog
+(engine.FoodCatalog). A search returns row positions into them, not a
+filtered copy of foods_df.
+The picker's options are those positions: the selectbox shows each one's
+label through format_func and hands the position back, so the chosen
+food is an array lookup. Only the first PAGE_SIZE results are sent to
+the browser, and "Show more" adds another page. A query matching
+thousands of foods costs the same to render as one matching ten.
+"""
+import streamlit as st
+
+PAGE_SIZE = 50
+
+
+def _show_more(limit_key, query, shown):
+    st.session_state[limit_key] = (query, shown + PAGE_SIZE)
+
+
+def food_picker(catalog, rows, query, key, label="Select a food", placeholder="-- choose a food --"):
+    """Selectbox over the first pages of `rows`; returns the chosen row position or None.
+
+    The number of results shown is kept per query, so a new search starts
+    again at one page.
+    """
+    limit_key = f"{key}_limit"
+    shown_query, shown = st.session_state.get(limit_key, (None, PAGE_SIZE))
+    if shown_query != query:
+        shown = PAGE_SIZE
+    window = rows[:shown].tolist()
+    choice = st.selectbox(
+        label, window, index=None, key=key, placeholder=placeholder, format_func=catalog.labels.__getitem__
+    )
+    if len(rows) > shown:
+        more_col, count_col = st.columns([0.3, 0.7])
+        more_col.button(
+            "Show more", key=f"{key}_more", on_click=_show_more, args=(limit_key, query, shown)
+        )
+        count_col.caption(f"Showing {shown} of {len(rows)} matches.")
+    return choice
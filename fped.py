@@ -0,0 +1,51 @@
+"""Food-group equivalents (FPED) for the daily log.
+
+FPED_1718.csv gives, per 100 g of each FNDDS food, cup-equivalents of fruit,
+vegetables and dairy, ounce-equivalents of grains and protein foods, and
+teaspoons of added sugars. It is loaded once into a matrix indexed by food
+code, so each logged food adds one scaled row to the day's totals
+(nutrients.DailyTotals), independent of how long the log is.
+"""
+import functools
+import os
+
+import pandas as pd
+
+import nutrients
+import servingtable
+
+FPED_FILE = os.path.join(servingtable.DATA_DIR, "FPED_1718.csv")
+
+# (column, label, unit) of the headline groups shown in the app
+GROUPS = [
+    ("f_total", "🍎 Fruit", "cup eq."),
+    ("v_total", "🥦 Vegetables", "cup eq."),
+    ("g_total", "🌾 Grains", "oz eq."),
+    ("pf_total", "🍗 Protein foods", "oz eq."),
+    ("d_total", "🥛 Dairy", "cup eq."),
+    ("add_sugars", "🍬 Added sugars", "tsp eq."),
+]
+
+
+def load_fped():
+    fped = pd.read_csv(FPED_FILE, encoding="utf-8-sig")
+    # "F_TOTAL (cup eq.)" -> "f_total"
+    fped.columns = fped.columns.str.split(" (", regex=False).str[0].str.strip().str.lower()
+    return fped.drop_duplicates("foodcode")
+
+
+def fped_matrix(fped, serving_table):
+    columns = [c for c in fped.columns if c not in ("foodcode", "description")]
+    values = fped[columns].to_numpy(dtype=float, na_value=0.0)
+    return nutrients.FoodMatrix(fped["foodcode"].to_numpy(), columns, values, serving_table)
+
+
+@functools.lru_cache(maxsize=1)
+def default_matrix():
+    return fped_matrix(load_fped(), servingtable.serving_table())
+
+
+def group_totals(daily):
+    """[(label, amount, unit)] of the headline groups from a DailyTotals over the FPED matrix."""
+    columns = daily.matrix.columns
+    return [(label, daily.totals[columns.index(col)], unit) for col, label, unit in GROUPS]
@@ -0,0 +1,179 @@
+"""Date-partitioned columnar history of the tally.
+
+Events and daily rollups older than a few days are moved out of SQLite into
+Parquet files:
+
+    history/events/day=YYYY-MM-DD/part.parquet
+    history/rollups/month=YYYY-MM/part.parquet
+
+Rollup files hold (user_id, day, energy_servings, nutrient_servings,
+version), sorted by user so a per-user read only touches the row groups it
+needs. `version` is the user's store version when the row last changed.
+
+A day can still change after it was compacted (an import of old logs). The
+store then keeps the change as a rollup row on top of the compacted one
+(SQLiteStore.mark_compacted), and merge_rollups adds the two, both when
+reading history and on the next compaction. A SQLite row no newer than the
+compacted row is already part of it.
+
+    python history.py                # compact everything older than 7 days
+    python history.py --keep-days 30
+
+Compaction is safe to rerun after a crash: each file is merged with what
+it already holds and replaced atomically, and only the rows written out
+leave SQLite, afterwards.
+"""
+import argparse
+import datetime
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import servingtable
+import storage
+
+HISTORY_DIR = os.path.join(servingtable.DATA_DIR, "history")
+KEEP_DAYS = 7
+# small row groups let a one-user read skip most of a month file via min/max stats
+ROLLUP_ROW_GROUP = 20_000
+
+
+def _write_atomic(df, path, **kwargs):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def rollup_path(month, history_dir=HISTORY_DIR):
+    return os.path.join(history_dir, "rollups", f"month={month}", "part.parquet")
+
+
+def write_rollups(rollups, month, history_dir=HISTORY_DIR):
+    """Replace one month's rollup file; rows must already be sorted by (user_id, day)."""
+    _write_atomic(rollups, rollup_path(month, history_dir), row_group_size=ROLLUP_ROW_GROUP)
+
+
+def merge_rollups(compacted, recent, keys):
+    """Compacted rollups plus rollup rows from the store for the same days, one row per `keys`."""
+    if "version" not in compacted:  # written before rollups had versions
+        compacted = compacted.assign(version=-1)
+    both = compacted.merge(recent, on=keys, how="outer", suffixes=("_old", ""))
+    newer = (both["version"].fillna(-1) > both["version_old"].fillna(-1)).to_numpy()
+    for column in ("energy_servings", "nutrient_servings"):
+        added = (both[column + "_old"].fillna(0) + both[column].fillna(0)).clip(lower=0)
+        both[column] = np.where(newer, added, both[column + "_old"]).astype(float)
+    both["version"] = np.where(newer, both["version"], both["version_old"]).astype(np.int64)
+    return both[keys + ["energy_servings", "nutrient_servings", "version"]]
+
+
+def _event_partition(day, history_dir):
+    return os.path.join(history_dir, "events", f"day={day}")
+
+
+def write_events(events, day, history_dir=HISTORY_DIR):
+    """Merge one day's events into its partition, by id, so a rerun never duplicates them."""
+    directory = _event_partition(day, history_dir)
+    parts = sorted(f for f in os.listdir(directory) if f.endswith(".parquet")) if os.path.isdir(directory) else []
+    merged = pd.concat([pd.read_parquet(os.path.join(directory, f)) for f in parts] + [events], ignore_index=True)
+    merged = merged.drop_duplicates("id", keep="last").sort_values("id")
+    _write_atomic(merged, os.path.join(directory, "part.parquet"))
+    for f in parts:  # older part-<first>-<last> files, now in part.parquet
+        if f != "part.parquet":
+            os.remove(os.path.join(directory, f))
+
+
+def compact(store, keep_days=KEEP_DAYS, history_dir=HISTORY_DIR, today=None):
+    """Move events and rollups for days before today - keep_days to Parquet.
+
+    `store` is a SQLiteStore. Returns (events moved, rollup rows moved).
+    """
+    today = today or datetime.date.today()
+    cutoff = (today - datetime.timedelta(days=keep_days)).isoformat()
+
+    # first, so a write to these days from here on is kept as a change, not mistaken for the whole day
+    store.mark_compacted(cutoff)
+    events = pd.DataFrame(store.events_before(cutoff), columns=storage.SQLiteStore.EVENT_COLUMNS)
+    rollups = pd.DataFrame(store.rollups_before(cutoff), columns=storage.SQLiteStore.ROLLUP_COLUMNS)
+    if events.empty and rollups.empty:
+        return 0, 0
+
+    for day, part in events.groupby("day"):
+        write_events(part.drop(columns="day"), day, history_dir)
+
+    for month, part in rollups.groupby(rollups["day"].str[:7]):
+        path = rollup_path(month, history_dir)
+        old = pd.read_parquet(path) if os.path.exists(path) else rollups.iloc[:0]
+        part = merge_rollups(old, part, ["user_id", "day"])
+        write_rollups(part.sort_values(["user_id", "day"]), month, history_dir)
+
+    store.delete_compacted(events["id"], rollups.itertuples(index=False))
+    return len(events), len(rollups)
+
+
+@functools.lru_cache(maxsize=256)
+def _user_row_groups(path, mtime):
+    """(min user_id, max user_id) of each row group in a rollup file, from its footer stats."""
+    meta = pq.ParquetFile(path).metadata
+    col = meta.schema.names.index("user_id")
+    bounds = []
+    for i in range(meta.num_row_groups):
+        stats = meta.row_group(i).column(col).statistics
+        bounds.append((stats.min, stats.max) if stats is not None and stats.has_min_max else (None, None))
+    return bounds
+
+
+def _read_month(path, start, end, user_id):
+    if user_id is None:
+        table = pq.read_table(path)
+    else:
+        bounds = _user_row_groups(path, os.path.getmtime(path))
+        groups = [i for i, (lo, hi) in enumerate(bounds) if lo is None or lo <= user_id <= hi]
+        table = pq.ParquetFile(path).read_row_groups(groups)
+        table = table.filter(pc.equal(table["user_id"], user_id))
+    days = table["day"]
+    return table.filter(pc.and_(pc.greater_equal(days, start), pc.less_equal(days, end))).to_pandas()
+
+
+def read_rollups(start, end, user_id=None, history_dir=HISTORY_DIR):
+    """Compacted daily rollups with start <= day <= end (ISO dates), optionally for one user."""
+    frames = []
+    month = start[:7]
+    while month <= end[:7]:
+        path = rollup_path(month, history_dir)
+        if os.path.exists(path):
+            frames.append(_read_month(path, start, end, user_id))
+        year, mon = int(month[:4]), int(month[5:])
+        month = f"{year + mon // 12}-{mon % 12 + 1:02d}"
+    if not frames:
+        return pd.DataFrame(columns=storage.SQLiteStore.ROLLUP_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def day_history(store, user_id, start, end, history_dir=HISTORY_DIR):
+    """One user's daily tallies for start..end, from Parquet and whatever is still in the store."""
+    old = read_rollups(start, end, user_id, history_dir).drop(columns="user_id")
+    recent = pd.DataFrame(
+        store.history(user_id, start, end), columns=["day", "energy_servings", "nutrient_servings", "version"]
+    )
+    days = merge_rollups(old, recent, ["day"]).drop(columns="version")
+    return days.sort_values("day").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old tally events and rollups to Parquet.")
+    parser.add_argument("--db", default=storage.DEFAULT_DB_FILE)
+    parser.add_argument("--keep-days", type=int, default=KEEP_DAYS)
+    parser.add_argument("--history-dir", default=HISTORY_DIR)
+    args = parser.parse_args()
+
+    events, rollups = compact(storage.SQLiteStore(args.db), args.keep_days, args.history_dir)
+    print(f"Compacted {events} events and {rollups} daily rollups into {args.history_dir}")
+
+
+if __name__ == "__main__":
+    main()
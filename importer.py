@@ -0,0 +1,284 @@
+"""Import a food log exported from another calorie tracker into a user's tally.
+
+    python importer.py cronometer_servings.csv --user alice
+    python importer.py loseit.csv --user alice --calories 2500 --dry-run
+
+Exports name their columns differently, so the day, food name, amount,
+unit and calories columns are found by name (COLUMNS). Food names are
+normalized: brand prefixes, parenthesized notes and punctuation are
+dropped. Amounts like "2 Cup(s)" become "2 cup". Each distinct name is
+then matched to an FNDDS food code through the search index. The match's
+confidence is the IDF cosine of the name and the food's description
+(searchindex.FoodIndex.cosine): 1 when they have the same words, 0 when
+none are shared. A large file's names are matched in a
+process pool. Matched entries get servings from the serving table via
+batch.convert_codes. When the export's unit means nothing here ("1
+serving" of the other app's serving), the entry's calories are used
+instead.
+
+The file is read in chunks of CHUNK_SIZE rows. Each chunk's entries are
+written with one TallyService.increment_many per day, so each is a
+single transaction. The store is flushed before the next chunk is read.
+Entries that can't be imported are written to a report CSV with the
+line, the reason and the closest match when there is one.
+
+Imports usually write days long past. Those days may already be in
+Parquet (history.py), and the store keeps such writes as changes on top
+of the compacted rollups. Every write changes the user's store version,
+so cached trends (analytics.py) pick the imported days up.
+
+Importing is idempotent. Each row's source is a hash of its cells plus
+how many identical rows came before it in the file, and the store skips
+a source the user already has (storage.Op.source). Importing the same
+export twice, or a later export that overlaps it, adds only the new
+rows.
+"""
+import argparse
+import collections
+import concurrent.futures
+import functools
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import batch
+import engine
+import matcher
+import mealparser
+import servingtable
+import storage
+import tallyservice
+
+CHUNK_SIZE = 10_000
+# matches below this confidence are imported but listed in the report for review; tuned on
+# the labeled export names in tests/test_importer.py (49 of 58 flagged right)
+REVIEW_SCORE = 0.64
+ORIGIN = "import"
+# first column present wins; names compared lowercased
+COLUMNS = {
+    "day": ["date", "day", "date logged"],
+    "food": ["food name", "food", "name", "description", "item", "food item"],
+    "amount": ["amount", "quantity", "qty", "servings", "serving size"],
+    "unit": ["unit", "units", "serving unit"],
+    "calories": ["calories", "energy (kcal)", "kcal", "energy"],
+}
+# units that are another app's own serving: converted from calories instead
+THEIR_SERVING = {"serving", "servings", "portion", "portions", "each", "item", "items", "container", "package"}
+
+BRAND_RE = re.compile(r"^[^,]{1,40}? - ")
+NOTE_RE = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+PUNCTUATION_RE = re.compile(r"[^a-z0-9%&' ]+")
+PLURAL_RE = re.compile(r"\((?:s|es)\)")
+
+
+def find_columns(header):
+    """{field: column name} for the fields found in an export's header."""
+    lower = {c.strip().lower(): c for c in header}
+    found = {}
+    for field, names in COLUMNS.items():
+        column = next((lower[n] for n in names if n in lower), None)
+        if column is not None:
+            found[field] = column
+    for field in ("day", "food"):
+        if field not in found:
+            raise ValueError(f"no {field} column; expected one of {COLUMNS[field]}")
+    return found
+
+
+@functools.lru_cache(maxsize=None)
+def normalize_name(name):
+    """"Kirkland - Greek Yogurt, Plain (Nonfat)" -> "greek yogurt plain"."""
+    name = NOTE_RE.sub(" ", BRAND_RE.sub("", name.strip())).lower()
+    return " ".join(PUNCTUATION_RE.sub(" ", name).split())
+
+
+@functools.lru_cache(maxsize=None)
+def normalize_amount(amount, unit=""):
+    """"1.00", "Cup(s)" -> "1 cup"; None for their own servings (see THEIR_SERVING)."""
+    text = PLURAL_RE.sub("", f"{amount} {unit}".lower())
+    words = text.replace(",", "").split()
+    if any(w in THEIR_SERVING for w in words):
+        return None
+    return " ".join(words)
+
+
+def match_names(names):
+    """(food_code or -1, confidence) for each normalized name."""
+    parser = engine.meal_parser()
+    out = []
+    for name in names:
+        hit = parser.find(name.split()) if name else None
+        if hit is None:
+            out.append((-1, 0.0))
+            continue
+        confidence = parser.index.cosine(mealparser.alias_text(name.split()))[hit[0]]
+        out.append((int(parser.index.codes[hit[0]]), round(float(confidence), 3)))
+    return out
+
+
+class NameMatcher:
+    """Matches each distinct name once, in a process pool when there are many new ones."""
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.matches = {}
+        self.pool = None
+
+    def __call__(self, names):
+        pending = [n for n in dict.fromkeys(names) if n not in self.matches]
+        if len(pending) < matcher.PARALLEL_MIN:
+            found = match_names(pending)
+        else:
+            if self.pool is None:
+                self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+            chunks = [pending[i:i + matcher.CHUNK_SIZE] for i in range(0, len(pending), matcher.CHUNK_SIZE)]
+            found = [m for chunk in self.pool.map(match_names, chunks) for m in chunk]
+        self.matches.update(zip(pending, found))
+        return [self.matches[n] for n in names]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    with pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, skipinitialspace=True) as reader:
+        yield from reader
+
+
+def convert(chunk, columns, names, serving_kcal=None):
+    """Entries of one export chunk: day, food code, score, servings and status per row."""
+    def get(field):
+        return chunk[columns[field]] if field in columns else pd.Series("", index=chunk.index)
+
+    foods = get("food").map(normalize_name)
+    codes, scores = zip(*names(foods.tolist())) if len(chunk) else ((), ())
+    codes = np.array(codes, dtype=np.int64)
+    amounts = [normalize_amount(a or "1", u) for a, u in zip(get("amount"), get("unit"))]
+    theirs = np.array([a is None for a in amounts], dtype=bool)
+    amounts = ["1" if a is None else a for a in amounts]
+    out = batch.convert_codes(pd.DataFrame({"food": foods.to_numpy(), "amount": amounts}), codes, serving_kcal)
+    out.index = chunk.index
+    out["score"] = scores
+    out["original"] = get("food").to_numpy()
+    out["original_amount"] = (get("amount") + " " + get("unit")).str.strip().to_numpy()
+    out["day"] = pd.to_datetime(get("day"), format="mixed", errors="coerce").dt.strftime("%Y-%m-%d")
+
+    # their own servings (or units we can't weigh): go by the export's calories
+    calories = pd.to_numeric(get("calories").str.replace(",", ""), errors="coerce").to_numpy(dtype=float)
+    table = engine.serving_table(serving_kcal).reindex(codes)
+    serving_kcal_of = table["kcal"].to_numpy(dtype=float)
+    by_kcal = (theirs | (out["status"] == "no unit").to_numpy()) & (calories >= 0) & (serving_kcal_of > 0)
+    servings = np.round(calories / np.where(serving_kcal_of > 0, serving_kcal_of, np.nan), 2)
+    energy = (table["density"] == "Energy-dense").to_numpy()
+    out.loc[by_kcal, "grams"] = np.round(servings * table["grams"].to_numpy(dtype=float), 1)[by_kcal]
+    out.loc[by_kcal, "energy_servings"] = np.where(energy, servings, 0.0)[by_kcal]
+    out.loc[by_kcal, "nutrient_servings"] = np.where(energy, 0.0, servings)[by_kcal]
+    out.loc[by_kcal, "status"] = "ok"
+    # their serving and no calories to go by: the amount means nothing here
+    out.loc[theirs & ~by_kcal & (out["status"] == "ok").to_numpy(), "status"] = "no unit"
+    ok = (out["status"] == "ok").to_numpy()
+    # "0 kcal" or a zero amount: nothing to add, and nothing the store would remember as imported
+    out.loc[ok & ((out["energy_servings"] + out["nutrient_servings"]) <= 0).to_numpy(), "status"] = "zero servings"
+    out.loc[out["day"].isna().to_numpy() & (out["status"] == "ok").to_numpy(), "status"] = "bad date"
+    return out
+
+
+def row_sources(chunk, seen):
+    """Source of each row: hash of its cells, then its count among identical rows so far (`seen`)."""
+    sources = []
+    for h in pd.util.hash_pandas_object(chunk, index=False).to_numpy():
+        sources.append(f"{h:016x}-{seen[h]}")
+        seen[h] += 1
+    return sources
+
+
+def entries_by_day(rows):
+    """{day: ([(density, servings, food)], [source])} for TallyService.increment_many."""
+    by_day = {}
+    for row in rows.itertuples(index=False):
+        servings = row.energy_servings if row.density == "Energy-dense" else row.nutrient_servings
+        food = {
+            "code": int(row.food_code), "name": row.description, "density": row.density,
+            "amt": float(servings), "grams": round(float(row.grams)),
+        }
+        entries, sources = by_day.setdefault(row.day, ([], []))
+        entries.append((row.density, float(servings), food))
+        sources.append(row.source)
+    return by_day
+
+
+REPORT_COLUMNS = ["line", "day", "original", "original_amount", "status", "food_code", "description", "score"]
+
+
+def run(path, service, user_id, serving_kcal=None, report=None, workers=None, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Import `path` into `user_id`'s log and return counts of rows read, imported, to review,
+    already imported and not imported.
+
+    Rows not imported, or imported from a low-confidence match, are written to the `report` file.
+    """
+    result = {"rows": 0, "imported": 0, "review": 0, "already_imported": 0, "not_imported": 0}
+    names = NameMatcher(workers)
+    seen = collections.Counter()
+    header = True
+    try:
+        for chunk in read_chunks(path, chunk_size):
+            columns = find_columns(chunk.columns)
+            out = convert(chunk, columns, names, serving_kcal)
+            out["source"] = row_sources(chunk, seen)
+            ok = (out["status"] == "ok").to_numpy()
+            already = ok & out["source"].isin(service.store.imported(user_id, out.loc[ok, "source"])).to_numpy()
+            ok = ok & ~already
+            review = ok & (out["score"] < REVIEW_SCORE).to_numpy()
+            out.loc[review, "status"] = "imported, check match"
+            if not dry_run:
+                for day, (entries, sources) in entries_by_day(out[ok]).items():
+                    service.increment_many(user_id, day, entries, origin=ORIGIN, sources=sources)
+                service.store.flush()
+            failed = ~ok & ~already
+            result["rows"] += len(out)
+            result["imported"] += int(ok.sum())
+            result["review"] += int(review.sum())
+            result["already_imported"] += int(already.sum())
+            result["not_imported"] += int(failed.sum())
+            if report is not None:
+                problems = out[failed | review].assign(line=out.index[failed | review] + 2)  # 1-based, after the header
+                problems.reindex(columns=REPORT_COLUMNS).to_csv(report, index=False, header=header)
+                header = False
+    finally:
+        names.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a food log CSV exported from another tracker.")
+    parser.add_argument("path", help="CSV export with a food name column and optionally date, amount, unit, calories")
+    parser.add_argument("--user", required=True, help="user id to import into")
+    parser.add_argument("--calories", type=int, help="daily calorie target the user's servings are sized for")
+    parser.add_argument("--report", help="CSV of entries not imported or to check (default: <path>.report.csv)")
+    parser.add_argument("--workers", type=int, help="processes for matching food names (default: one per core)")
+    parser.add_argument("--dry-run", action="store_true", help="match and convert, but write nothing")
+    args = parser.parse_args()
+
+    serving_kcal = servingtable.personal_serving_kcal(args.calories) if args.calories else None
+    report_path = args.report or os.path.splitext(args.path)[0] + ".report.csv"
+    service = tallyservice.TallyService(storage.open_store())
+    start = time.perf_counter()
+    with open(report_path, "w", newline="") as report:
+        result = run(args.path, service, args.user, serving_kcal, report, args.workers, args.dry_run)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{result['rows']} entries in {elapsed:.1f} s: {result['imported']} imported"
+        f"{' (dry run)' if args.dry_run else ''}, {result['review']} of them to check, "
+        f"{result['already_imported']} already imported, {result['not_imported']} not imported. "
+        f"Report: {report_path}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
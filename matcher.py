@@ -0,0 +1,177 @@
+"""Map foods from FoodData Central, Nutritionix and Open Food Facts to FNDDS food codes.
+
+Each source result is first flattened into an `ExternalFood` (description,
+category words, kcal per 100 g). The FNDDS search index narrows the catalog
+to rows sharing a word with the description, then the best one is picked on
+text similarity plus category and calorie agreement. Once a result has a
+food_code it can use the serving table and serving rules like any FNDDS food.
+
+`resolve_many` does the same for thousands of results on all cores and keeps
+what it has matched in a JSONL cache, so each external id is only resolved once.
+"""
+import concurrent.futures
+import functools
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+import searchindex
+import servingtable
+
+MATCH_CACHE_FILE = os.path.join(servingtable.DATA_DIR, "match_cache.jsonl")
+# below this score an external food is left unmatched
+MIN_SCORE = 0.35
+# weight of calorie agreement, when both sides know their kcal per 100 g
+KCAL_WEIGHT = 0.2
+# batches smaller than this aren't worth starting worker processes for
+PARALLEL_MIN = 2000
+CHUNK_SIZE = 250
+
+# Nutritionix tags.food_group -> category words the FNDDS index knows
+NUTRITIONIX_FOOD_GROUPS = {
+    1: "dairy",
+    2: "meat poultry fish egg",
+    3: "fruit",
+    4: "vegetable",
+    5: "grain",
+    6: "fat oil",
+    7: "legume",
+}
+
+
+class ExternalFood(NamedTuple):
+    source: str
+    id: str
+    description: str
+    category: str = ""
+    kcal_per_100g: float | None = None
+
+    @property
+    def key(self):
+        return f"{self.source}:{self.id}"
+
+
+class Match(NamedTuple):
+    food_code: int
+    description: str
+    score: float
+
+
+# ---------------- Source adapters ---------------- #
+
+def from_fdc(food):
+    """A food from the FDC /foods/search response."""
+    kcal = None
+    for n in food.get("foodNutrients", []):
+        name = n.get("nutrientName") or n.get("nutrient", {}).get("name", "")
+        unit = (n.get("unitName") or "").lower()
+        if name and "energy" in name.lower() and unit != "kj" and "kj" not in name.lower():
+            kcal = n.get("value")
+            break
+    return ExternalFood("fdc", str(food["fdcId"]), food["description"], food.get("foodCategory") or "", kcal)
+
+
+def from_nutritionix(item):
+    """A food from the Nutritionix /natural/nutrients response."""
+    kcal = None
+    if item.get("nf_calories") is not None and item.get("serving_weight_grams"):
+        kcal = item["nf_calories"] / item["serving_weight_grams"] * 100
+    tags = item.get("tags") or {}
+    item_id = item.get("nix_item_id") or tags.get("tag_id") or item["food_name"]
+    category = NUTRITIONIX_FOOD_GROUPS.get(tags.get("food_group"), "")
+    return ExternalFood("nutritionix", str(item_id), item["food_name"], category, kcal)
+
+
+def from_off(product):
+    """A product from the Open Food Facts search response."""
+    # OFF lists categories general -> specific; the last one says the most
+    categories = [c.strip() for c in (product.get("categories") or "").split(",") if c.strip()]
+    kcal = (product.get("nutriments") or {}).get("energy-kcal_100g")
+    return ExternalFood(
+        "off", str(product.get("code", "")), product.get("product_name") or "",
+        categories[-1] if categories else "", kcal,
+    )
+
+
+# ---------------- Matching ---------------- #
+
+class Matcher:
+    def __init__(self, foods_df, nutrients_df):
+        self.index = searchindex.FoodIndex(foods_df)
+        kcal = nutrients_df.drop_duplicates("food_code").set_index("food_code")["energy_kcal"]
+        self.kcal = kcal.reindex(self.index.codes).to_numpy(dtype=float)
+
+    def resolve(self, food):
+        """Best FNDDS Match for an ExternalFood, or None when nothing is close enough."""
+        scores = self.index.scores(food.description, food.category)
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return None
+        scores = scores[hits]
+        if food.kcal_per_100g:
+            row_kcal = self.kcal[hits]
+            known = ~np.isnan(row_kcal)
+            gap = np.abs(row_kcal[known] - food.kcal_per_100g) / np.maximum(row_kcal[known], food.kcal_per_100g)
+            scores[known] += KCAL_WEIGHT * (1 - np.minimum(1, gap))
+        best = np.argmax(scores)
+        if scores[best] < MIN_SCORE:
+            return None
+        row = hits[best]
+        return Match(int(self.index.codes[row]), self.index.descriptions[row], round(float(scores[best]), 3))
+
+
+@functools.lru_cache(maxsize=1)
+def default_matcher():
+    foods_df, nutrients_df, _ = servingtable.load_data()
+    return Matcher(foods_df, nutrients_df)
+
+
+def resolve(food):
+    return default_matcher().resolve(food)
+
+
+# ---------------- Batch ---------------- #
+
+def _resolve_chunk(foods):
+    matcher = default_matcher()  # built once per worker process
+    return [matcher.resolve(f) for f in foods]
+
+
+def load_cache(path):
+    cache = {}
+    if not os.path.exists(path):
+        return cache
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            cache[entry["key"]] = Match(*entry["match"]) if entry["match"] else None
+    return cache
+
+
+def resolve_many(foods, cache_path=MATCH_CACHE_FILE, workers=None):
+    """Resolve ExternalFoods in bulk; returns {food.key: Match or None}.
+
+    Keys already in the cache file are not resolved again; new results are
+    appended to it.
+    """
+    cache = load_cache(cache_path) if cache_path else {}
+    pending = list({f.key: f for f in foods if f.key not in cache}.values())
+
+    if len(pending) < PARALLEL_MIN:
+        matches = _resolve_chunk(pending)
+    else:
+        chunks = [pending[i:i + CHUNK_SIZE] for i in range(0, len(pending), CHUNK_SIZE)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            matches = [m for chunk in pool.map(_resolve_chunk, chunks) for m in chunk]
+
+    if cache_path and pending:
+        with open(cache_path, "a") as f:
+            for food, match in zip(pending, matches):
+                f.write(json.dumps({"key": food.key, "match": match}) + "\n")
+    cache.update((food.key, match) for food, match in zip(pending, matches))
+    return {f.key: cache[f.key] for f in foods}
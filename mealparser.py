@@ -0,0 +1,214 @@
+"""Free-text meals ("2 cups rice and an apple") to FNDDS foods and servings, offline.
+
+A phrase is split into items on commas, "and", "plus" and new lines. Each
+item is read as [quantity] [unit] [of] food. The food words are looked up
+in the FNDDS search index (matcher.default_matcher), and the amount is
+converted to grams through the unit table (units.py). Servings are grams
+over the grams in one serving from the serving table. This replaces the
+Nutritionix /natural/nutrients round trip the older scripts make per entry.
+
+    python mealparser.py log.txt > parsed.csv    # one meal per line, optional "YYYY-MM-DD:" prefix
+"""
+import functools
+import re
+import sys
+from typing import NamedTuple
+
+import pandas as pd
+
+import matcher
+import portions
+import servingtable
+import units
+from searchindex import singular
+
+# "and" splits items except inside "one and a half"
+ITEM_SPLIT_RE = re.compile(r"\s*(?:[,;\n&]|\band\b(?!\s+(?:a\s+)?half\b)|\bplus\b)\s*", re.IGNORECASE)
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "dozen": 12, "half": 0.5, "quarter": 0.25,
+    "couple": 2, "few": 3, "some": 1,
+}
+# spelled-out units -> unit table names
+UNIT_WORDS = {
+    "cup": "cup", "c": "cup", "tablespoon": "tbsp", "tbsp": "tbsp", "tbs": "tbsp", "tbl": "tbsp",
+    "teaspoon": "tsp", "tsp": "tsp", "ounce": "oz", "oz": "oz", "pound": "lb", "lb": "lb", "lbs": "lb",
+    "gram": "g", "g": "g", "gr": "g", "kilogram": "kg", "kg": "kg", "milligram": "mg", "mg": "mg",
+    "milliliter": "ml", "ml": "ml", "liter": "l", "l": "l", "pint": "pint", "quart": "quart",
+}
+# units of the food's own portions, tried when the text names one ("2 slices bread")
+PORTION_WORDS = {
+    "slice", "piece", "bowl", "glass", "can", "bottle", "bar",
+    "stick", "scoop", "handful", "link", "patty", "egg", "fillet", "leaf", "strip", "wedge",
+}
+SIZE_WORDS = {"small", "medium", "large"}
+# a food measured in one of these but not the other ("a slice of pizza" is its "1 piece")
+INTERCHANGEABLE_UNITS = {"slice": "piece", "piece": "slice"}
+# one counted item with no unit ("an apple") is this portion when the food has it
+DEFAULT_COUNT_UNITS = ("medium", "piece", "large", "small")
+# everyday names the FNDDS descriptions don't use
+ALIASES = {"egg": "egg whole", "eggs": "egg whole", "coke": "cola", "pepsi": "cola", "soda": "soft drink", "pop": "soft drink", "oj": "orange juice"}
+DATE_RE = re.compile(r"^\s*(\d{4}-\d{2}-\d{2})\s*[:\-]?\s*")
+
+
+class ParsedItem(NamedTuple):
+    text: str
+    quantity: float
+    unit: str
+    food_code: int
+    description: str
+    score: float
+    grams: float
+    density: str
+    servings: float
+
+
+def split_items(text):
+    return [item for item in ITEM_SPLIT_RE.split(text) if item.strip()]
+
+
+def read_quantity(words):
+    """(quantity, remaining words) from the front of an item; 1 when no amount is given.
+
+    Handles "2", "1 1/2", "two", "a", "half a", "one and a half".
+    """
+    quantity = None
+    while words:
+        word = words[0].lower()
+        following = words[1].lower() if len(words) > 1 else ""
+        if word in ("a", "an", "and") and (quantity is not None or following in ("half", "quarter")):
+            words = words[1:]
+            continue
+        if word in NUMBER_WORDS:
+            value = NUMBER_WORDS[word]
+            if quantity is not None and value >= 1:
+                break
+            quantity = value if quantity is None else quantity + value
+            words = words[1:]
+            continue
+        parsed, rest = portions.parse_quantity(" ".join(words))
+        if parsed != parsed or quantity is not None:
+            break
+        quantity, words = parsed, rest.split()
+    return (1.0 if quantity is None else float(quantity)), words
+
+
+def read_unit(words):
+    """(unit, remaining words): a measure or portion word at the front, then an optional 'of'."""
+    if not words:
+        return "", words
+    word = re.sub(r"[.]$", "", words[0].lower())
+    if " ".join(w.lower() for w in words[:2]) in ("fl oz", "fluid ounce", "fluid ounces"):
+        unit, words = "fl oz", words[2:]
+    elif singular(word) in UNIT_WORDS or word in UNIT_WORDS:
+        unit, words = UNIT_WORDS.get(word) or UNIT_WORDS[singular(word)], words[1:]
+    elif (singular(word) in PORTION_WORDS or word in SIZE_WORDS) and len(words) > 1:
+        unit, words = singular(word), words[1:]
+    else:
+        return "", words
+    if words and words[0].lower() == "of":
+        words = words[1:]
+    return unit, words
+
+
+def trailing_unit(words):
+    """("pizza slice" -> "slice", ["pizza"]) when an item ends in a portion word."""
+    if len(words) > 1 and singular(words[-1].lower()) in PORTION_WORDS:
+        return singular(words[-1].lower()), words[:-1]
+    return "", words
+
+
+def alias_text(words):
+    """The words as the index is searched for them: "oj" -> "orange juice"."""
+    return " ".join(ALIASES.get(w.lower(), w) for w in words)
+
+
+class MealParser:
+    def __init__(self, index, unit_table, serving_table):
+        self.index = index
+        self.unit_table = unit_table
+        self.serving_table = serving_table
+
+    def grams_for(self, code, quantity, unit, words=()):
+        """Grams of `quantity` `unit` of a food; unknown units count as servings.
+
+        With no unit the count is of whole items: a portion named after the
+        food ("1 banana") if it has one, else a medium one, a piece, ...
+        """
+        if not unit:
+            for count_unit in [singular(w.lower()) for w in words] + list(DEFAULT_COUNT_UNITS):
+                if self.unit_table.grams_per_unit(code, count_unit):
+                    unit = count_unit
+                    break
+        if unit in INTERCHANGEABLE_UNITS and not self.unit_table.grams_per_unit(code, unit):
+            unit = INTERCHANGEABLE_UNITS[unit]
+        grams = self.unit_table.to_grams(code, quantity, unit) if unit else None
+        if grams is None:
+            return quantity * float(self.serving_table.at[code, "grams"])
+        return grams
+
+    def find(self, words):
+        """(row, score) of the food the words name, or None."""
+        # the index already prefers the plain food and skips baby food (searchindex.PLAIN_BONUS)
+        best = self.index.search(alias_text(words), k=1)
+        return best[0] if best and best[0][1] >= matcher.MIN_SCORE else None
+
+    def parse_item(self, text):
+        """One ParsedItem, or None when no FNDDS food matches the words."""
+        quantity, words = read_quantity(text.split())
+        unit, words = read_unit(words)
+        if not unit or unit in SIZE_WORDS:
+            # "a large pizza slice": the slice is the unit, the size is just a word
+            trailing, rest = trailing_unit(words)
+            if trailing:
+                unit, words = trailing, rest
+        hit = self.find(words)
+        if hit is None:
+            return None
+        row, score = hit
+        code = int(self.index.codes[row])
+        serving = self.serving_table.loc[code]
+        grams = self.grams_for(code, quantity, unit, words)
+        servings = grams / serving["grams"] if serving["grams"] else 0.0
+        return ParsedItem(
+            text.strip(), quantity, unit, code, self.index.descriptions[row], round(score, 3),
+            round(grams, 1), serving["density"], round(float(servings), 2),
+        )
+
+    def parse(self, text):
+        """ParsedItems for every item of a meal description (unmatched items are left out)."""
+        return [item for item in map(self.parse_item, split_items(text)) if item is not None]
+
+    def parse_log(self, lines):
+        """DataFrame of parsed items for a text log, with the line number and any date prefix."""
+        rows = []
+        unmatched = []
+        for lineno, line in enumerate(lines, 1):
+            date = DATE_RE.match(line)
+            day = date.group(1) if date else None
+            for text in split_items(line[date.end():] if date else line):
+                item = self.parse_item(text)
+                if item is None:
+                    unmatched.append((lineno, text))
+                    continue
+                rows.append({"line": lineno, "day": day, **item._asdict()})
+        parsed = pd.DataFrame(rows, columns=["line", "day", *ParsedItem._fields])
+        parsed.attrs["unmatched"] = unmatched
+        return parsed
+
+
+@functools.lru_cache(maxsize=1)
+def default_parser():
+    return MealParser(matcher.default_matcher().index, units.default_units(), servingtable.serving_table())
+
+
+def parse_meal(text):
+    return default_parser().parse(text)
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) if len(sys.argv) > 1 else sys.stdin as f:
+        parsed = default_parser().parse_log(f)
+    parsed.to_csv(sys.stdout, index=False)
+    for lineno, text in parsed.attrs["unmatched"]:
+        print(f"line {lineno}: no match for {text!r}", file=sys.stderr)
@@ -0,0 +1,147 @@
+"""A day of foods that meets the serving goals with good nutrient coverage.
+
+Candidates are pooled once per WWEIA category: the POOL_SIZE foods with a
+named-unit serving and the best nutrient score per 100 kcal. A plan is then
+built greedily, one serving at a time. Each step adds the candidate that
+most raises coverage of the daily targets (capped at 100% per nutrient),
+minus the amount that limit nutrients go over. The step is one
+vector operation over all pooled candidates, so a plan takes milliseconds.
+Servings are sized in kcal, so meeting the serving goals also keeps the
+day's calories at the target.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+import nutrients
+import servingtable
+
+POOL_SIZE = 12
+# foods from one WWEIA category in a plan; 3 still fills the goals at 10,000 kcal
+MAX_PER_CATEGORY = 3
+# random jitter on each step's gains, so "another plan" gives a different day
+JITTER = 0.15
+# baby foods and formula (9000+), alcohol, waters, diet drinks, fats, cream and toppings,
+# condiments, candy, sugars and sweeteners, pie fillings
+EXCLUDED_CATEGORIES = {
+    5702, 5704, 7102, 7104, 7106, 7502, 7504, 7506, 7702, 7704, 7802, 7804,
+    8002, 8004, 8006, 8010, 8012, 8402, 8404, 8406, 8408, 8802, 8804, 8806,
+}
+
+
+class CandidatePools:
+    """Pooled candidate foods with their per-100 g nutrients, computed once."""
+
+    def __init__(self, foods_df, matrix, serving_table, pool_size=POOL_SIZE):
+        energy = matrix.values[:, matrix.columns.index(nutrients.FIRST_NUTRIENT)]
+        category = (
+            foods_df.drop_duplicates("food_code").set_index("food_code")["wweia_category_number"]
+            .reindex(matrix.codes).to_numpy()
+        )
+        unit = serving_table["unit"].reindex(matrix.codes).to_numpy()
+        ok = (
+            (energy > 0) & (unit != "g") & pd.notna(unit)
+            & ~np.isin(category, list(EXCLUDED_CATEGORIES)) & (category < 9000)
+        )
+        rows = np.flatnonzero(ok)
+
+        self.columns = list(nutrients.DAILY_TARGETS)
+        cols = [matrix.columns.index(c) for c in self.columns]
+        self.is_limit = np.array([c in nutrients.LIMITS for c in self.columns])
+        per_kcal = matrix.values[rows][:, cols] / energy[rows, None]
+        # score at the reference diet: share of each target in 100 kcal, limits counted against
+        targets = np.array([nutrients.DAILY_TARGETS[c] for c in self.columns], dtype=float)
+        share = np.minimum(per_kcal * 100 / targets, 1.0)
+        score = np.where(self.is_limit, -share, share).sum(axis=1)
+
+        # best POOL_SIZE per category
+        order = np.lexsort((-score, category[rows]))
+        rows = rows[order]
+        rank = np.arange(len(rows)) - np.searchsorted(category[rows], category[rows])
+        self.rows = rows[rank < pool_size]
+        self.codes = matrix.codes[self.rows]
+        self.category = category[self.rows]
+        self.per_100g = matrix.values[self.rows][:, cols]
+        self.names = (
+            foods_df.drop_duplicates("food_code").set_index("food_code")["main_food_description"]
+            .reindex(self.codes).astype(str)
+        )
+
+
+@functools.lru_cache(maxsize=1)
+def default_pools():
+    foods_df, _, _ = servingtable.load_data()
+    return CandidatePools(foods_df, nutrients.default_matrix(), servingtable.serving_table())
+
+
+def plan_day(energy_servings, nutrient_servings, daily_calories=servingtable.REFERENCE_CALORIES,
+             serving_table=None, exclude=(), seed=None, pools=None):
+    """Foods and amounts that add up to the serving goals.
+
+    `exclude` is a list of words; foods whose description contains any of them
+    are left out. Returns (plan, shortfall): a DataFrame with food_code,
+    description, density, amt, units, unit, grams and kcal per item (amounts in
+    servings of `serving_table`, the default serving sizes if None), and
+    {density: servings of the goal no food was left to fill}.
+    """
+    pools = default_pools() if pools is None else pools
+    table = servingtable.serving_table() if serving_table is None else serving_table
+    rng = np.random.default_rng(seed)
+
+    serving = table.reindex(pools.codes)
+    per_serving = pools.per_100g * serving["grams"].to_numpy(dtype=float)[:, None] / 100.0
+    is_energy = (serving["density"] == "Energy-dense").to_numpy()
+    available = serving["kcal"].to_numpy() > 0
+    for word in exclude:
+        available &= ~pools.names.str.contains(word.strip(), case=False, regex=False).to_numpy()
+
+    targets = nutrients.targets_for(daily_calories)
+    target = np.array([targets[c] for c in pools.columns], dtype=float)
+    totals = np.zeros(len(target))
+    used = {}  # category -> foods picked from it
+    remaining = {True: float(energy_servings), False: float(nutrient_servings)}
+    shortfall = {True: 0.0, False: 0.0}
+    picked = []
+
+    def value(t):
+        coverage = np.minimum(t / target, 1.0)
+        over = np.maximum(t / target - 1.0, 0.0)
+        return np.where(pools.is_limit, -over, coverage).sum(axis=-1)
+
+    while max(remaining.values()) >= 0.25:
+        # fill whichever goal is further from done
+        energy = remaining[True] >= remaining[False]
+        amt = min(1.0, np.floor(remaining[energy] * 4) / 4)
+        mask = available & (is_energy == energy)
+        if not mask.any():
+            shortfall[energy], remaining[energy] = remaining[energy], 0.0
+            continue
+        gain = value(totals + amt * per_serving) - value(totals)
+        gain = gain * (1 + JITTER * rng.random(len(gain)))
+        best = int(np.argmax(np.where(mask, gain, -np.inf)))
+        totals += amt * per_serving[best]
+        available[best] = False
+        category = pools.category[best]
+        used[category] = used.get(category, 0) + 1
+        if used[category] >= MAX_PER_CATEGORY:
+            available &= pools.category != category
+        remaining[energy] -= amt
+        picked.append((best, amt))
+
+    rows = []
+    for i, amt in picked:
+        food = serving.iloc[i]
+        units = food["units"] * amt
+        rows.append({
+            "food_code": int(pools.codes[i]),
+            "description": pools.names.iloc[i],
+            "density": food["density"],
+            "amt": amt,
+            "units": units,
+            "unit": food["unit"] if units == 1 else food["unit_plural"],
+            "grams": round(food["grams"] * amt),
+            "kcal": round(food["kcal"] * amt),
+        })
+    plan = pd.DataFrame(rows, columns=["food_code", "description", "density", "amt", "units", "unit", "grams", "kcal"])
+    return plan, {"Energy-dense": shortfall[True], "Nutrient-dense": shortfall[False]}
@@ -0,0 +1,53 @@
+"""Saved meals and recipes: several foods logged in one batch.
+
+A saved meal is a name, its ingredients as (food_code, name, grams) and
+the number of portions it makes. A meal eaten whole has one portion; a
+recipe has more. Logging it logs one portion: each ingredient's grams
+over the portions, in servings of the current serving table. The
+servings of every ingredient are worked out at once with array math over
+the serving table's gram and kcal columns. The result is a list of
+entries for TallyService.increment_many, which applies them as one
+atomic change.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Meal(NamedTuple):
+    name: str
+    items: tuple  # ((food_code, name, grams), ...) for the whole recipe
+    portions: float = 1.0
+
+
+class MealServings(NamedTuple):
+    """One portion of a meal in servings of one serving table."""
+    entries: list  # [(density, servings, food)] per ingredient
+    energy_servings: float
+    nutrient_servings: float
+    grams: float
+    kcal: float
+
+
+def portion_servings(meal, serving_table):
+    """Servings per portion of every ingredient, plus the portion's totals."""
+    codes = np.array([code for code, _, _ in meal.items], dtype=np.int64)
+    grams = np.array([g for _, _, g in meal.items], dtype=float) / meal.portions
+    serving = serving_table.reindex(codes)
+    serving_grams = serving["grams"].to_numpy(dtype=float)
+    servings = np.round(np.divide(grams, serving_grams, out=np.zeros_like(grams), where=serving_grams > 0), 2)
+    kcal = servings * serving["kcal"].to_numpy(dtype=float)
+    density = serving["density"].to_numpy()
+    energy = density == "Energy-dense"
+    entries = [
+        (d, float(n), {"code": int(code), "name": name, "density": d, "amt": float(n), "grams": round(float(g))})
+        for (code, name, _), d, n, g in zip(meal.items, density, servings, grams)
+        if n > 0
+    ]
+    return MealServings(
+        entries,
+        float(servings[energy].sum()),
+        float(servings[~energy].sum()),
+        float(grams.sum()),
+        float(np.nansum(kcal)),
+    )
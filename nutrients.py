@@ -0,0 +1,169 @@
+"""Full nutrient totals for a day's food log.
+
+The FNDDS Nutrient Values table is held as one matrix (foods x nutrients,
+per 100 g). A day's log is a vector of grams per food row, so the day's
+totals are a single product `grams @ matrix / 100`. `DailyTotals` keeps
+those totals and adds one row per newly logged food instead of recomputing.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+import servingtable
+
+# nutrient columns start after the id/category columns
+FIRST_NUTRIENT = "energy_kcal"
+UNITS = ["mcg_rae", "mcg_dfe", "kcal", "mcg", "mg", "g"]
+
+# FDA Daily Values for adults on a 2,000 kcal diet
+DAILY_TARGETS = {
+    "protein_g": 50,
+    "carbohydrate_g": 275,
+    "fiber,_total_dietary_g": 28,
+    "total_fat_g": 78,
+    "fatty_acids,_total_saturated_g": 20,
+    "cholesterol_mg": 300,
+    "sodium_mg": 2300,
+    "potassium_mg": 4700,
+    "calcium_mg": 1300,
+    "iron_mg": 18,
+    "magnesium_mg": 420,
+    "phosphorus_mg": 1250,
+    "zinc_mg": 11,
+    "copper_mg": 0.9,
+    "selenium_mcg": 55,
+    "vitamin_a,_rae_mcg_rae": 900,
+    "vitamin_c_mg": 90,
+    "vitamin_d_d2_+_d3_mcg": 20,
+    "vitamin_e_alpha-tocopherol_mg": 15,
+    "vitamin_k_phylloquinone_mcg": 120,
+    "thiamin_mg": 1.2,
+    "riboflavin_mg": 1.3,
+    "niacin_mg": 16,
+    "vitamin_b-6_mg": 1.7,
+    "folate,_dfe_mcg_dfe": 400,
+    "vitamin_b-12_mcg": 2.4,
+    "choline,_total_mg": 550,
+}
+# targets that are upper limits rather than amounts to reach
+LIMITS = {"fatty_acids,_total_saturated_g", "cholesterol_mg", "sodium_mg"}
+# Daily Values that are set per 2,000 kcal and scale with the calorie target
+ENERGY_SCALED = {
+    "protein_g", "carbohydrate_g", "fiber,_total_dietary_g", "total_fat_g", "fatty_acids,_total_saturated_g",
+}
+
+
+def targets_for(daily_calories, targets=None):
+    """Daily targets with the energy-based ones scaled from 2,000 kcal to `daily_calories`."""
+    targets = DAILY_TARGETS if targets is None else targets
+    scale = daily_calories / 2000
+    return {k: round(v * scale, 1) if k in ENERGY_SCALED else v for k, v in targets.items()}
+
+
+def split_unit(column):
+    """'vitamin_c_mg' -> ('Vitamin c', 'mg')."""
+    for unit in UNITS:
+        if column.endswith("_" + unit):
+            name = column[: -len(unit) - 1]
+            return name.replace("_", " ").capitalize(), unit.replace("_", " ")
+    return column.replace("_", " ").capitalize(), ""
+
+
+class FoodMatrix:
+    """Per-100 g amounts (foods x columns) with a row lookup by food code."""
+
+    def __init__(self, codes, columns, values, serving_table):
+        self.codes = np.asarray(codes)
+        self.columns = list(columns)
+        self.values = values
+        self.row_of = {int(code): i for i, code in enumerate(self.codes)}
+        # grams in one default serving of each row's food (0 when the food has no serving)
+        self.serving_grams = (
+            serving_table["grams"].reindex(self.codes).fillna(0).to_numpy(dtype=float)
+        )
+
+    def entry_grams(self, row, food):
+        # entries record their grams; older ones only servings of the default size
+        if food.get("grams") is not None:
+            return float(food["grams"])
+        return food["amt"] * self.serving_grams[row]
+
+    def log_vector(self, foods):
+        """Grams logged per matrix row for a list of food-log entries ({"code", "amt", "grams"})."""
+        grams = np.zeros(len(self.codes))
+        known = [(self.row_of.get(int(f["code"])), f) for f in foods]
+        known = [(r, self.entry_grams(r, f)) for r, f in known if r is not None]
+        if known:
+            rows, amounts = zip(*known)
+            np.add.at(grams, np.array(rows), np.array(amounts, dtype=float))
+        return grams
+
+    def totals(self, foods):
+        """Nutrient totals for the whole log: one matrix-vector product."""
+        return self.log_vector(foods) @ self.values / 100.0
+
+    def food_totals(self, food):
+        """Nutrients in one food-log entry (zeros if the food isn't in the table)."""
+        row = self.row_of.get(int(food["code"]))
+        if row is None:
+            return np.zeros(len(self.columns))
+        return self.values[row] * (self.entry_grams(row, food) / 100.0)
+
+
+def nutrient_matrix(nutrients_df, serving_table):
+    nutrients_df = nutrients_df.drop_duplicates("food_code")
+    columns = nutrients_df.columns[nutrients_df.columns.get_loc(FIRST_NUTRIENT):]
+    values = nutrients_df[columns].to_numpy(dtype=float, na_value=0.0)
+    return FoodMatrix(nutrients_df["food_code"].to_numpy(), columns, values, serving_table)
+
+
+@functools.lru_cache(maxsize=1)
+def default_matrix():
+    _, nutrients_df, _ = servingtable.load_data()
+    return nutrient_matrix(nutrients_df, servingtable.serving_table())
+
+
+class DailyTotals:
+    """Running totals of a FoodMatrix over one day's log, updated per new entry."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.totals = np.zeros(len(matrix.columns))
+        self.applied = []  # the log entries counted in totals, in log order
+        self.day = None
+
+    def sync(self, day, foods):
+        """Bring the totals up to date with `foods`, the day's log.
+
+        Entries after the ones already counted are added one at a time. When
+        those are no longer the start of the log (another process's entries
+        were written in between, or one went away) the whole log is summed again.
+        """
+        if day != self.day or foods[:len(self.applied)] != self.applied:
+            self.day = day
+            self.totals = self.matrix.totals(foods)
+        else:
+            for food in foods[len(self.applied):]:
+                self.totals += self.matrix.food_totals(food)
+        self.applied = list(foods)
+        return self.totals
+
+    def progress(self, targets=None):
+        """Per-nutrient amount vs daily target, for every nutrient that has a target."""
+        targets = DAILY_TARGETS if targets is None else targets
+        rows = []
+        for column, target in targets.items():
+            if column not in self.matrix.columns:
+                continue
+            amount = self.totals[self.matrix.columns.index(column)]
+            name, unit = split_unit(column)
+            rows.append({
+                "nutrient": name,
+                "amount": amount,
+                "unit": unit,
+                "target": target,
+                "percent": amount / target if target else 0.0,
+                "limit": column in LIMITS,
+            })
+        return pd.DataFrame(rows)
@@ -0,0 +1,142 @@
+"""Structured FNDDS portion descriptions: quantity, unit and modifier.
+
+"1 1/2 cups, cooked, diced" -> quantity 1.5, unit "cup", modifier "cooked, diced".
+Only ~2k of the ~32.6k portion descriptions are distinct, so each distinct
+text is parsed once and the result mapped back onto the portions table as
+typed columns:
+
+    quantity      float, NaN when there is no leading number ("Quantity not specified")
+    unit          canonical singular unit ("tablespoons" -> "tbsp", "slices" -> "slice")
+    modifier      everything else: size words, specs like "12-inch", ", cooked", "(8 fl oz)"
+    label         the description without its quantity, unit in the singular
+    label_plural  the same with the unit in the plural, for amounts other than 1
+"""
+import re
+from typing import NamedTuple
+
+import pandas as pd
+
+from searchindex import singular
+
+# leading "1 1/2", "1/2", "1.5" or "10"
+QUANTITY_RE = re.compile(
+    r"^\s*(?:(?P<whole>\d+(?:\.\d+)?)(?:\s+(?P<num>\d+)/(?P<den>\d+))?|(?P<fnum>\d+)/(?P<fden>\d+))(?=\s|$)"
+)
+# size words and specs ("6 oz", "12-inch", "100 calorie") in front of the unit
+SIZE_WORDS = {"small", "medium", "large", "extra", "jumbo", "miniature", "regular", "mini", "whole"}
+SPEC_RE = re.compile(r"^(?:\d+(?:[./-]\d+)*(?:-\w+|\"|\s+(?:fl\s+)?oz\b|\s+calorie\b)?)\s*", re.IGNORECASE)
+
+# canonical unit names; plural forms are singularized before the lookup
+UNIT_SYNONYMS = {
+    "tablespoon": "tbsp",
+    "tbs": "tbsp",
+    "teaspoon": "tsp",
+    "ounce": "oz",
+    "fluid ounce": "fl oz",
+    "gram": "g",
+    "milliliter": "ml",
+    "liter": "l",
+    "pound": "lb",
+}
+# units written the same in the singular and the plural
+UNCHANGED_PLURAL = {"tbsp", "tsp", "oz", "fl oz", "g", "ml", "l", "lb", "lbs"}
+IRREGULAR = {"halves": "half", "leaves": "leaf", "loaves": "loaf", "knives": "knife"}
+IRREGULAR_PLURAL = {v: k for k, v in IRREGULAR.items()}
+NO_UNIT = "unit"
+
+
+class Portion(NamedTuple):
+    quantity: float
+    unit: str
+    modifier: str
+    label: str
+    label_plural: str
+
+
+def parse_quantity(text):
+    """(quantity, rest of text); quantity is NaN when the text doesn't start with a number."""
+    m = QUANTITY_RE.match(text)
+    if not m:
+        return float("nan"), text.strip()
+    if m["fnum"]:
+        quantity = int(m["fnum"]) / int(m["fden"])
+    else:
+        quantity = float(m["whole"])
+        if m["num"]:
+            quantity += int(m["num"]) / int(m["den"])
+    return quantity, text[m.end():].strip()
+
+
+def plural(word):
+    if word in IRREGULAR_PLURAL:
+        return IRREGULAR_PLURAL[word]
+    if word in UNCHANGED_PLURAL or word.lower() in SIZE_WORDS or (word.endswith("s") and not word.endswith("ss")):
+        return word
+    if word.endswith(("ch", "sh", "x", "ss")):
+        return word + "es"
+    if word.endswith("y") and word[-2:-1] not in "aeiou":
+        return word[:-1] + "ies"
+    return word + "s"
+
+
+def parse_portion(text):
+    """Parse one portion description into a Portion."""
+    text = str(text).strip()
+    quantity, rest = parse_quantity(text)
+    if quantity != quantity:
+        return Portion(quantity, "", text, text, text)
+    # the unit phrase runs up to the first comma, parenthesis, "with" or "of"
+    cut = min(
+        (i for i in (rest.find(","), rest.find("("), rest.find(" with "), rest.find(" of ")) if i >= 0),
+        default=len(rest),
+    )
+    head, tail = rest[:cut].strip(), rest[cut:].strip()
+
+    prefix = []
+    while True:
+        spec = SPEC_RE.match(head)
+        if spec and spec.end():
+            prefix.append(head[:spec.end()].strip())
+            head = head[spec.end():]
+            continue
+        first, _, remainder = head.partition(" ")
+        if first.lower() in SIZE_WORDS and remainder and not remainder.startswith("or "):
+            prefix.append(first)
+            head = remainder
+            continue
+        break
+
+    if not head.strip():
+        # "1 medium": the size is all there is to go by
+        head, prefix = (prefix[-1:] or [NO_UNIT])[0], prefix[:-1]
+    # "can or bottle" -> "cans or bottles"; alternatives with their own count ("or 2 squares") stay
+    alternatives = [alt.split() for alt in head.split(" or ")]
+    singulars, plurals = [], []
+    for words in alternatives:
+        last = words[-1]
+        counted = words[0][0].isdigit()
+        if last.islower() and not counted:
+            last = IRREGULAR.get(last, singular(last))
+        singulars.append(" ".join(words[:-1] + [last]))
+        plurals.append(" ".join(words[:-1] + [last if counted else plural(last)]))
+    noun, noun_plural = " or ".join(singulars), " or ".join(plurals)
+    unit = UNIT_SYNONYMS.get(noun.lower(), noun.lower())
+
+    modifier = " ".join(prefix + ([tail.lstrip(", ")] if tail else []))
+    sep = "" if tail.startswith(",") else " "
+    before = " ".join(prefix + [""])
+    label = f"{before}{noun}{sep}{tail}".strip()
+    label_plural = f"{before}{noun_plural}{sep}{tail}".strip()
+    return Portion(quantity, unit, modifier, label, label_plural)
+
+
+def parse_portions(descriptions):
+    """Typed Portion columns for a Series of descriptions, parsing each distinct text once."""
+    descriptions = descriptions.astype(str)
+    unique = descriptions.drop_duplicates()
+    parsed = pd.DataFrame([parse_portion(t) for t in unique], columns=Portion._fields, index=unique.to_numpy())
+    parsed["quantity"] = parsed["quantity"].astype(float)
+    for col in ("unit", "modifier", "label", "label_plural"):
+        parsed[col] = parsed[col].astype("category")
+    return parsed.reindex(descriptions.to_numpy()).set_axis(descriptions.index)
+
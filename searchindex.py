@@ -0,0 +1,160 @@
+"""Token index over FNDDS food descriptions.
+
+Each normalized description token maps to the rows that contain it (the
+blocking step: only rows sharing a token with the query get scored), and
+rows are ranked by IDF-weighted cosine similarity, nudged toward the plain
+food ("banana" is "Banana, raw", not "Banana, fried") and away from baby
+food unless the query asks for it. A second set of buckets
+keys rows by the words of their WWEIA category and major food group, so a
+caller that knows the category of what it's looking for can favour it.
+"""
+import re
+
+import numpy as np
+
+# major food group by the first digit of the FNDDS food code
+FOOD_GROUPS = {
+    "1": "milk dairy",
+    "2": "meat poultry fish seafood",
+    "3": "egg",
+    "4": "legume bean nut seed",
+    "5": "grain bread cereal pasta baked",
+    "6": "fruit",
+    "7": "vegetable",
+    "8": "fat oil",
+    "9": "sugar sweet beverage drink",
+}
+
+STOPWORDS = {
+    "a", "an", "and", "as", "by", "for", "from", "in", "of", "on", "or", "the", "to", "with",
+    "w", "ns", "nfs", "type", "made", "food", "product", "based",
+}
+
+# added when the query contains a row's whole head, the part before the first comma (FNDDS
+# names lead with it: "Apple, raw", "Pizza, cheese, ..."); "pizza" doesn't get it for "Pizza rolls"
+HEAD_BONUS = 0.1
+CATEGORY_BONUS = 0.15
+# unqualified food words mean the plain food: "apple" is "Apple, raw", not "Apple, baked"
+PLAIN_WORDS = re.compile(r"\b(?:raw|nfs|ns as to|plain|100%)", re.IGNORECASE)
+PLAIN_BONUS = 0.1
+# ... and not a baby food unless the query says so
+BABY_PENALTY = 0.3
+# "NS as to major flour" says the flour isn't known: its words don't describe the food, and
+# indexing them would rank "Bread, NS as to major flour" below "Bread, vegetable" for "bread"
+UNSPECIFIED_RE = re.compile(r"\bNS as to [^,]*", re.IGNORECASE)
+
+
+def singular(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercase, split on anything that isn't a letter or digit, singularize, drop stopwords."""
+    tokens = []
+    for t in re.split(r"[^a-z0-9]+", str(text).lower()):
+        if t and t not in STOPWORDS:
+            t = singular(t)
+            if t not in STOPWORDS:
+                tokens.append(t)
+    return tokens
+
+
+class FoodIndex:
+    """Blocking index + similarity ranking over the FNDDS foods table."""
+
+    def __init__(self, foods_df):
+        self.codes = foods_df["food_code"].to_numpy()
+        self.descriptions = foods_df["main_food_description"].astype(str).to_numpy()
+        self.row_of = {int(code): i for i, code in enumerate(self.codes)}
+        n = len(self.codes)
+        descriptions = foods_df["main_food_description"].astype(str)
+        self.plain = descriptions.str.contains(PLAIN_WORDS).to_numpy()
+        self.baby = descriptions.str.contains("baby food", case=False, regex=False).to_numpy()
+
+        docs = [tokenize(UNSPECIFIED_RE.sub("", d)) for d in self.descriptions]
+        head_docs = [set(tokenize(d.split(",")[0])) for d in self.descriptions]
+        postings = {}
+        heads = {}
+        for i, (doc, head) in enumerate(zip(docs, head_docs)):
+            for t in head:
+                heads.setdefault(t, []).append(i)
+            for t in set(doc):
+                postings.setdefault(t, []).append(i)
+        self.postings = {t: np.array(rows) for t, rows in postings.items()}
+        self.head_rows = {t: np.array(rows) for t, rows in heads.items()}
+        self.head_sizes = np.array([len(head) for head in head_docs])
+        self.idf = {t: np.log(n / len(rows)) + 1.0 for t, rows in postings.items()}
+
+        # cosine norm of each row's binary IDF-weighted token vector
+        self.norms = np.array([
+            np.sqrt(sum(self.idf[t] ** 2 for t in set(doc))) or 1.0 for doc in docs
+        ])
+
+        # category buckets: words of the WWEIA category and major food group
+        categories = foods_df["wweia_category_description"].astype(str).to_numpy()
+        buckets = {}
+        for i, (code, category) in enumerate(zip(self.codes, categories)):
+            for t in set(tokenize(category) + tokenize(FOOD_GROUPS.get(str(code)[0], ""))):
+                buckets.setdefault(t, []).append(i)
+        self.category_buckets = {t: np.array(rows) for t, rows in buckets.items()}
+
+    def category_rows(self, category):
+        """Rows whose category words overlap the given category text."""
+        rows = [self.category_buckets[t] for t in tokenize(category) if t in self.category_buckets]
+        if not rows:
+            return np.array([], dtype=int)
+        return np.unique(np.concatenate(rows))
+
+    def cosine(self, text):
+        """IDF-weighted cosine similarity of every row to `text`, in [0, 1], without the ranking nudges."""
+        scores = np.zeros(len(self.codes))
+        q_norm = 0.0
+        for t in set(tokenize(text)):
+            idf = self.idf.get(t)
+            if idf is None:
+                q_norm += (np.log(len(self.codes)) + 1.0) ** 2  # unseen words still count against
+                continue
+            q_norm += idf ** 2
+            scores[self.postings[t]] += idf ** 2
+        if q_norm:
+            scores /= np.sqrt(q_norm) * self.norms
+        return scores
+
+    def scores(self, text, category=None):
+        """Ranking score of every row for `text`: cosine plus nudges; rows sharing no token score 0."""
+        query = set(tokenize(text))
+        scores = self.cosine(text)
+        if not scores.any():
+            return scores
+
+        head_words = np.zeros(len(self.codes), dtype=int)
+        for t in query & self.head_rows.keys():
+            head_words[self.head_rows[t]] += 1
+        scores[(head_words == self.head_sizes) & (self.head_sizes > 0)] += HEAD_BONUS
+        hit = scores > 0
+        scores[hit & self.plain] += PLAIN_BONUS
+        if "baby" not in query:
+            scores[hit & self.baby] -= BABY_PENALTY
+        if category:
+            rows = self.category_rows(category)
+            rows = rows[scores[rows] > 0]
+            scores[rows] += CATEGORY_BONUS
+        return scores
+
+    def search(self, text, k=10, category=None):
+        """Top `k` (row, score) pairs, best first."""
+        scores = self.scores(text, category)
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            # every hit scoring at least the k-th best, so ties at the cut are broken below too
+            kth = np.partition(scores[hits], len(hits) - k)[len(hits) - k]
+            hits = hits[scores[hits] >= kth]
+        # ties go to the shorter (more generic) description
+        order = sorted(hits, key=lambda i: (-scores[i], len(self.descriptions[i])))[:k]
+        return [(int(i), float(scores[i])) for i in order]
@@ -0,0 +1,305 @@
+"""HTTP/JSON service for search, food detail, servings and classification, without Streamlit.
+
+    python service.py --port 8000
+    uvicorn service:app --port 8000 --workers 4
+
+    GET  /search?q=apple&limit=20             substring search: [{food_code, description}]
+    GET  /match?q=granny+smith+apple&k=10     ranked free-text match, with scores
+    GET  /foods/63101000?calories=2500        serving, units it can be logged in, substitutes
+    GET  /foods/63101000/servings?amount=2+cups&calories=2500
+    POST /servings   {"rows": [{"food": "apple", "amount": "2 cups"}, ...], "calories": 2500}
+    POST /classify   {"codes": [63101000, 11111000], "calories": 2500}
+    POST /parse      {"text": "2 cups rice and an apple", "calories": 2500}
+
+An ASGI app (starlette) on top of engine.py. The tables and indexes
+are built once per worker process at startup and shared by every
+request. Handlers are async. The table work runs in the threadpool so a
+slow batch doesn't hold up the event loop. GET responses depend only on
+the bundled FNDDS data and the query. Each distinct one is rendered once
+and kept in an lru cache. Responses are sent with Cache-Control and an
+ETag, and a request with a matching If-None-Match gets a 304. POST
+bodies are batches of up to MAX_BATCH rows, converted with the same
+array math as batch.py.
+"""
+import argparse
+import contextlib
+import functools
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+
+import batch
+import engine
+import matcher
+import servingtable
+
+MAX_BATCH = 10_000
+MAX_LIMIT = 200
+CALORIES_RANGE = (1000, 5000)
+# GET responses only change when the bundled data does, i.e. on deploy
+CACHE_CONTROL = "public, max-age=3600"
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), allow_nan=False).encode()
+
+
+def _records(df):
+    # NaN is not JSON; missing values go out as null
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _int(value, name, low, high):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{name} must be an integer") from None
+    if not low <= number <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return number
+
+
+def _amount(value, name="amount"):
+    """An amount as batch.convert reads it: a positive number of servings or a quantity with a unit."""
+    if value is None:
+        return "1"
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise BadRequest(f"{name} must be a number or a string like \"2 cups\"")
+    text = " ".join(str(value).lower().split()) or "1"
+    if text.startswith("-") or not batch.read_amount(text)[0] > 0:
+        raise BadRequest(f"{name} must be positive")
+    return text
+
+
+def _serving_kcal(calories):
+    if calories is None:
+        return None
+    return servingtable.personal_serving_kcal(_int(calories, "calories", *CALORIES_RANGE))
+
+
+def _known(code):
+    code = _int(code, "food code", 0, 10**9)
+    if code not in engine.serving_table().index:
+        raise LookupError(f"no food {code}")
+    return code
+
+
+# ------------------- GET bodies (cached) -------------------
+@functools.lru_cache(maxsize=4096)
+def search_body(query, limit):
+    return _dumps([{"food_code": code, "description": d} for code, d in engine.search(query, limit)])
+
+
+@functools.lru_cache(maxsize=4096)
+def match_body(text, k):
+    return _dumps([{"food_code": code, "description": d, "score": round(s, 4)} for code, d, s in engine.match(text, k)])
+
+
+@functools.lru_cache(maxsize=4096)
+def food_body(code, calories):
+    card = engine.card(code, _serving_kcal(calories))
+    serving = engine.serving(code, _serving_kcal(calories))
+    return _dumps({
+        **serving._asdict(),
+        "unit_grams": card.unit_grams,
+        "kcal_per_100g": None if np.isnan(card.kcal_per_100g) else card.kcal_per_100g,
+        "substitutes": {
+            "same_category": [s._asdict() for s in card.substitutes[True]],
+            "any_category": [s._asdict() for s in card.substitutes[False]],
+        },
+    })
+
+
+@functools.lru_cache(maxsize=4096)
+def amount_body(code, amount, calories):
+    row = pd.DataFrame({"food": [str(code)], "amount": [amount]})
+    return _dumps(_records(batch.convert(row, _serving_kcal(calories)))[0])
+
+
+# ------------------- POST bodies -------------------
+def _batch(payload, key):
+    rows = payload.get(key)
+    if not isinstance(rows, list):
+        raise BadRequest(f'"{key}" must be a list')
+    if len(rows) > MAX_BATCH:
+        raise BadRequest(f"at most {MAX_BATCH} {key} per request")
+    return rows
+
+
+def servings_body(payload):
+    rows = _batch(payload, "rows")
+    if not all(isinstance(row, dict) and "food" in row for row in rows):
+        raise BadRequest('every row needs a "food"')
+    chunk = pd.DataFrame({
+        "food": [str(row["food"]) for row in rows],
+        "amount": [_amount(row.get("amount"), f"rows[{i}].amount") for i, row in enumerate(rows)],
+    })
+    out = batch.convert(chunk, _serving_kcal(payload.get("calories")))
+    return _dumps({"rows": _records(out.drop(columns=["food", "amount"]))})
+
+
+def classify_body(payload):
+    codes = _batch(payload, "codes")
+    # checked before the cast: int64 would truncate 1.5 to 1 and read true as 1
+    if not all(isinstance(code, int) and not isinstance(code, bool) and 0 <= code <= 10**9 for code in codes):
+        raise BadRequest('"codes" must be integer food codes')
+    codes = np.array(codes, dtype=np.int64)
+    table = engine.servings(codes, _serving_kcal(payload.get("calories")))
+    table.insert(0, "food_code", codes)
+    table.insert(1, "description", engine.descriptions(codes))
+    return _dumps({"foods": _records(table.reset_index(drop=True))})
+
+
+def parse_body(payload):
+    text = payload.get("text")
+    if not isinstance(text, str):
+        raise BadRequest('"text" must be a string')
+    items = engine.parse_meal(text, _serving_kcal(payload.get("calories")))
+    return _dumps({"items": [{k: (None if isinstance(v, float) and np.isnan(v) else v)
+                              for k, v in item._asdict().items()} for item in items]})
+
+
+# ------------------- Handlers -------------------
+def _json(body, status=200, headers=None):
+    return Response(body, status, headers=headers, media_type="application/json")
+
+
+def _error(status, message):
+    return _json(_dumps({"error": message}), status, {"Cache-Control": "no-store"})
+
+
+async def _get(request, render, *args):
+    try:
+        body = await run_in_threadpool(render, *args)
+    except BadRequest as e:
+        return _error(400, str(e))
+    except LookupError as e:
+        return _error(404, str(e))
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return _json(body, headers=headers)
+
+
+async def _post(request, render):
+    try:
+        payload = await request.json()
+    except ValueError:
+        return _error(400, "body must be JSON")
+    if not isinstance(payload, dict):
+        return _error(400, "body must be a JSON object")
+    try:
+        body = await run_in_threadpool(render, payload)
+    except BadRequest as e:
+        return _error(400, str(e))
+    return _json(body, headers={"Cache-Control": "no-store"})
+
+
+def _query(request, name):
+    value = request.query_params.get(name, "").strip()
+    if not value:
+        raise BadRequest(f"missing ?{name}=")
+    return value
+
+
+async def search(request):
+    try:
+        query = _query(request, "q").lower()
+        limit = _int(request.query_params.get("limit", 50), "limit", 1, MAX_LIMIT)
+    except BadRequest as e:
+        return _error(400, str(e))
+    return await _get(request, search_body, query, limit)
+
+
+async def match(request):
+    try:
+        text = _query(request, "q").lower()
+        k = _int(request.query_params.get("k", 10), "k", 1, MAX_LIMIT)
+    except BadRequest as e:
+        return _error(400, str(e))
+    return await _get(request, match_body, text, k)
+
+
+async def food(request):
+    def render(code, calories):
+        return food_body(_known(code), calories)
+    return await _get(request, render, request.path_params["code"], request.query_params.get("calories"))
+
+
+async def food_servings(request):
+    def render(code, amount, calories):
+        return amount_body(_known(code), amount, calories)
+    try:
+        amount = _amount(request.query_params.get("amount"))
+    except BadRequest as e:
+        return _error(400, str(e))
+    return await _get(request, render, request.path_params["code"], amount, request.query_params.get("calories"))
+
+
+async def servings(request):
+    return await _post(request, servings_body)
+
+
+async def classify(request):
+    return await _post(request, classify_body)
+
+
+async def parse(request):
+    return await _post(request, parse_body)
+
+
+def warm():
+    """Build every table and index a request can touch."""
+    code = int(engine.serving_table().index[0])
+    engine.catalog()
+    matcher.default_matcher()
+    engine.meal_parser()
+    engine.card(code)
+    engine.descriptions([code])
+    batch.convert(pd.DataFrame({"food": ["apple"], "amount": ["1 cup"]}))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(warm)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/search", search),
+        Route("/match", match),
+        Route("/foods/{code}", food),
+        Route("/foods/{code}/servings", food_servings),
+        Route("/servings", servings, methods=["POST"]),
+        Route("/classify", classify, methods=["POST"]),
+        Route("/parse", parse, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve search, food detail and servings over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="processes, each with its own copy of the tables")
+    args = parser.parse_args()
+    uvicorn.run("service:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Serving cards for search results, built before the user picks one.
+
+A card is everything the search panel shows for a food: its serving,
+the grams per unit of every unit it can be logged in, and its
+lower-calorie substitutes. After a search, CardPrefetcher builds the
+cards of the first PREFETCH results on a small worker pool that all
+sessions share. It keeps them in a short-lived per-session cache, so
+picking one of them renders from the cache. A card is mostly table
+lookups. The expensive part is the first card of a process, which loads
+the unit table and substitute index (about half a second, more if
+substitutes.npz has to be built). The first search now pays that on a
+worker, not the first pick.
+
+A new query cancels the cards still queued for the old one. Each session
+queues at most PREFETCH cards, and the pool has WORKERS threads, so
+prefetching can't take over the server from interactive reruns.
+"""
+import concurrent.futures
+import functools
+import threading
+import time
+from typing import NamedTuple
+
+import substitutes
+import units
+
+PREFETCH = 5
+WORKERS = 2
+# seconds a card stays cached; cards only change with the serving table, this just bounds memory
+TTL = 300
+SUBSTITUTES = 5
+# the first cards of a process would otherwise each load the unit table and index
+_loading = threading.Lock()
+
+
+class ServingCard(NamedTuple):
+    food_code: int
+    density: str
+    units: float
+    unit: str
+    unit_plural: str
+    grams: float
+    kcal: float
+    unit_grams: dict  # unit -> grams in one, in units.UnitTable.units() order
+    kcal_per_100g: float
+    substitutes: dict  # same_category -> [substitutes.Substitute]; empty for nutrient-dense foods
+
+
+def serving_card(code, serving_table, unit_table=None, index=None):
+    if unit_table is None or index is None:
+        with _loading:
+            unit_table = units.default_units() if unit_table is None else unit_table
+            index = substitutes.default_index() if index is None else index
+    serving = serving_table.loc[code]
+    energy_dense = serving["density"] == "Energy-dense"
+    return ServingCard(
+        int(code),
+        serving["density"],
+        float(serving["units"]),
+        serving["unit"],
+        serving["unit_plural"],
+        float(serving["grams"]),
+        float(serving["kcal"]),
+        {unit: unit_table.grams_per_unit(code, unit) for unit in unit_table.units(code)},
+        index.kcal_per_100g(code),
+        {
+            same: index.suggest(code, k=SUBSTITUTES, same_category=same) if energy_dense else []
+            for same in (True, False)
+        },
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def default_pool():
+    return concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="card-prefetch")
+
+
+class CardPrefetcher:
+    """One session's card cache for one serving table, filled ahead of time from a shared pool."""
+
+    def __init__(self, serving_table, pool=None, ttl=TTL):
+        self.serving_table = serving_table
+        self.pool = default_pool() if pool is None else pool
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.query = None
+        self.pending = {}  # code -> Future for the current query
+        self.cards = {}  # code -> (card, expiry)
+
+    def prefetch(self, query, codes):
+        """Queue cards for the first PREFETCH `codes`, cancelling what's queued for an older query."""
+        with self.lock:
+            if query == self.query:
+                return
+            self.query = query
+            for future in self.pending.values():
+                future.cancel()
+            now = time.monotonic()
+            self.cards = {code: hit for code, hit in self.cards.items() if hit[1] > now}
+            self.pending = {
+                code: self.pool.submit(self._fill, query, code)
+                for code in map(int, codes[:PREFETCH])
+                if code not in self.cards
+            }
+
+    def _fill(self, query, code):
+        if query != self.query:  # the query changed while this was queued
+            return None
+        return self._store(code)
+
+    def _store(self, code):
+        card = serving_card(code, self.serving_table)
+        with self.lock:
+            self.cards[code] = (card, time.monotonic() + self.ttl)
+        return card
+
+    def card(self, code):
+        """The food's card: cached, finished by a running prefetch, or built now."""
+        code = int(code)
+        with self.lock:
+            hit = self.cards.get(code)
+            future = self.pending.pop(code, None)
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
+        # a queued prefetch would only wait behind others: build it here instead
+        if future is not None and not future.cancel():
+            card = future.result()
+            if card is not None:
+                return card
+        return self._store(code)
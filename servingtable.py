@@ -0,0 +1,261 @@
+"""FNDDS data loading and the precomputed serving table, without Streamlit.
+
+`build_serving_table` runs the serving rules (named portion at a 0.25-step
+fraction within ±20% of the serving kcal, else grams) for every food code at
+once with array math, so "what is one serving of X" is a table lookup.
+"""
+import functools
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import portions
+
+# --- FILE PATHS ---
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+FOODS_FILE = os.path.join(DATA_DIR, "2017-2018 FNDDS At A Glance - Foods and Beverages.csv")
+NUTRIENTS_FILE = os.path.join(DATA_DIR, "2017-2018 FNDDS At A Glance - FNDDS Nutrient Values.csv")
+PORTIONS_FILE = os.path.join(DATA_DIR, "2017-2018 FNDDS At A Glance - Portions and Weights.csv")
+# written by enrich.py; merged into the portions table when present
+ENRICHED_PORTIONS_FILE = os.path.join(DATA_DIR, "enriched_portions.csv")
+
+# ------------------- Serving rules -------------------
+COMMON_UNITS = [
+    "cup", "cups", "tbsp", "tablespoon", "tablespoons",
+    "tsp", "teaspoon", "teaspoons", "slice", "slices",
+    "piece", "pieces", "can", "bottle", "link",
+    "patty", "bar", "cookie", "egg", "loaf",
+    "bun", "muffin", "cake", "donut", "taco", "sandwich",
+    "small", "medium", "large"
+]
+
+BAD_PHRASES = [
+    "guideline amount",
+    "as consumed",
+    "recipe",
+    "per 100",
+    "added",
+    "on cereal",
+    "with milk",
+    "per cup of hot cereal",
+    "100 calorie",
+    "package",
+    "serving",
+    "container"
+]
+
+# keys are substrings to look for in the food description (lowercased)
+# values are the forced density category
+CATEGORY_OVERRIDES = {
+    "juice": "Energy-dense",
+    "potato": "Energy-dense",
+    "potatoes": "Energy-dense",
+    "edamame": "Nutrient-dense",
+}
+
+# food code prefixes (fruits, vegetables) that count as nutrient-dense
+NUTRIENT_DENSE_PREFIXES = ("61", "63", "67", "72", "73", "74", "75", "76", "78")
+
+# kcal in one serving of each density
+SERVING_KCAL = {"Energy-dense": 100, "Nutrient-dense": 50}
+# daily calories the default serving sizes are meant for
+REFERENCE_CALORIES = 2000
+
+# candidate fractions of a portion: 0.25 .. 4.0
+FRACTIONS = np.arange(1, 17) * 0.25
+
+
+# ------------------- Load Food Data -------------------
+def normalize_columns(df):
+    df.columns = (
+        df.columns.str.strip()
+        .str.lower()
+        .str.replace(r"\s+", "_", regex=True)
+        .str.replace(r"[()]", "", regex=True)
+    )
+    return df
+
+
+def merge_portions(portions_df, extra_df):
+    """Append extra portions (e.g. from enrich.py) that FNDDS doesn't already list for a food."""
+    if extra_df is None or extra_df.empty:
+        return portions_df
+    extra_df = extra_df.copy()
+    extra_df["food_code"] = extra_df["food_code"].astype(portions_df["food_code"].dtype)
+    known = set(zip(portions_df["food_code"], portions_df["portion_description"].str.lower()))
+    keep = [
+        (code, desc.lower()) not in known
+        for code, desc in zip(extra_df["food_code"], extra_df["portion_description"])
+    ]
+    return pd.concat([portions_df, extra_df[keep]], ignore_index=True)
+
+
+@functools.lru_cache(maxsize=1)
+def load_data():
+    foods_df = normalize_columns(pd.read_csv(FOODS_FILE, skiprows=1))
+    nutrients_df = normalize_columns(pd.read_csv(NUTRIENTS_FILE, skiprows=1))
+    portions_df = normalize_columns(pd.read_csv(PORTIONS_FILE, skiprows=1))
+
+    if os.path.exists(ENRICHED_PORTIONS_FILE):
+        portions_df = merge_portions(portions_df, pd.read_csv(ENRICHED_PORTIONS_FILE))
+    portions_df = with_parsed_portions(portions_df)
+
+    return foods_df, nutrients_df, portions_df
+
+
+def with_parsed_portions(portions_df):
+    """Add the quantity/unit/modifier/label columns (portions.py) if they aren't there yet."""
+    if "label" in portions_df.columns:
+        return portions_df
+    return portions_df.join(portions.parse_portions(portions_df["portion_description"]))
+
+
+# ------------------- Serving table -------------------
+def usable_portions(portions_df):
+    """Portions with a common named unit and none of the bad phrases, in file order."""
+    desc = portions_df["portion_description"].astype(str).str.lower()
+    has_unit = desc.str.contains("|".join(map(re.escape, COMMON_UNITS)))
+    is_bad = desc.str.contains("|".join(map(re.escape, BAD_PHRASES)))
+    return portions_df[has_unit & ~is_bad]
+
+
+def classify_density(foods_df):
+    """Energy-/Nutrient-dense per food: description overrides first, then code prefix."""
+    desc = foods_df["main_food_description"].astype(str).str.lower()
+    code = foods_df["food_code"].astype(str)
+    density = pd.Series(
+        np.where(code.str.startswith(NUTRIENT_DENSE_PREFIXES), "Nutrient-dense", "Energy-dense"),
+        index=foods_df.index,
+    )
+    # apply in reverse so the first matching override wins, like the dict loop in app.py
+    for keyword, forced_density in reversed(list(CATEGORY_OVERRIDES.items())):
+        density[desc.str.contains(keyword, regex=False)] = forced_density
+    return density
+
+
+class ServingSolver:
+    """Serving table solver with everything that doesn't depend on the kcal targets precomputed.
+
+    `solve(targets)` is pure array math over the usable portions, so a new pair
+    of serving sizes gives a full table in a couple of milliseconds.
+    """
+
+    def __init__(self, foods_df, nutrients_df, portions_df):
+        self.codes = foods_df["food_code"].to_numpy()
+        self.density = classify_density(foods_df).to_numpy()
+        self.is_energy = self.density == "Energy-dense"
+        kcal_per_100g = nutrients_df.drop_duplicates("food_code").set_index("food_code")["energy_kcal"]
+        self.kcal_per_g = pd.Series(self.codes).map(kcal_per_100g).to_numpy(dtype=float) / 100.0
+        self.has_kcal = ~np.isnan(self.kcal_per_g) & (self.kcal_per_g != 0)
+
+        # usable portions of foods with kcal, grouped by food, file order kept within a food
+        row_of = pd.Series(np.arange(len(self.codes)), index=self.codes)
+        cand = usable_portions(with_parsed_portions(portions_df))
+        cand = cand[cand["food_code"].isin(self.codes[self.has_kcal])]
+        rows = row_of.reindex(cand["food_code"]).to_numpy()
+        order = np.argsort(rows, kind="stable")
+        self.cand_row = rows[order]
+        self.part_grams = cand["portion_weight_g"].to_numpy(dtype=float)[order]
+        self.kcal_per_portion = self.part_grams * self.kcal_per_g[self.cand_row]
+        # named units per portion and per fraction of a portion ("10 chips" -> 10 chip)
+        self.cand_quantity = cand["quantity"].fillna(1).to_numpy(dtype=float)[order]
+        self.cand_unit = cand["label"].astype(str).str.lower().to_numpy()[order]
+        self.cand_unit_plural = cand["label_plural"].astype(str).str.lower().to_numpy()[order]
+        self.block_rows, self.block_starts = np.unique(self.cand_row, return_index=True)
+
+    def solve(self, targets=None):
+        """One serving for every food, indexed by food_code.
+
+        Columns: density, target_kcal, fraction (of the portion), unit, grams, kcal —
+        the same values `serving_for_food` returns for that row — plus `units`, the
+        count of `unit` in one serving (fraction x the portion's quantity), and
+        `unit_plural` for display. `targets` maps density to serving kcal and
+        defaults to SERVING_KCAL.
+        """
+        targets = {**SERVING_KCAL, **(targets or {})}
+        target_kcal = np.where(self.is_energy, targets["Energy-dense"], targets["Nutrient-dense"]).astype(float)
+
+        # gram fallback sized to hit the target; also the answer when no portion fits
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fallback_grams = np.maximum(1, np.round(target_kcal / self.kcal_per_g))
+            fallback_kcal = np.round(fallback_grams * self.kcal_per_g)
+        fraction = np.where(self.has_kcal, fallback_grams, 1).astype(float)
+        unit = np.full(len(self.codes), "g", dtype=object)
+        unit_plural = unit.copy()
+        units = fraction.copy()
+        grams = np.where(self.has_kcal, fallback_grams, 0)
+        kcal = np.where(self.has_kcal, fallback_kcal, 0)
+
+        # score every usable portion x fraction, then keep the first best per food
+        target = target_kcal[self.cand_row]
+        kcal_est = FRACTIONS[None, :] * self.kcal_per_portion[:, None]
+        diff = np.abs(kcal_est - target[:, None])
+        best_f = diff.argmin(axis=1)
+        cand = np.arange(len(self.cand_row))
+        diff = diff[cand, best_f]
+        kcal_est = kcal_est[cand, best_f]
+        block_min = np.minimum.reduceat(diff, self.block_starts)
+        is_min = diff == np.repeat(block_min, np.diff(np.append(self.block_starts, len(cand))))
+        best = np.minimum.reduceat(np.where(is_min, cand, len(cand)), self.block_starts)
+
+        # keep the named unit only if it lands within ±20% of the target
+        rows = self.block_rows
+        target = target[best]
+        with np.errstate(divide="ignore"):
+            exact_fraction = np.where(
+                self.kcal_per_portion[best] > 0, target / self.kcal_per_portion[best], np.inf
+            )
+        approx_cal = np.round(kcal_est[best])
+        fits = (exact_fraction >= 0.25) & (approx_cal >= 0.8 * target) & (approx_cal <= 1.2 * target)
+        rows, best, approx_cal = rows[fits], best[fits], approx_cal[fits]
+
+        fraction[rows] = FRACTIONS[best_f[best]]
+        unit[rows] = self.cand_unit[best]
+        unit_plural[rows] = self.cand_unit_plural[best]
+        units[rows] = fraction[rows] * self.cand_quantity[best]
+        grams[rows] = np.maximum(1, np.round(fraction[rows] * self.part_grams[best]))
+        kcal[rows] = np.maximum(0, approx_cal)
+
+        return pd.DataFrame({
+            "density": self.density,
+            "target_kcal": target_kcal,
+            "fraction": fraction,
+            "unit": unit,
+            "units": units,
+            "unit_plural": unit_plural,
+            "grams": grams.astype(int),
+            "kcal": kcal.astype(int),
+        }, index=pd.Index(self.codes, name="food_code"))
+
+
+def build_serving_table(foods_df, nutrients_df, portions_df, targets=None):
+    """One serving for every food, indexed by food_code (see ServingSolver.solve)."""
+    return ServingSolver(foods_df, nutrients_df, portions_df).solve(targets)
+
+
+@functools.lru_cache(maxsize=1)
+def solver():
+    """Solver for the bundled data (plus enriched portions)."""
+    return ServingSolver(*load_data())
+
+
+@functools.lru_cache(maxsize=64)
+def serving_table(targets=None):
+    """Cached serving table for the bundled data; `targets` is a tuple of (density, kcal) pairs."""
+    return solver().solve(dict(targets or ()))
+
+
+def personal_serving_kcal(daily_calories):
+    """Serving sizes scaled from SERVING_KCAL at REFERENCE_CALORIES, rounded to 5 kcal.
+
+    Rounding keeps the number of distinct serving tables (and cache entries) small.
+    """
+    scale = daily_calories / REFERENCE_CALORIES
+    return {density: max(5, 5 * round(kcal * scale / 5)) for density, kcal in SERVING_KCAL.items()}
+
+
+def grams_fallback_codes(table):
+    """Food codes whose serving is plain grams because no named portion fits."""
+    return table.index[(table["unit"] == "g") & (table["grams"] > 0)]
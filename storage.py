@@ -0,0 +1,538 @@
+"""Persistent tally and food-log storage.
+
+Every tally change (food adds, Quick Add, Quick Subtract) is appended to an
+event log with its timestamp, and the per-(user, day) tally is kept as a
+rollup updated in the same transaction, so reading a day is one lookup and
+nothing is thrown away at midnight. Old events and rollups are moved out to
+columnar files by history.compact. `WriteBehindStore` sits in front of any store: writes
+go onto a queue and a background thread applies them in batches, one
+transaction per batch, so the app never waits on disk when adding a serving.
+Ops handed over together in one `write_batch` call (a saved meal) always land in
+the same transaction. Saved meals are kept per user next to the log.
+
+The default backend is SQLite in WAL mode; set SERVINGTRACKER_STORE to
+"memory" or to another sqlite path ("sqlite:///path/to.db") to change it.
+"""
+import atexit
+import collections
+import contextlib
+import datetime
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import servingtable
+
+DEFAULT_DB_FILE = os.path.join(servingtable.DATA_DIR, "servingtracker.db")
+# a batch is written when this many ops are queued or this many seconds pass
+FLUSH_BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5
+# a batch that fails to write is retried after this many seconds, doubling up to the max
+RETRY_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+
+class Op(NamedTuple):
+    """One add_serving call: a tally change plus, optionally, the food that caused it."""
+    user_id: str
+    day: str
+    density: str
+    amount: float
+    food: dict | None = None
+    logged_at: str | None = None
+    # where an imported op came from (see importer.py); an op whose source the user
+    # already has is skipped, so importing the same entry twice counts it once
+    source: str | None = None
+
+
+class DayState(NamedTuple):
+    energy_servings: float
+    nutrient_servings: float
+    selected_foods: list
+
+
+EMPTY_DAY = DayState(0.0, 0.0, [])
+
+
+def apply_op(state, op):
+    """The DayState after one op, clamped at zero like add_serving."""
+    energy, nutrient, foods = state
+    if op.density == "Energy-dense":
+        energy = max(0.0, energy + op.amount)
+    else:
+        nutrient = max(0.0, nutrient + op.amount)
+    if op.food is not None:
+        foods = foods + [op.food]
+    return DayState(energy, nutrient, foods)
+
+
+class TallyStore:
+    """Backend interface: read one day, apply a batch of ops in order."""
+
+    def load(self, user_id, day):
+        raise NotImplementedError
+
+    def write_batch(self, ops, committing=contextlib.nullcontext()):
+        """Apply `ops` in order, all or none; `committing` is entered around the moment they land."""
+        raise NotImplementedError
+
+    def history(self, user_id, start, end):
+        raise NotImplementedError
+
+    def version(self, user_id):
+        """Number of ops ever written for the user, by any process; changes with every change to their log."""
+        raise NotImplementedError
+
+    def imported(self, user_id, sources):
+        """The ones among `sources` already written for the user (Op.source)."""
+        raise NotImplementedError
+
+    def record(self, op):
+        self.write_batch([op])
+
+    def flush(self):
+        pass
+
+    def meals(self, user_id):
+        """{name: (items, portions)} of the user's saved meals; items are [[code, name, grams]]."""
+        raise NotImplementedError
+
+    def save_meal(self, user_id, name, items, portions):
+        raise NotImplementedError
+
+    def delete_meal(self, user_id, name):
+        raise NotImplementedError
+
+
+class MemoryStore(TallyStore):
+    def __init__(self):
+        self.days = {}
+        self.versions = collections.Counter()
+        self.sources = set()
+        self.saved_meals = {}
+        self.lock = threading.Lock()
+
+    def load(self, user_id, day):
+        with self.lock:
+            state = self.days.get((user_id, day), EMPTY_DAY)
+            return DayState(state.energy_servings, state.nutrient_servings, list(state.selected_foods))
+
+    def write_batch(self, ops, committing=contextlib.nullcontext()):
+        with committing, self.lock:
+            for op in ops:
+                if op.source is not None:
+                    if (op.user_id, op.source) in self.sources:
+                        continue
+                    self.sources.add((op.user_id, op.source))
+                self.days[(op.user_id, op.day)] = apply_op(self.days.get((op.user_id, op.day), EMPTY_DAY), op)
+                self.versions[op.user_id] += 1
+
+    def version(self, user_id):
+        with self.lock:
+            return self.versions[user_id]
+
+    def imported(self, user_id, sources):
+        with self.lock:
+            return {source for source in sources if (user_id, source) in self.sources}
+
+    def history(self, user_id, start, end):
+        with self.lock:
+            return sorted(
+                (day, state.energy_servings, state.nutrient_servings, 0)
+                for (user, day), state in self.days.items()
+                if user == user_id and start <= day <= end
+            )
+
+    def meals(self, user_id):
+        with self.lock:
+            return dict(self.saved_meals.get(user_id, {}))
+
+    def save_meal(self, user_id, name, items, portions):
+        with self.lock:
+            self.saved_meals.setdefault(user_id, {})[name] = ([list(item) for item in items], portions)
+
+    def delete_meal(self, user_id, name):
+        with self.lock:
+            self.saved_meals.get(user_id, {}).pop(name, None)
+
+
+class SQLiteStore(TallyStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tally (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        energy_servings REAL NOT NULL DEFAULT 0,
+        nutrient_servings REAL NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0,  -- the user's version after the row's last change
+        PRIMARY KEY (user_id, day)
+    );
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        logged_at TEXT,
+        density TEXT NOT NULL,
+        amount REAL NOT NULL,
+        code INTEGER,
+        name TEXT,
+        grams REAL
+    );
+    CREATE INDEX IF NOT EXISTS events_user_day ON events (user_id, day);
+    CREATE TABLE IF NOT EXISTS versions (
+        user_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS imports (
+        user_id TEXT NOT NULL,
+        source TEXT NOT NULL,
+        PRIMARY KEY (user_id, source)
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meals (
+        user_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        items TEXT NOT NULL,  -- JSON [[code, name, grams], ...]
+        portions REAL NOT NULL DEFAULT 1,
+        PRIMARY KEY (user_id, name)
+    );
+    """
+
+    # (table, column, declaration) added since the table was first created; CREATE TABLE IF NOT
+    # EXISTS leaves an existing table as it is, so these are added to older databases on open
+    MIGRATIONS = [
+        ("events", "grams", "REAL"),
+        ("tally", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ]
+
+    # tally row and food events for one (user, day) in a single statement;
+    # both halves are lookups on an index keyed (user_id, day)
+    LOAD_SQL = """
+    SELECT 0, NULL, NULL, NULL, energy_servings, nutrient_servings FROM tally
+        WHERE user_id = ? AND day = ?
+    UNION ALL
+    SELECT id, code, name, density, amount, grams FROM events
+        WHERE user_id = ? AND day = ? AND code IS NOT NULL
+    ORDER BY 1
+    """
+
+    def __init__(self, path=DEFAULT_DB_FILE):
+        self.path = path
+        self.local = threading.local()
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        with conn:
+            for table, column, declaration in self.MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def load(self, user_id, day):
+        rows = self._connect().execute(self.LOAD_SQL, (user_id, day, user_id, day)).fetchall()
+        energy = nutrient = 0.0
+        foods = []
+        for row_id, code, name, density, amt, grams in rows:
+            if row_id == 0:
+                energy, nutrient = amt, grams  # tally row: (energy, nutrient) servings
+            else:
+                foods.append({"code": code, "name": name, "density": density, "amt": amt, "grams": grams})
+        return DayState(energy, nutrient, foods)
+
+    def write_batch(self, ops, committing=contextlib.nullcontext()):
+        conn = self._connect()
+        try:
+            self._write(conn, ops)
+            with committing:
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _write(self, conn, ops):
+        # sources first: the insert takes the write lock, so no other writer can interleave
+        ops = [
+            op for op in ops
+            if op.source is None or conn.execute(
+                "INSERT OR IGNORE INTO imports (user_id, source) VALUES (?, ?)", (op.user_id, op.source)
+            ).rowcount
+        ]
+        versions = {}
+        for user_id, count in collections.Counter(op.user_id for op in ops).items():
+            (version,) = conn.execute(
+                "INSERT INTO versions (user_id, version) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET version = version + excluded.version RETURNING version",
+                (user_id, count),
+            ).fetchone()
+            versions[user_id] = version - count
+        compacted = self._compacted_before(conn)
+        # one op at a time so each is clamped at zero in order, like add_serving
+        for op in ops:
+            versions[op.user_id] += 1
+            column = "energy_servings" if op.density == "Energy-dense" else "nutrient_servings"
+            if op.day < compacted:
+                # the day may be in Parquet already: the row is a change on top of it, clamped on merge
+                value, update = "?", f"{column} + ?"
+            else:
+                value, update = "max(0, ?)", f"max(0, {column} + ?)"
+            conn.execute(
+                f"INSERT INTO tally (user_id, day, {column}, version) VALUES (?, ?, {value}, ?) "
+                f"ON CONFLICT (user_id, day) DO UPDATE SET {column} = {update}, version = excluded.version",
+                (op.user_id, op.day, op.amount, versions[op.user_id], op.amount),
+            )
+        conn.executemany(
+            "INSERT INTO events (user_id, day, logged_at, density, amount, code, name, grams) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (op.user_id, op.day, op.logged_at, op.density, op.amount,
+                 op.food["code"] if op.food else None, op.food["name"] if op.food else None,
+                 op.food.get("grams") if op.food else None)
+                for op in ops
+            ],
+        )
+
+    def imported(self, user_id, sources):
+        conn = self._connect()
+        found = set()
+        sources = list(sources)
+        for i in range(0, len(sources), 500):  # under SQLite's limit on bound parameters
+            chunk = sources[i:i + 500]
+            found.update(row[0] for row in conn.execute(
+                f"SELECT source FROM imports WHERE user_id = ? AND source IN ({', '.join('?' * len(chunk))})",
+                [user_id, *chunk],
+            ))
+        return found
+
+    def version(self, user_id):
+        row = self._connect().execute("SELECT version FROM versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def meals(self, user_id):
+        rows = self._connect().execute(
+            "SELECT name, items, portions FROM meals WHERE user_id = ? ORDER BY name", (user_id,)
+        ).fetchall()
+        return {name: (json.loads(items), portions) for name, items, portions in rows}
+
+    def save_meal(self, user_id, name, items, portions):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO meals (user_id, name, items, portions) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, name) DO UPDATE SET items = excluded.items, portions = excluded.portions",
+                (user_id, name, json.dumps([list(item) for item in items]), portions),
+            )
+
+    def delete_meal(self, user_id, name):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM meals WHERE user_id = ? AND name = ?", (user_id, name))
+
+    # --- used by history.compact ---
+    EVENT_COLUMNS = ["id", "user_id", "day", "logged_at", "density", "amount", "code", "name", "grams"]
+    ROLLUP_COLUMNS = ["user_id", "day", "energy_servings", "nutrient_servings", "version"]
+
+    @staticmethod
+    def _compacted_before(conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'compacted_before'").fetchone()
+        return row[0] if row else ""
+
+    def mark_compacted(self, day):
+        """Record that days before `day` are being moved to Parquet; later writes to them are kept as changes."""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('compacted_before', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)",
+                (day,),
+            )
+
+    def events_before(self, day):
+        return self._connect().execute(
+            f"SELECT {', '.join(self.EVENT_COLUMNS)} FROM events WHERE day < ? ORDER BY id", (day,)
+        ).fetchall()
+
+    def rollups_before(self, day):
+        return self._connect().execute(
+            f"SELECT {', '.join(self.ROLLUP_COLUMNS)} FROM tally WHERE day < ?", (day,)
+        ).fetchall()
+
+    def delete_compacted(self, event_ids, rollups):
+        """Drop exactly what was written to Parquet, in one transaction.
+
+        `rollups` are (user_id, day, energy_servings, nutrient_servings,
+        version) rows as read. A row changed since keeps only the change.
+        """
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM events WHERE id = ?", ((int(i),) for i in event_ids))
+            conn.executemany(
+                "DELETE FROM tally WHERE user_id = ? AND day = ? AND version = ?",
+                [(user_id, day, int(version)) for user_id, day, _, _, version in rollups],
+            )
+            conn.executemany(
+                "UPDATE tally SET energy_servings = energy_servings - ?, nutrient_servings = nutrient_servings - ? "
+                "WHERE user_id = ? AND day = ?",
+                [(float(energy), float(nutrient), user_id, day) for user_id, day, energy, nutrient, _ in rollups],
+            )
+
+    def history(self, user_id, start, end):
+        """[(day, energy_servings, nutrient_servings, version)] for start <= day <= end still in SQLite."""
+        return self._connect().execute(
+            "SELECT day, energy_servings, nutrient_servings, version FROM tally "
+            "WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (user_id, start, end),
+        ).fetchall()
+
+
+class WriteBehindStore(TallyStore):
+    """Queue writes and apply them to `backend` in batches on a background thread.
+
+    Reads see this process's queued ops on top of the backend, so a change
+    shows up at once here and, once written, in every other process.
+    """
+
+    def __init__(self, backend, batch_size=FLUSH_BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue()
+        # ops not yet written, in queue order: the batch being written, then the rest.
+        # The batch is dropped under the lock at the moment it commits, so a read
+        # sees each op either here or in the backend, never both or neither
+        self.lock = threading.Lock()
+        self.in_flight = []
+        self.pending = collections.deque()
+        self.thread = threading.Thread(target=self._run, name="tally-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def load(self, user_id, day):
+        with self.lock:
+            state = self.backend.load(user_id, day)
+            ops = [op for op in self._unwritten() if op.user_id == user_id and op.day == day]
+        for op in ops:
+            state = apply_op(state, op)
+        return state
+
+    def version(self, user_id):
+        with self.lock:
+            return self.backend.version(user_id) + sum(op.user_id == user_id for op in self._unwritten())
+
+    def imported(self, user_id, sources):
+        sources = set(sources)
+        with self.lock:
+            queued = {op.source for op in self._unwritten() if op.user_id == user_id and op.source in sources}
+            return queued | self.backend.imported(user_id, sources)
+
+    def history(self, user_id, start, end):
+        # written first, so history never lags the version (analytics caches on it)
+        self.flush()
+        return self.backend.history(user_id, start, end)
+
+    def meals(self, user_id):
+        return self.backend.meals(user_id)
+
+    def save_meal(self, user_id, name, items, portions):
+        # rare, and the user expects the meal to be there on the next run: written straight through
+        self.backend.save_meal(user_id, name, items, portions)
+
+    def delete_meal(self, user_id, name):
+        self.backend.delete_meal(user_id, name)
+
+    def record(self, op):
+        self.write_batch([op])
+
+    def _unwritten(self):
+        return itertools.chain(self.in_flight, self.pending)
+
+    @contextlib.contextmanager
+    def _landing(self):
+        # held around the backend's commit: no read runs between the commit and dropping the batch
+        with self.lock:
+            yield
+            self.in_flight = []
+
+    def write_batch(self, ops):
+        # queued as one item so the ops are never split across two transactions
+        ops = list(ops)
+        with self.lock:
+            self.pending.extend(ops)
+            self.queue.put(ops)
+
+    def flush(self):
+        """Block until everything queued so far is written."""
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def _run(self):
+        while True:
+            batch, waiters = [], []
+            item = self.queue.get()
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                if isinstance(item, list):
+                    batch.extend(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=self.interval)
+                except queue.Empty:
+                    break
+            if batch:
+                with self.lock:
+                    self.in_flight = [self.pending.popleft() for _ in batch]
+                # written without the lock, so adds and reads go on while the disk works
+                self._write(batch)
+            for w in waiters:
+                w.set()
+
+    def _write(self, batch):
+        # the batch stays in in_flight (and visible to reads) until it is written:
+        # a locked or full disk delays the writes instead of losing them
+        delay = RETRY_DELAY
+        while True:
+            try:
+                self.backend.write_batch(batch, self._landing())
+                return
+            except Exception:
+                logging.exception("writing %d tally ops failed; retrying in %.1fs", len(batch), delay)
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+def open_store(url=None):
+    """Write-behind store for SERVINGTRACKER_STORE ("memory", "sqlite:///path"; default sqlite)."""
+    url = url or os.environ.get("SERVINGTRACKER_STORE", "")
+    if not url:
+        backend = SQLiteStore()
+    elif url == "memory":
+        backend = MemoryStore()
+    elif url.startswith("sqlite:///") and len(url) > len("sqlite:///"):
+        backend = SQLiteStore(url[len("sqlite:///"):])
+    else:
+        raise ValueError(f"SERVINGTRACKER_STORE must be 'memory' or 'sqlite:///path', not {url!r}")
+    return WriteBehindStore(backend)
+
+
+def now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
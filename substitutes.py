@@ -0,0 +1,125 @@
+"""Nutritionally similar, less energy-dense alternatives to a food.
+
+Each food is a vector of log-scaled, standardized nutrients per 100 g, unit
+length, so similarity is a dot product. The neighbour lists — top
+NEIGHBOURS overall and within the food's WWEIA category — are computed once
+(blockwise, at build time) and saved to substitutes.npz. A request is then
+a lookup of one row of that list plus a calorie filter, not a scan.
+
+    python substitutes.py    # (re)build substitutes.npz
+"""
+import functools
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+import servingtable
+
+SUBSTITUTES_FILE = os.path.join(servingtable.DATA_DIR, "substitutes.npz")
+NEIGHBOURS = 50
+BLOCK = 1024
+# the nutrient profile compared between foods (energy itself is left out)
+PROFILE = [
+    "protein_g", "carbohydrate_g", "sugars,_total_g", "fiber,_total_dietary_g", "total_fat_g",
+    "fatty_acids,_total_saturated_g", "sodium_mg", "potassium_mg", "calcium_mg", "iron_mg",
+    "vitamin_a,_rae_mcg_rae", "vitamin_c_mg", "water_g",
+]
+# an alternative must have at most this share of the food's kcal per 100 g
+MAX_KCAL_RATIO = 0.9
+
+
+class Substitute(NamedTuple):
+    food_code: int
+    description: str
+    similarity: float
+    kcal_per_100g: float
+
+
+def profile_vectors(nutrients_df):
+    x = np.log1p(nutrients_df[PROFILE].to_numpy(dtype=float, na_value=0.0).clip(min=0))
+    x = (x - x.mean(axis=0)) / (x.std(axis=0) + 1e-9)
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-9)
+
+
+def _top(scores, k):
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return top.astype(np.int32), np.take_along_axis(scores, top, axis=1).astype(np.float32)
+
+
+def build(nutrients_df, k=NEIGHBOURS):
+    """Neighbour lists for every food; returns the arrays saved in substitutes.npz."""
+    nutrients_df = nutrients_df.drop_duplicates("food_code")
+    x = profile_vectors(nutrients_df)
+    category = nutrients_df["wweia_category_number"].to_numpy()
+    n = len(x)
+    k = min(k, n - 1)
+    neighbours = np.empty((n, k), dtype=np.int32)
+    similarity = np.empty((n, k), dtype=np.float32)
+    cat_neighbours = np.empty((n, k), dtype=np.int32)
+    cat_similarity = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, BLOCK):
+        rows = np.arange(start, min(start + BLOCK, n))
+        scores = x[rows] @ x.T
+        scores[np.arange(len(rows)), rows] = -np.inf  # not your own substitute
+        neighbours[rows], similarity[rows] = _top(scores, k)
+        scores[category[rows][:, None] != category[None, :]] = -np.inf
+        cat_neighbours[rows], cat_similarity[rows] = _top(scores, k)
+    return {
+        "codes": nutrients_df["food_code"].to_numpy(),
+        "descriptions": nutrients_df["main_food_description"].to_numpy(dtype=str),
+        "kcal": nutrients_df["energy_kcal"].to_numpy(dtype=float, na_value=np.nan),
+        "neighbours": neighbours,
+        "similarity": similarity,
+        "cat_neighbours": cat_neighbours,
+        "cat_similarity": cat_similarity,
+    }
+
+
+class SubstituteIndex:
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.row_of = {int(code): i for i, code in enumerate(arrays["codes"])}
+
+    def kcal_per_100g(self, code):
+        row = self.row_of.get(int(code))
+        return float("nan") if row is None else float(self.arrays["kcal"][row])
+
+    def suggest(self, code, k=5, same_category=False):
+        """Up to k similar foods with at most MAX_KCAL_RATIO of this food's kcal per 100 g."""
+        row = self.row_of.get(int(code))
+        a = self.arrays
+        if row is None or not a["kcal"][row] > 0:
+            return []
+        prefix = "cat_" if same_category else ""
+        neighbours = a[prefix + "neighbours"][row]
+        similarity = a[prefix + "similarity"][row]
+        ok = np.isfinite(similarity) & (a["kcal"][neighbours] <= MAX_KCAL_RATIO * a["kcal"][row])
+        return [
+            Substitute(int(a["codes"][i]), str(a["descriptions"][i]), float(s), float(a["kcal"][i]))
+            for i, s in zip(neighbours[ok][:k], similarity[ok][:k])
+        ]
+
+
+@functools.lru_cache(maxsize=1)
+def default_index():
+    """Index from substitutes.npz, building and saving it first if it's missing."""
+    if not os.path.exists(SUBSTITUTES_FILE):
+        save()
+    with np.load(SUBSTITUTES_FILE, allow_pickle=False) as data:
+        return SubstituteIndex({name: data[name] for name in data.files})
+
+
+def save(path=SUBSTITUTES_FILE):
+    _, nutrients_df, _ = servingtable.load_data()
+    arrays = build(nutrients_df)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    save()
+    print(f"Wrote {SUBSTITUTES_FILE}")
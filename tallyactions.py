@@ -0,0 +1,60 @@
+"""Tally changes as widget callbacks, so one click costs one script run.
+
+A button that changed the tally used to do it in the script body and then
+call st.rerun(). That is two runs per click: the click's own run, then a
+full rerun to show the new totals. Here the change happens in the
+button's on_click callback, which Streamlit calls before the run the
+click triggers. The callback then replaces that run with a rerun of only
+the panels that show the tally, plus the panel the click came from so
+its inputs are cleared. The panels are the st.fragment keys in app.py.
+"""
+import datetime
+
+import streamlit as st
+
+TALLY_PANELS = ("tally", "totals", "favorites")
+# search inputs reset after a food is logged
+SEARCH_KEYS = ("food_search", "food_choice", "food_choice_limit", "amt_choice", "other_qty", "other_unit")
+
+
+def rerun_only(*panels):
+    """Callback: rerun just these panels instead of the whole script."""
+    st.rerun(list(panels))
+
+
+class TallyActions:
+    """One session's tally transitions: change the shared log, mirror it into session state."""
+
+    def __init__(self, tally, user_id, origin, state):
+        self.tally = tally
+        self.user_id = user_id
+        self.origin = origin  # session id, tagged on the change's Update
+        self.state = state
+
+    def sync(self):
+        # mirror the shared tally for today into session state (also handles the day rollover)
+        today = datetime.date.today()
+        current = self.tally.current(self.user_id, today.isoformat())
+        self.state["energy_servings"] = current.energy_servings
+        self.state["nutrient_servings"] = current.nutrient_servings
+        self.state["selected_foods"] = self.tally.foods(self.user_id, today.isoformat())
+        self.state["tally_version"] = current.seq
+        self.state["date"] = today
+
+    def add_all(self, entries, panel=None, clear=()):
+        """Log (density, amount, food) entries, clear the `clear` keys and rerun the tally panels.
+
+        Amounts may be negative (clamped at zero); `food` is None for
+        quick adds. The entries are one atomic change. Only call this
+        from a widget callback.
+        """
+        # notifies the user's other sessions once for the whole batch
+        self.tally.increment_many(self.user_id, self.state["date"].isoformat(), entries, origin=self.origin)
+        self.sync()
+        for key in clear:
+            if key in self.state:
+                del self.state[key]
+        rerun_only(*TALLY_PANELS, *([panel] if panel else []))
+
+    def add(self, density, amount, food=None, panel=None, clear=()):
+        self.add_all([(density, amount, food)], panel, clear)
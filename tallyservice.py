@@ -0,0 +1,146 @@
+"""Tally service shared by every session of a server process.
+
+All tally changes for a user go through `TallyService.increment`, which
+applies them one at a time under that user's lock, so two devices logging
+at once both count. The change is queued to the store (whose SQL upsert is
+itself an increment, so several processes sharing one database add up
+correctly).
+
+Tallies are read from the store on every call, never cached here, so a
+change made through another process (another server, importer.py) shows
+up on the next read. The store's per-user version counts every op written
+for the user; it is the `seq` of an Update, and a session that saw an
+older version knows its tally is stale. That is how open sessions learn
+of a change made elsewhere (app.py polls the version): Streamlit has no
+public way to wake another session from a background thread.
+
+`increment_many` applies several changes (a saved meal) as one: other
+sessions see all of them or none, and the store writes them in one
+transaction. Each food logged also updates the user's decayed food counts
+(favorites.py), which back the quick-pick of usual foods. They are kept
+for the last COUNTER_USERS users and reseeded from the store when its
+version shows a change this process didn't make.
+"""
+import collections
+import datetime
+import threading
+from typing import NamedTuple
+
+import favorites
+import meals
+import storage
+
+# users whose food counts are kept; locks are striped so their number stays bounded too
+COUNTER_USERS = 1024
+LOCK_STRIPES = 64
+
+
+class Update(NamedTuple):
+    user_id: str
+    day: str
+    seq: int
+    energy_servings: float
+    nutrient_servings: float
+    origin: str | None = None
+
+
+class TallyService:
+    def __init__(self, store):
+        self.store = store
+        self.user_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.counters_lock = threading.Lock()
+        self.counters = collections.OrderedDict()  # user_id -> (store version, FoodCounters), least recent first
+
+    def _user_lock(self, user_id):
+        return self.user_locks[hash(user_id) % LOCK_STRIPES]
+
+    def version(self, user_id):
+        """The store's change count for the user; differs from an Update's seq once the tally changed."""
+        return self.store.version(user_id)
+
+    def _cached_counters(self, user_id):
+        with self.counters_lock:
+            cached = self.counters.get(user_id)
+            if cached is not None:
+                self.counters.move_to_end(user_id)
+            return cached
+
+    def _cache_counters(self, user_id, version, counters):
+        with self.counters_lock:
+            self.counters[user_id] = (version, counters)
+            self.counters.move_to_end(user_id)
+            while len(self.counters) > COUNTER_USERS:
+                self.counters.popitem(last=False)
+
+    def _counters(self, user_id, day):
+        # caller holds the user's lock; seeded from the last SEED_DAYS of logs when missing or stale
+        version = self.store.version(user_id)
+        cached = self._cached_counters(user_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        counters = favorites.FoodCounters()
+        start = datetime.date.fromisoformat(day) - datetime.timedelta(days=favorites.SEED_DAYS)
+        for i in range(favorites.SEED_DAYS + 1):
+            d = (start + datetime.timedelta(days=i)).isoformat()
+            for food in self.store.load(user_id, d).selected_foods:
+                counters.add(d, food)
+        self._cache_counters(user_id, version, counters)
+        return counters
+
+    def current(self, user_id, day):
+        # version read first: a change in between leaves the Update looking stale, never fresh
+        version = self.store.version(user_id)
+        state = self.store.load(user_id, day)
+        return Update(user_id, day, version, state.energy_servings, state.nutrient_servings)
+
+    def foods(self, user_id, day):
+        return list(self.store.load(user_id, day).selected_foods)
+
+    def frequent_foods(self, user_id, day, k):
+        """The user's k most logged foods lately, each as its last logged entry."""
+        with self._user_lock(user_id):
+            return self._counters(user_id, day).top(k)
+
+    def increment(self, user_id, day, density, amount, food=None, origin=None):
+        """Add `amount` servings (negative to remove, clamped at zero) and return the new tally."""
+        return self.increment_many(user_id, day, [(density, amount, food)], origin)
+
+    def increment_many(self, user_id, day, entries, origin=None, sources=None):
+        """Apply (density, amount, food) entries in order as one change and return the new tally.
+
+        `sources`, one per entry, name where imported entries came from; the
+        store skips an entry whose source the user already has.
+        """
+        logged_at = storage.now()
+        sources = sources or [None] * len(entries)
+        ops = [
+            storage.Op(user_id, day, density, amount, food, logged_at, source)
+            for (density, amount, food), source in zip(entries, sources)
+        ]
+        with self._user_lock(user_id):
+            before = self.store.version(user_id)
+            # queued while holding the lock so the store sees this process's ops for the user in order
+            self.store.write_batch(ops)
+            version = self.store.version(user_id)
+            state = self.store.load(user_id, day)
+            cached = self._cached_counters(user_id)
+            if cached is not None and cached[0] == before and version == before + len(ops):
+                for op in ops:
+                    if op.food is not None:
+                        cached[1].add(day, op.food)
+                self._cache_counters(user_id, version, cached[1])
+        return Update(user_id, day, version, state.energy_servings, state.nutrient_servings, origin)
+
+    # --- saved meals ---
+    def saved_meals(self, user_id):
+        """{name: meals.Meal} of the user's saved meals."""
+        return {
+            name: meals.Meal(name, tuple(tuple(item) for item in items), portions)
+            for name, (items, portions) in self.store.meals(user_id).items()
+        }
+
+    def save_meal(self, user_id, meal):
+        self.store.save_meal(user_id, meal.name, meal.items, meal.portions)
+
+    def delete_meal(self, user_id, name):
+        self.store.delete_meal(user_id, name)
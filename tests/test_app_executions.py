@@ -0,0 +1,94 @@
+"""Each user action in app.py costs one script execution.
+
+Drives the app with streamlit's AppTest. app.py counts its runs in
+st.session_state["runs"]: "script" for the body, and each fragment's key
+for that panel. After one action, no count may have gone up by more than
+one. A button that changed the tally and then called st.rerun() would
+show up as two. The tally change itself is checked too.
+"""
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def servings(at):
+    return at.session_state["energy_servings"], at.session_state["nutrient_servings"]
+
+
+def pick_food(at):
+    at.text_input(key="food_search").input("apple").run()
+    at.selectbox(key="food_choice").select_index(1).run()
+
+
+def log_food(at):
+    pick_food(at)
+    button(at, "Add to tally").click().run()
+
+
+def usual_food(at):
+    return next(b for b in at.button if (b.key or "").startswith("usual_"))
+
+
+def describe_meal(at):
+    at.text_input(key="meal_text").input("2 cups rice and an apple").run()
+
+
+def save_meal(at):
+    for query in ("bread", "peanut butter"):
+        at.text_input(key="recipe_search").input(query).run()
+        at.selectbox(key="recipe_choice").select_index(0).run()
+        button(at, "Add ingredient").click().run()
+    at.text_input(key="recipe_name").input("sandwich").run()
+    button(at, "Save meal").click().run()
+
+
+# (name, setup, action, expected change of (energy, nutrient) servings, or None for any change)
+ACTIONS = [
+    ("quick add energy", None, lambda at: button(at, "⚡ Add Energy").click(), (1, 0)),
+    ("quick add nutrient", None, lambda at: button(at, "🌱 Add Nutrient").click(), (0, 1)),
+    ("quick remove energy", None, lambda at: button(at, "⚡ Remove Energy").click(), (-1, 0)),
+    ("add to tally", pick_food, lambda at: button(at, "Add to tally").click(), None),
+    ("add other amount", pick_food, lambda at: button(at, "Add this amount").click(), None),
+    ("add described meal", describe_meal, lambda at: button(at, "Add meal to tally").click(), None),
+    ("log a usual food", log_food, lambda at: usual_food(at).click(), None),
+    ("log a saved meal", save_meal, lambda at: at.button(key="meal_log_sandwich").click(), None),
+    ("show calories", None, lambda at: at.checkbox(key="show_calories").check(), (0, 0)),
+]
+
+
+@pytest.fixture
+def app(monkeypatch, request):
+    monkeypatch.setenv("SERVINGTRACKER_STORE", "memory")
+    at = AppTest.from_file(APP, default_timeout=120)
+    # the tally service is shared by every AppTest in the process: a user per test
+    at.query_params["user"] = f"executions-{request.node.callspec.id}"
+    at.run()
+    return at
+
+
+@pytest.mark.parametrize("name, setup, action, expected", ACTIONS, ids=[a[0] for a in ACTIONS])
+def test_action_is_one_execution(app, name, setup, action, expected):
+    if setup:
+        setup(app)
+        app.run()  # full render, so every panel's widgets are in the tree
+    # quick remove needs something to remove
+    button(app, "⚡ Add Energy").click().run()
+    app.run()
+    before, runs_before = servings(app), dict(app.session_state["runs"])
+
+    action(app).run()
+
+    assert not app.exception
+    runs = app.session_state["runs"]
+    ran = {part: n - runs_before.get(part, 0) for part, n in runs.items() if n != runs_before.get(part, 0)}
+    assert ran and max(ran.values()) == 1, ran
+    after = servings(app)
+    change = (after[0] - before[0], after[1] - before[1])
+    assert change != (0, 0) if expected is None else change == expected
@@ -0,0 +1,11 @@
+import pandas as pd
+
+import batch
+
+
+def test_non_positive_amounts_are_not_converted():
+    amounts = ["0", "0 cups", "-2 cups", " -1", "2 cups", "1"]
+    out = batch.convert(pd.DataFrame({"food": ["apple"] * len(amounts), "amount": amounts}))
+    assert out["status"].tolist() == ["bad amount"] * 4 + ["ok"] * 2
+    assert out["nutrient_servings"].iloc[:4].isna().all()
+    assert batch.convert(pd.DataFrame({"food": ["no such food xyzzy"], "amount": ["0"]}))["status"][0] == "no match"
@@ -0,0 +1,53 @@
+import datetime
+import os
+
+import pandas as pd
+
+import history
+import storage
+
+TODAY = datetime.date(2026, 10, 19)
+OLD = "2026-01-01"
+
+
+def op(amount, day=OLD, food=None):
+    return storage.Op("u", day, "Energy-dense", amount, food, "2026-01-01T12:00:00")
+
+
+def energy(store, history_dir, day=OLD):
+    days = history.day_history(store, "u", day, day, history_dir)
+    return days["energy_servings"].tolist()
+
+
+def test_compact_moves_old_days(tmp_path):
+    store = storage.SQLiteStore(str(tmp_path / "tally.db"))
+    store.write_batch([op(2.0, food={"code": 1, "name": "x", "grams": 10}), op(1.0, day="2026-10-18")])
+    assert history.compact(store, 7, str(tmp_path), TODAY) == (1, 1)
+    assert store.history("u", OLD, OLD) == []
+    assert energy(store, str(tmp_path)) == [2.0]
+    assert energy(store, str(tmp_path), "2026-10-18") == [1.0]
+
+
+def test_late_write_to_a_compacted_day_adds_to_it(tmp_path):
+    store = storage.SQLiteStore(str(tmp_path / "tally.db"))
+    store.write_batch([op(2.0)])
+    history.compact(store, 7, str(tmp_path), TODAY)
+    store.write_batch([op(1.5)])
+    assert energy(store, str(tmp_path)) == [3.5]
+    history.compact(store, 7, str(tmp_path), TODAY)
+    assert energy(store, str(tmp_path)) == [3.5]
+    store.write_batch([op(-5.0)])
+    assert energy(store, str(tmp_path)) == [0.0]
+
+
+def test_rerun_after_a_crash_duplicates_nothing(tmp_path, monkeypatch):
+    store = storage.SQLiteStore(str(tmp_path / "tally.db"))
+    store.write_batch([op(2.0, food={"code": 1, "name": "x", "grams": 10})])
+    with monkeypatch.context() as m:
+        m.setattr(store, "delete_compacted", lambda *args: None)  # dies after writing Parquet
+        history.compact(store, 7, str(tmp_path), TODAY)
+    assert energy(store, str(tmp_path)) == [2.0]
+    history.compact(store, 7, str(tmp_path), TODAY)
+    assert energy(store, str(tmp_path)) == [2.0]
+    events = pd.read_parquet(os.path.join(str(tmp_path), "events", f"day={OLD}"))
+    assert len(events) == 1
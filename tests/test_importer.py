@@ -0,0 +1,137 @@
+import datetime
+
+import pytest
+
+import analytics
+import engine
+import history
+import importer
+import storage
+import tallyservice
+
+EXPORT = """Date,Food Name,Amount,Unit,Calories
+2026-01-05,Banana,1,medium,105
+2026-01-05,Banana,1,medium,105
+2026-01-05,"Kirkland - Greek Yogurt, Plain (Nonfat)",1,container,120
+2026-01-06,Zzqx unknown thing,1,cup,50
+"""
+LATER = EXPORT + "2026-01-07,Banana,1,medium,105\n"
+
+
+def day_tally(service, day):
+    current = service.current("u", day)
+    return current.energy_servings + current.nutrient_servings
+
+
+@pytest.fixture
+def service(tmp_path):
+    return tallyservice.TallyService(storage.open_store(f"sqlite:///{tmp_path / 'tally.db'}"))
+
+
+def test_import_counts(service, tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text(EXPORT)
+    result = importer.run(str(path), service, "u")
+    assert result == {"rows": 4, "imported": 3, "review": 0, "already_imported": 0, "not_imported": 1}
+    assert len(service.foods("u", "2026-01-05")) == 3  # both bananas count
+
+
+def test_importing_twice_counts_once(service, tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text(EXPORT)
+    importer.run(str(path), service, "u")
+    first = day_tally(service, "2026-01-05")
+
+    assert importer.run(str(path), service, "u")["already_imported"] == 3
+    assert day_tally(service, "2026-01-05") == first
+
+    path.write_text(LATER)  # a later export overlapping the first
+    result = importer.run(str(path), service, "u", chunk_size=2)
+    assert (result["imported"], result["already_imported"]) == (1, 3)
+    assert day_tally(service, "2026-01-05") == first
+    assert len(service.foods("u", "2026-01-05")) == 3
+    assert day_tally(service, "2026-01-07") > 0
+
+
+# export names, and whether the food they match is right; REVIEW_SCORE was tuned on these
+LABELED = [
+    ("Banana", True), ("Kirkland - Greek Yogurt, Plain (Nonfat)", True), ("Protein Bar", False),
+    ("Quest - Protein Bar, Chocolate Chip Cookie Dough", False), ("Egg, whole, boiled", True), ("Eggs", True),
+    ("Chicken Breast, Grilled", True), ("Starbucks - Caffe Latte, Grande 2% Milk", False), ("Coffee, brewed", True),
+    ("White Rice, cooked", True), ("Brown rice", True), ("Whole Wheat Bread", True), ("Peanut Butter, Creamy", True),
+    ("Apple", True), ("Apples, raw, with skin", True), ("Oatmeal, cooked with water", True), ("Orange Juice", True),
+    ("Milk, 2%", True), ("Almonds", True), ("Avocado", True), ("Broccoli, steamed", False),
+    ("Salmon, Atlantic, baked", True), ("Spinach, raw", True), ("Cheddar Cheese", True), ("Pizza, Pepperoni", False),
+    ("Coca-Cola - Coke", True), ("Beer, light", True), ("Red wine", True), ("Hummus", True), ("Tortilla chips", True),
+    ("Trader Joe's - Everything but the Bagel Seasoning", False), ("Clif Bar - Chocolate Chip", False),
+    ("Pasta, cooked", True), ("Spaghetti with meat sauce", True), ("Ice cream, vanilla", True),
+    ("Sweet potato, baked", True), ("Tuna salad", True), ("Caesar salad", True), ("Cheerios", True), ("Granola", True),
+    ("Ground beef, 80% lean", True), ("Turkey sandwich", False), ("Scrambled eggs", True), ("French fries", True),
+    ("Cottage cheese", True), ("Whey protein powder", True), ("Oat milk", False), ("Tofu", False),
+    ("Quinoa, cooked", True), ("Celsius - Energy Drink", True), ("Fairlife - Core Power Protein Shake", True),
+    ("Huel - Black Edition", False), ("Impossible Burger", False), ("Poke bowl", False), ("Acai bowl", False),
+    ("Pad thai", True), ("Burrito bowl, chipotle", False), ("Kind Bar - Dark Chocolate Nuts & Sea Salt", False),
+]
+
+
+def test_confidence_separates_right_and_wrong_matches():
+    matches = importer.match_names([importer.normalize_name(name) for name, _ in LABELED])
+    confidence = {name: score for (name, _), (_, score) in zip(LABELED, matches)}
+    assert all(0 <= score <= 1 for score in confidence.values())
+    assert confidence["Kirkland - Greek Yogurt, Plain (Nonfat)"] == 1
+    assert confidence["Protein Bar"] < importer.REVIEW_SCORE
+    flagged_right = sum((confidence[name] >= importer.REVIEW_SCORE) == right for name, right in LABELED)
+    assert flagged_right >= 0.8 * len(LABELED)
+
+
+def test_import_into_compacted_history(service, tmp_path):
+    history_dir = str(tmp_path / "history")
+    service.increment("u", "2026-01-05", "Nutrient-dense", 2.0)
+    service.store.flush()
+    history.compact(service.store.backend, 7, history_dir, datetime.date(2026, 10, 19))
+
+    def trends():
+        summary = analytics.history_summary(service.store, "u", "2026-01-01", "2026-01-31", 3, "month", history_dir)
+        return summary["avg_energy"].sum() + summary["avg_nutrient"].sum()
+
+    before = trends()
+    assert before == 2.0
+    path = tmp_path / "export.csv"
+    path.write_text(EXPORT)
+    importer.run(str(path), service, "u")
+    after = trends()
+    assert after > before
+
+    history.compact(service.store.backend, 7, history_dir, datetime.date(2026, 10, 19))
+    assert trends() == pytest.approx(after)
+
+
+def test_their_servings_go_by_calories(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text(
+        "Date,Food Name,Amount,Unit,Calories\n"
+        "2026-01-05,Burrito with beef,1,Serving,520\n"
+        "2026-01-05,Apple,1,Each,95\n"
+        "2026-01-05,Apple,1,Each,\n"
+    )
+    chunk = next(importer.read_chunks(str(path)))
+    out = importer.convert(chunk, importer.find_columns(chunk.columns), importer.NameMatcher())
+    kcal = engine.serving_table()["kcal"]
+    burrito, apple, no_calories = out.itertuples(index=False)
+    assert burrito.energy_servings == pytest.approx(520 / kcal[burrito.food_code], abs=0.01)
+    assert burrito.nutrient_servings == 0
+    assert apple.nutrient_servings == pytest.approx(95 / kcal[apple.food_code], abs=0.01)
+    assert apple.nutrient_servings > 1.5
+    assert no_calories.status == "no unit"
+
+
+def test_zero_servings_are_not_imported(service, tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("Date,Food Name,Amount,Unit,Calories\n2026-01-05,Diet cola,1,serving,0\n2026-01-05,Banana,1,medium,105\n")
+    report = tmp_path / "report.csv"
+    for _ in range(2):
+        with open(report, "w", newline="") as f:
+            result = importer.run(str(path), service, "u", report=f)
+        assert (result["not_imported"], result["imported"] + result["already_imported"]) == (1, 1)
+    assert "zero servings" in report.read_text()
+    assert result["already_imported"] == 1
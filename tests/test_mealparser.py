@@ -0,0 +1,44 @@
+import pytest
+
+import mealparser
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return mealparser.default_parser()
+
+
+def one(parser, text):
+    items = parser.parse(text)
+    assert len(items) == 1, items
+    return items[0]
+
+
+@pytest.mark.parametrize("text, description, grams", [
+    ("half a cup of oatmeal", "Oatmeal, multigrain, NS as to fat", 120),
+    ("2 slices bread", "Bread, NS as to major flour", 56),
+    ("a large pizza slice", "Pizza, cheese, from restaurant or fast food, NS as to type of crust", 119),
+    ("a banana", "Banana, raw", 126),
+    ("an egg", "Egg, whole, cooked, NS as to cooking method", 50),
+    ("1 cup of milk", "Milk, NFS", 244),
+])
+def test_phrases(parser, text, description, grams):
+    item = one(parser, text)
+    assert item.description == description
+    assert item.grams == pytest.approx(grams, abs=1)
+
+
+def test_items_split_on_and(parser):
+    items = parser.parse("2 cups rice and an apple")
+    assert [i.description for i in items] == ["Rice, cooked, NFS", "Apple, raw"]
+    assert [i.quantity for i in items] == [2.0, 1.0]
+
+
+def test_one_and_a_half_is_one_item(parser):
+    item = one(parser, "one and a half cups of milk")
+    assert item.quantity == 1.5
+    assert item.unit == "cup"
+
+
+def test_unknown_food_is_left_out(parser):
+    assert parser.parse("qwzzx") == []
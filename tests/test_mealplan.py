@@ -0,0 +1,36 @@
+import pytest
+
+import engine
+import mealplan
+import servingtable
+
+
+def goal(daily_calories):
+    # as in app.py: one serving of each density per pair
+    return round(daily_calories / sum(servingtable.SERVING_KCAL.values()))
+
+
+@pytest.fixture(scope="module")
+def table():
+    return engine.serving_table(servingtable.SERVING_KCAL)
+
+
+@pytest.mark.parametrize("daily_calories", [1000, 10000])
+def test_plan_meets_the_goals_across_the_calorie_range(table, daily_calories):
+    plan, shortfall = mealplan.plan_day(goal(daily_calories), goal(daily_calories), daily_calories, table, seed=1)
+    assert plan.groupby("density")["amt"].sum().to_dict() == {
+        "Energy-dense": goal(daily_calories), "Nutrient-dense": goal(daily_calories),
+    }
+    assert shortfall == {"Energy-dense": 0.0, "Nutrient-dense": 0.0}
+    # servings are sized in kcal, so the plan's calories follow the goals
+    assert plan["kcal"].sum() == pytest.approx(goal(daily_calories) * sum(servingtable.SERVING_KCAL.values()), rel=0.1)
+    assert plan["food_code"].is_unique
+
+
+def test_plan_reports_what_it_could_not_fill(table, monkeypatch):
+    monkeypatch.setattr(mealplan, "MAX_PER_CATEGORY", 1)
+    plan, shortfall = mealplan.plan_day(goal(10000), goal(10000), 10000, table, seed=1)
+    planned = plan.groupby("density")["amt"].sum()
+    assert shortfall["Nutrient-dense"] > 0
+    for density in ("Energy-dense", "Nutrient-dense"):
+        assert planned.get(density, 0) + shortfall[density] == goal(10000)
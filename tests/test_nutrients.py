@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import nutrients
+
+DAY = "2026-10-19"
+APPLE = {"code": 63101000, "name": "Apple, raw", "density": "Nutrient-dense", "amt": 1.0, "grams": 182}
+RICE = {"code": 56205000, "name": "Rice, white, cooked", "density": "Energy-dense", "amt": 1.0, "grams": 100}
+MILK = {"code": 11111000, "name": "Milk, whole", "density": "Nutrient-dense", "amt": 1.0, "grams": 244}
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return nutrients.default_matrix()
+
+
+def test_daily_totals_follow_a_log_written_out_of_order(matrix):
+    daily = nutrients.DailyTotals(matrix)
+    daily.sync(DAY, [APPLE])
+    daily.sync(DAY, [APPLE, MILK])  # this process's entry, not yet written
+    # another process's entry was written first, so it now sits before ours
+    log = [APPLE, RICE, MILK]
+    assert np.allclose(daily.sync(DAY, log), matrix.totals(log))
+    log = log + [APPLE]
+    assert np.allclose(daily.sync(DAY, log), matrix.totals(log))
+    assert np.allclose(daily.sync("2026-10-20", []), 0.0)
@@ -0,0 +1,17 @@
+import pytest
+
+import searchindex
+import servingtable
+
+
+@pytest.fixture(scope="module")
+def index():
+    foods_df, _, _ = servingtable.load_data()
+    return searchindex.FoodIndex(foods_df)
+
+
+@pytest.mark.parametrize("query", ["crepe", "coffee", "apple", "milk"])
+def test_top_k_breaks_ties_at_the_cut_like_the_full_ranking(index, query):
+    ranking = index.search(query, k=len(index.codes))
+    for k in (1, 3, 10):
+        assert index.search(query, k=k) == ranking[:k]
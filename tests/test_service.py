@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+import service
+
+
+def test_classify_rejects_non_integer_codes():
+    for codes in ([1.5], [63101000.0], [True], ["63101000"], [-1]):
+        with pytest.raises(service.BadRequest):
+            service.classify_body({"codes": codes})
+
+
+def test_classify():
+    foods = json.loads(service.classify_body({"codes": [63101000]}))["foods"]
+    assert foods[0]["food_code"] == 63101000
+    assert foods[0]["density"] == "Nutrient-dense"
+
+
+@pytest.mark.parametrize("amount", [0, -1, 0.0, "0", "0 cups", "-2 cups", True, [1]])
+def test_servings_reject_non_positive_amounts(amount):
+    with pytest.raises(service.BadRequest):
+        service.servings_body({"rows": [{"food": "apple", "amount": amount}]})
+
+
+def test_servings_default_to_one():
+    rows = json.loads(service.servings_body({"rows": [{"food": "apple"}, {"food": "apple", "amount": 2}]}))["rows"]
+    assert rows[1]["nutrient_servings"] == pytest.approx(2 * rows[0]["nutrient_servings"])
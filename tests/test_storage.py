@@ -0,0 +1,138 @@
+import contextlib
+import sqlite3
+import threading
+
+import pytest
+
+import storage
+
+DAY = "2026-10-19"
+APPLE = {"code": 63101000, "name": "Apple, raw", "density": "Nutrient-dense", "amt": 1.0, "grams": 182}
+
+
+def op(amount, density="Energy-dense", food=None, user_id="u", day=DAY):
+    return storage.Op(user_id, day, density, amount, food, "2026-10-19T12:00:00")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return storage.MemoryStore()
+    return storage.SQLiteStore(str(tmp_path / "tally.db"))
+
+
+def test_round_trip(store):
+    store.write_batch([op(2.0), op(1.0, "Nutrient-dense", APPLE), op(-0.5)])
+    day = store.load("u", DAY)
+    assert (day.energy_servings, day.nutrient_servings) == (1.5, 1.0)
+    assert [(f["code"], f["grams"]) for f in day.selected_foods] == [(63101000, 182)]
+    assert store.load("u", "2026-10-18") == storage.EMPTY_DAY
+    assert store.version("u") == 3
+    assert store.version("someone else") == 0
+
+
+def test_clamped_at_zero_per_op(store):
+    store.write_batch([op(1.0), op(-3.0), op(0.5)])
+    assert store.load("u", DAY).energy_servings == 0.5
+
+
+def test_meals_round_trip(store):
+    store.save_meal("u", "breakfast", [(63101000, "Apple, raw", 182)], 2)
+    assert store.meals("u") == {"breakfast": ([[63101000, "Apple, raw", 182]], 2)}
+    store.delete_meal("u", "breakfast")
+    assert store.meals("u") == {}
+
+
+def test_old_database_gets_new_columns(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE tally (user_id TEXT NOT NULL, day TEXT NOT NULL, energy_servings REAL NOT NULL DEFAULT 0,
+            nutrient_servings REAL NOT NULL DEFAULT 0, PRIMARY KEY (user_id, day));
+        CREATE TABLE events (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, day TEXT NOT NULL, logged_at TEXT,
+            density TEXT NOT NULL, amount REAL NOT NULL, code INTEGER, name TEXT);
+        INSERT INTO tally VALUES ('u', '2026-10-19', 2, 0);
+    """)
+    conn.commit()
+    conn.close()
+
+    store = storage.SQLiteStore(path)
+    store.write_batch([op(1.0, "Nutrient-dense", APPLE)])
+    day = store.load("u", DAY)
+    assert (day.energy_servings, day.nutrient_servings) == (2.0, 1.0)
+    assert day.selected_foods[0]["grams"] == 182
+
+
+def test_write_behind_keeps_order_and_reads_its_queue(tmp_path):
+    backend = storage.SQLiteStore(str(tmp_path / "tally.db"))
+    store = storage.WriteBehindStore(backend, interval=60)  # nothing is written until flush
+    for amount in (1.0, -2.0, 0.5):  # the clamp depends on the order
+        store.record(op(amount))
+    store.write_batch([op(1.0, "Nutrient-dense", APPLE), op(-1.0, "Nutrient-dense")])
+    assert store.load("u", DAY).energy_servings == 0.5
+    assert store.version("u") == 5
+    store.flush()
+    assert backend.load("u", DAY) == store.load("u", DAY)
+    assert backend.load("u", DAY).energy_servings == 0.5
+    assert backend.version("u") == 5
+
+
+def test_ops_from_one_source_count_once(store):
+    imported = op(1.0)._replace(source="abc-0")
+    store.write_batch([imported, op(1.0)])
+    store.write_batch([imported])
+    assert store.load("u", DAY).energy_servings == 2.0
+    assert store.imported("u", ["abc-0", "abc-1"]) == {"abc-0"}
+    assert store.imported("someone else", ["abc-0"]) == set()
+
+
+def test_write_behind_reads_while_a_batch_is_written(tmp_path):
+    class SlowStore(storage.SQLiteStore):
+        def __init__(self, path):
+            super().__init__(path)
+            self.writing, self.go = threading.Event(), threading.Event()
+
+        def write_batch(self, ops, committing=contextlib.nullcontext()):
+            self.writing.set()
+            self.go.wait(5)
+            super().write_batch(ops, committing)
+
+    backend = SlowStore(str(tmp_path / "tally.db"))
+    store = storage.WriteBehindStore(backend, interval=0.01)
+    store.record(op(1.0))
+    assert backend.writing.wait(5)
+    # the batch is on its way to disk: reads and new writes don't wait for it
+    store.record(op(2.0))
+    assert store.load("u", DAY).energy_servings == 3.0
+    assert store.version("u") == 2
+    backend.go.set()
+    store.flush()
+    assert store.load("u", DAY).energy_servings == 3.0
+    assert (store.version("u"), backend.version("u")) == (2, 2)
+
+
+def test_write_behind_retries_a_failed_batch(tmp_path, monkeypatch):
+    class FlakyStore(storage.SQLiteStore):
+        failures = 2
+
+        def write_batch(self, ops, committing=contextlib.nullcontext()):
+            if self.failures:
+                self.failures -= 1
+                raise sqlite3.OperationalError("database is locked")
+            super().write_batch(ops, committing)
+
+    monkeypatch.setattr(storage, "RETRY_DELAY", 0.01)
+    backend = FlakyStore(str(tmp_path / "tally.db"))
+    store = storage.WriteBehindStore(backend, interval=0.01)
+    store.write_batch([op(1.0), op(1.0, "Nutrient-dense", APPLE)])
+    store.flush()
+    assert backend.failures == 0
+    day = backend.load("u", DAY)
+    assert (day.energy_servings, day.nutrient_servings, backend.version("u")) == (1.0, 1.0, 2)
+    assert store.load("u", DAY) == day
+
+
+@pytest.mark.parametrize("url", ["sqlite://x", "memroy", "sqlite:///"])
+def test_unknown_store_url_is_an_error(url):
+    with pytest.raises(ValueError, match="SERVINGTRACKER_STORE"):
+        storage.open_store(url)
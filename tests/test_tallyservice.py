@@ -0,0 +1,43 @@
+import storage
+import tallyservice
+
+DAY = "2026-10-19"
+RICE = {"code": 56205000, "name": "Rice, white, cooked", "density": "Energy-dense", "amt": 1.0, "grams": 158}
+
+
+def test_two_services_on_one_database(tmp_path):
+    url = f"sqlite:///{tmp_path / 'tally.db'}"
+    a = tallyservice.TallyService(storage.open_store(url))
+    b = tallyservice.TallyService(storage.open_store(url))
+
+    a.increment("u", DAY, "Energy-dense", 1.0, RICE)
+    assert [f["code"] for f in a.frequent_foods("u", DAY, 3)] == [RICE["code"]]
+    a.store.flush()
+    b.increment("u", DAY, "Energy-dense", 2.0)
+    b.store.flush()
+
+    for service in (a, b):
+        current = service.current("u", DAY)
+        assert current.energy_servings == 3.0
+        assert current.seq == service.version("u") == 2
+    a.increment("u", DAY, "Energy-dense", -0.5)
+    assert a.current("u", DAY).energy_servings == 2.5  # its own queued write, before the flush
+    a.store.flush()
+    assert b.current("u", DAY).energy_servings == 2.5
+
+
+def test_counters_reseed_after_a_change_elsewhere(tmp_path):
+    url = f"sqlite:///{tmp_path / 'tally.db'}"
+    a = tallyservice.TallyService(storage.open_store(url))
+    b = tallyservice.TallyService(storage.open_store(url))
+    assert a.frequent_foods("u", DAY, 3) == []
+    b.increment("u", DAY, "Energy-dense", 1.0, RICE)
+    b.store.flush()
+    assert [f["code"] for f in a.frequent_foods("u", DAY, 3)] == [RICE["code"]]
+
+
+def test_increment_many_is_one_update(tmp_path):
+    service = tallyservice.TallyService(storage.MemoryStore())
+    update = service.increment_many("u", DAY, [("Energy-dense", 1.0, RICE), ("Nutrient-dense", 2.0, None)])
+    assert (update.energy_servings, update.nutrient_servings, update.seq) == (1.0, 2.0, 2)
+    assert service.foods("u", DAY) == [RICE]
@@ -0,0 +1,32 @@
+import pytest
+
+import units
+
+OATMEAL = 56203600  # "1 cup, cooked" 240 g next to "1 cup, dry, yields" 485 g
+EGG = 31101010  # "1 egg" 50 g, "1 cup" 245 g
+
+
+@pytest.fixture(scope="module")
+def table():
+    return units.default_units()
+
+
+def test_yield_portions_are_not_densities(table):
+    assert table.grams_per_unit(OATMEAL, "cup") == pytest.approx(240)
+    assert table.grams_per_unit(OATMEAL, "tbsp") == pytest.approx(15, abs=0.1)
+
+
+def test_egg_units(table):
+    assert table.grams_per_unit(EGG, "egg") == pytest.approx(50)
+    assert table.grams_per_unit(EGG, "cup") == pytest.approx(245)
+    assert table.to_grams(EGG, 2, "egg") == pytest.approx(100)
+
+
+def test_mass_units_need_no_portion(table):
+    assert table.grams_per_unit(EGG, "oz") == pytest.approx(28.3495)
+    assert table.convert(EGG, 1, "cup", "g") == pytest.approx(245)
+
+
+def test_regular_slice_is_a_slice(table):
+    # "1 slice, crust not eaten" (13 g) is listed first; "1 medium or regular slice" is 28 g
+    assert table.grams_per_unit(51000100, "slice") == pytest.approx(28)
@@ -0,0 +1,111 @@
+"""Household measure conversions: mass, volume and each food's own portions.
+
+Mass units convert to grams by a constant, volume units to millilitres by a
+constant. A food's density (g per ml) comes from its FNDDS volume portions
+("1 cup" = 236.6 ml weighing 128 g). Any food with one volume portion
+therefore converts from every volume unit. Each food's named portions
+("slice", "medium") add per-food grams per unit. Everything is precomputed
+into one table of grams per (food, unit). A conversion is then a dict lookup
+and a multiply.
+"""
+import functools
+import re
+
+import pandas as pd
+
+import servingtable
+
+GRAMS_PER = {"g": 1.0, "mg": 0.001, "kg": 1000.0, "oz": 28.3495, "lb": 453.592}
+ML_PER = {
+    "cup": 236.588, "tbsp": 14.7868, "tsp": 4.92892, "fl oz": 29.5735,
+    "ml": 1.0, "l": 1000.0, "pint": 473.176, "quart": 946.353,
+}
+# volume portions whose weight isn't of that volume of the food as eaten:
+# "1 cup, dry, yields" weighs what a cup of dry oats cooks into, "1 cup, in shell" includes the shell
+# "1 medium or regular slice" is what "a slice" means when the plain slice is "1 slice, crust not eaten"
+REGULAR_UNIT_RE = re.compile(r"^(?:medium|regular)(?: or (?:medium|regular))? (\w+)$")
+NOT_DENSITY_RE = re.compile(r"\byields?\b|\bdry\b|\bunpopped\b|\b(?:in|with) (?:shell|bone)\b", re.IGNORECASE)
+
+
+def food_densities(portions_df):
+    """g per ml per food code from its volume portions (median; unmodified portions preferred).
+
+    Portions matching NOT_DENSITY_RE are left out; a food with only those has no density.
+    """
+    vol = portions_df[portions_df["unit"].isin(list(ML_PER)) & (portions_df["quantity"] > 0)]
+    vol = vol[~vol["modifier"].astype(str).str.contains(NOT_DENSITY_RE)]
+    ml = vol["quantity"].to_numpy(dtype=float) * vol["unit"].astype(str).map(ML_PER).to_numpy(dtype=float)
+    density = pd.DataFrame({
+        "food_code": vol["food_code"].to_numpy(),
+        "plain": (vol["modifier"].astype(str) == "").to_numpy(),
+        "g_per_ml": vol["portion_weight_g"].to_numpy(dtype=float) / ml,
+    })
+    density = density[density["g_per_ml"] > 0]
+    # a food's unmodified portions ("1 cup") if it has any, else all of them ("1 cup, chopped")
+    has_plain = density.groupby("food_code")["plain"].transform("any")
+    density = density[density["plain"] | ~has_plain]
+    return density.groupby("food_code")["g_per_ml"].median()
+
+
+def named_units(portions_df):
+    """Grams per unit of each food's own named portions ("slice", "medium").
+
+    An unmodified portion ("1 slice") wins, then a medium or regular one
+    ("1 medium or regular slice" is also a "slice"), then the first listed.
+    """
+    named = portions_df[
+        ~portions_df["unit"].isin(list(ML_PER) + list(GRAMS_PER) + [""]) & (portions_df["quantity"] > 0)
+    ]
+    grams = named["portion_weight_g"].to_numpy(dtype=float) / named["quantity"].to_numpy(dtype=float)
+    table = pd.DataFrame({
+        "food_code": named["food_code"].to_numpy(),
+        "unit": named["unit"].astype(str).to_numpy(),
+        "grams": grams,
+        "rank": (named["modifier"].astype(str) != "").to_numpy() * 2,
+    })
+    regular = table["unit"].str.extract(REGULAR_UNIT_RE, expand=False)
+    aliases = table[regular.notna()].assign(unit=regular.dropna(), rank=1)
+    table = pd.concat([table, aliases], ignore_index=True).sort_values("rank", kind="stable")
+    table = table[table["grams"] > 0].drop_duplicates(["food_code", "unit"]).sort_index()
+    return table.drop(columns="rank")
+
+
+class UnitTable:
+    """Grams per (food, unit) for every unit a food can be measured in."""
+
+    def __init__(self, portions_df):
+        self.density = food_densities(portions_df)
+        named = named_units(portions_df)
+        volume = pd.DataFrame(
+            [(code, unit, g_per_ml * ml) for code, g_per_ml in self.density.items() for unit, ml in ML_PER.items()],
+            columns=["food_code", "unit", "grams"],
+        )
+        table = pd.concat([named, volume], ignore_index=True)
+        self.grams_per = dict(zip(zip(table["food_code"].astype(int), table["unit"]), table["grams"]))
+        self.units_of = table.groupby("food_code")["unit"].agg(list).to_dict()
+
+    def grams_per_unit(self, code, unit):
+        """Grams in one `unit` of the food, or None if the food can't be measured that way."""
+        if unit in GRAMS_PER:
+            return GRAMS_PER[unit]
+        return self.grams_per.get((int(code), unit))
+
+    def to_grams(self, code, amount, unit):
+        per = self.grams_per_unit(code, unit)
+        return None if per is None else amount * per
+
+    def convert(self, code, amount, unit, to_unit):
+        """`amount` of `unit` in `to_unit` for one food, or None if either unit doesn't apply."""
+        grams = self.to_grams(code, amount, unit)
+        per = self.grams_per_unit(code, to_unit)
+        return None if grams is None or not per else grams / per
+
+    def units(self, code):
+        """Every unit the food can be measured in: its named units, volume units, then mass."""
+        return self.units_of.get(int(code), []) + list(GRAMS_PER)
+
+
+@functools.lru_cache(maxsize=1)
+def default_units():
+    _, _, portions_df = servingtable.load_data()
+    return UnitTable(portions_df)